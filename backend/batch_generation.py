@@ -0,0 +1,105 @@
+import asyncio
+import json
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from industry_context import normalize_industry
+from tasks import dispatch_more_rows, job_store, row_signatures, scheduler
+
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", 5000))  # prospects accepted in one request
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", 50))  # rows generated ahead of what the client has read
+BATCH_IDLE_TIMEOUT = float(os.getenv("BATCH_IDLE_TIMEOUT", 600))  # give up when no row finishes for this long
+BATCH_POLL_INTERVAL = 0.25  # seconds between row log reads while nothing new has finished
+
+
+def parse_prospects(body, content_type=""):
+    """Prospect dicts from a JSON array or NDJSON (one object per line) body; raises ValueError"""
+    text = body.decode('utf-8')
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        prospects = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        prospects = json.loads(text)
+    if not isinstance(prospects, list) or not all(isinstance(prospect, dict) for prospect in prospects):
+        raise ValueError("body must be an array of prospect objects")
+    return prospects
+
+
+def batch_line(row_index, result):
+    """One NDJSON result line; the caller already has the row data, so it is left out"""
+    line = {"index": row_index}
+    line.update((field, value) for field, value in (result or {}).items() if field not in ("index", "job_id", "row_data"))
+    return json.dumps(line, default=str) + "\n"
+
+
+def finished_rows(job_id, cursor, streamed):
+    """(row index, result) pairs finished since cursor, in completion order, and the next cursor.
+
+    Blocking Redis calls: stream_batch runs this on the threadpool.
+    """
+    row_indices, cursor = job_store.read_row_log(job_id, cursor, by_index=False)
+    new_indices = [index for index in row_indices if index not in streamed]
+    results = {result.get('index'): result for result in job_store.iter_row_results(job_id, new_indices)}
+    finished = [(index, results.get(index)) for index in new_indices]
+    deferred = job_store.deferred_rows(job_id) - streamed - set(new_indices)
+    if deferred:
+        # Parked until the quota resets; batch rows are not resumed, the caller resubmits them
+        reset_at = job_store.quota_reset_at(job_id)
+        finished += [(index, {"status": "deferred", "reset_at": reset_at}) for index in sorted(deferred)]
+    return finished, cursor
+
+
+def stop_batch(job_id):
+    """Cancel a batch job in one Redis round trip (the store and the scheduler share a Redis)"""
+    pipe = job_store.redis.pipeline(transaction=False)
+    job_store.cancel_job(job_id, pipe)  # a no-op once every row is in; otherwise stops the rest
+    scheduler.cancel(job_id, pipe)
+    job_store.clear_deferred(job_id, pipe)
+    job_store.drop_inflight_job(job_id, pipe)
+    pipe.execute()
+
+
+async def stream_batch(prospects, job_id, mode, job_class):
+    """NDJSON lines for a batch job's rows, in the order they finish.
+
+    Rows go through the usual row tasks a window at a time: no more than
+    BATCH_WINDOW rows are dispatched past what the client has read, so a
+    slow reader slows generation instead of piling up results. A client
+    that disconnects cancels the job: undispatched rows are dropped and
+    calls in flight aborted. Redis and broker calls run on the threadpool
+    so open batches never block the event loop, except for stop_batch at
+    the end: it runs on the loop (see finally below), as a single
+    pipelined round trip.
+    """
+    order = list(range(len(prospects)))
+    if mode == "sequence":
+        # Same-industry rows together, as for uploads, so industry analyses are reused
+        order.sort(key=lambda index: normalize_industry(prospects[index].get('industry')))
+    dispatched, cursor, streamed = 0, 0, set()
+    idle_since = time.time()
+    try:
+        while len(streamed) < len(prospects):
+            if dispatched < len(order) and dispatched - len(streamed) < BATCH_WINDOW:
+                window = order[dispatched:len(streamed) + BATCH_WINDOW]
+                signatures = row_signatures([[index, prospects[index]] for index in window], job_id, mode)
+                await run_in_threadpool(dispatch_more_rows, job_id, signatures, job_class)
+                dispatched += len(window)
+
+            finished, cursor = await run_in_threadpool(finished_rows, job_id, cursor, set(streamed))
+
+            if not finished:
+                if time.time() - idle_since > BATCH_IDLE_TIMEOUT:
+                    yield json.dumps({"status": "error", "error": f"no row finished within {BATCH_IDLE_TIMEOUT:.0f}s",
+                                      "pending": len(prospects) - len(streamed)}) + "\n"
+                    return
+                await asyncio.sleep(BATCH_POLL_INTERVAL)
+                continue
+            idle_since = time.time()
+            for row_index, result in finished:
+                streamed.add(row_index)
+                # Awaited by the server until the client has room for it - this is the backpressure
+                yield batch_line(row_index, result)
+    finally:
+        # Called directly: after a disconnect the response's scope is cancelled, so an await here would never run
+        stop_batch(job_id)
@@ -2,11 +2,9 @@
 Debugging utility for Celery chord failures
 """
 import redis
-import json
-import pickle
 import os
-from celery import Celery
 from dotenv import load_dotenv
+from job_store import JobStore
 
 load_dotenv()
 
@@ -24,48 +22,32 @@ def debug_chord_failure(job_id):
     progress = r.get(progress_key)
     print(f"Progress counter: {progress}")
     
-    # 2. Get all task result keys
-    task_keys = r.keys("celery-task-meta-*")
-    print(f"Total Celery task results in Redis: {len(task_keys)}")
-    
-    # 3. Analyze task results
+    # 2. Get this job's task results from its index
     successful_tasks = []
     failed_tasks = []
     malformed_tasks = []
+    job_task_count = 0
     
-    for key in task_keys:
-        try:
-            raw_result = r.get(key)
-            if not raw_result:
-                continue
-            
-            # Try to deserialize
-            try:
-                result_data = pickle.loads(raw_result)
-            except:
-                try:
-                    result_data = json.loads(raw_result.decode('utf-8'))
-                except:
-                    malformed_tasks.append(key.decode('utf-8'))
-                    continue
+    for task_id, result_data in JobStore(r).iter_task_results(job_id):
+        job_task_count += 1
+        if result_data is None:
+            malformed_tasks.append(task_id)
+            continue
+        
+        # 3. Check if this is an email task result
+        if isinstance(result_data, dict) and 'result' in result_data:
+            result = result_data['result']
             
-            # Check if this is an email task result
-            if isinstance(result_data, dict) and 'result' in result_data:
-                result = result_data['result']
-                task_id = key.decode('utf-8').replace('celery-task-meta-', '')
-                
-                if isinstance(result, dict):
-                    if 'row_data' in result or 'email' in result or 'initial_email' in result:
-                        if result.get('status') == 'success':
-                            successful_tasks.append((task_id, result))
-                        else:
-                            failed_tasks.append((task_id, result))
-                else:
-                    malformed_tasks.append((task_id, result))
-                        
-        except Exception as e:
-            print(f"Error processing key {key}: {e}")
+            if isinstance(result, dict):
+                if 'row_data' in result or 'email' in result or 'initial_email' in result:
+                    if result.get('status') == 'success':
+                        successful_tasks.append((task_id, result))
+                    else:
+                        failed_tasks.append((task_id, result))
+            else:
+                malformed_tasks.append((task_id, result))
     
+    print(f"Celery task results for this job: {job_task_count}")
     print(f"✅ Successful tasks: {len(successful_tasks)}")
     print(f"❌ Failed tasks: {len(failed_tasks)}")
     print(f"🔧 Malformed tasks: {len(malformed_tasks)}")
@@ -101,7 +83,7 @@ def debug_chord_failure(job_id):
                 print(f"  Result type: {type(result)}")
                 print(f"  Result: {str(result)[:100]}...")
             else:
-                print(f"Key: {item}")
+                print(f"Task ID: {item}")
             print()
     
     # 6. Recovery suggestions
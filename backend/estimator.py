@@ -0,0 +1,181 @@
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from industry_context import normalize_industry
+from prompt_builder import messages_tokens
+from prompt_templates import PROMPT_VERSION, render
+
+# USD per 1M tokens as (input, output); MODEL_PRICES="gpt-3.5-turbo=0.5/1.5,..." overrides or adds models
+DEFAULT_MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-3.5-turbo-0125": (0.5, 1.5),
+    "gpt-3.5-turbo-1106": (1.0, 2.0),
+    "gpt-3.5-turbo-16k": (3.0, 4.0),
+}
+MODEL_PRICES = {
+    **DEFAULT_MODEL_PRICES,
+    **{
+        model.strip(): tuple(float(price) for price in prices.split('/', 1))
+        for model, _, prices in (item.partition('=') for item in os.getenv("MODEL_PRICES", "").split(',') if item.strip())
+    },
+}
+ESTIMATE_SAMPLE_ROWS = int(os.getenv("ESTIMATE_SAMPLE_ROWS", 200))  # rows whose prompts are actually built
+DEFAULT_LATENCY = float(os.getenv("ESTIMATE_DEFAULT_LATENCY", 3))  # seconds per call until a model has samples
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", 0))  # requests per minute per model, 0 = not limited
+OPENAI_RPD_LIMIT = int(os.getenv("OPENAI_RPD_LIMIT", 0))  # requests per day per model, 0 = unknown
+MIN_CALL_INTERVAL = 0.2  # rate_limited_api_call allows 5 requests per second per worker process
+# Typical completion length per call (tokens); max_tokens is only the ceiling
+OUTPUT_TOKENS = {"email": 110, "followup_1": 140, "followup_2": 120, "industry_analysis": 200}
+PLACEHOLDER_CONTEXT = "word " * int(OUTPUT_TOKENS["industry_analysis"] * 0.75)  # stands in for a cached analysis
+
+
+def sample_rows(df, size=ESTIMATE_SAMPLE_ROWS):
+    """Up to size rows spread evenly over the file, as dicts"""
+    step = max(len(df) // size, 1)
+    return [row.to_dict() for _, row in df.iloc[::step].head(size).iterrows()]
+
+
+def next_quota_reset():
+    tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc).timestamp()
+
+
+def estimate_usage(df, mode, builder, pack_size=5, industry_context=True):
+    """API calls and prompt/completion tokens a job over df would use, from a sample of its rows"""
+    rows = sample_rows(df)
+    total_rows = len(df)
+    if not rows:
+        return {"api_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "sampled_rows": 0}
+
+    if mode == "packed":
+        pack_tokens = []
+        for i in range(0, len(rows), pack_size):
+            pack = rows[i:i + pack_size]
+            prospects = '\n\n'.join(f"Prospect {number}:\n" + builder.prospect_info(row) for number, row in enumerate(pack))
+            pack_tokens.append(messages_tokens(render("cold_email_packed", count=len(pack), prospects=prospects)) / len(pack))
+        api_calls = math.ceil(total_rows / pack_size)
+        prompt_tokens = total_rows * sum(pack_tokens) / len(pack_tokens)
+        completion_tokens = total_rows * OUTPUT_TOKENS["email"]
+    elif mode == "sequence":
+        row_tokens = []
+        for row in rows:
+            first_name = builder.value(row, 'first_name', 'name', default='there')
+            company_name = builder.value(row, 'organization_name', 'company', default='your company')
+            industry = builder.value(row, 'industry', default='your industry')
+            if industry_context:
+                followup_1 = render("followup_1_context", first_name=first_name, company_name=company_name,
+                                    industry=industry, industry_context=PLACEHOLDER_CONTEXT)
+            else:
+                followup_1 = render("followup_1", first_name=first_name, company_name=company_name, industry=industry)
+            row_tokens.append(
+                messages_tokens(render("cold_email", prospect_info=builder.prospect_info(row), first_name=first_name))
+                + messages_tokens(followup_1)
+                + messages_tokens(render("followup_2", first_name=first_name, company_name=company_name))
+            )
+        api_calls = total_rows * 3
+        prompt_tokens = total_rows * sum(row_tokens) / len(row_tokens)
+        completion_tokens = total_rows * (OUTPUT_TOKENS["email"] + OUTPUT_TOKENS["followup_1"] + OUTPUT_TOKENS["followup_2"])
+        if industry_context:
+            # One analysis per distinct industry in the whole file
+            industries = df['industry'].map(normalize_industry).nunique() if 'industry' in df.columns else 1
+            api_calls += industries
+            prompt_tokens += industries * messages_tokens(render("industry_analysis", industry="general"))
+            completion_tokens += industries * OUTPUT_TOKENS["industry_analysis"]
+    else:
+        row_tokens = [
+            messages_tokens(render(
+                "cold_email",
+                prospect_info=builder.prospect_info(row),
+                first_name=builder.value(row, 'first_name', 'name', default='there'),
+            ))
+            for row in rows
+        ]
+        api_calls = total_rows
+        prompt_tokens = total_rows * sum(row_tokens) / len(row_tokens)
+        completion_tokens = total_rows * OUTPUT_TOKENS["email"]
+
+    return {
+        "api_calls": api_calls,
+        "prompt_tokens": round(prompt_tokens),
+        "completion_tokens": round(completion_tokens),
+        "sampled_rows": len(rows),
+    }
+
+
+class JobEstimator:
+    """Pre-flight cost and wall-clock estimate for a job, without generating anything.
+
+    Rows are spread over the worker models, so cost uses their average price.
+    Throughput comes from the worker slots and the models' observed call
+    latency (see LLMClient), capped by OPENAI_RPM_LIMIT. Work already queued
+    counts as one call per queued task.
+    """
+
+    def __init__(self, llm, models, quota_breaker=None):
+        self.llm = llm
+        self.models = models
+        self.quota_breaker = quota_breaker
+
+    def estimate(self, usage, worker_slots, queued_tasks=0, inflight_rows=0):
+        now = time.time()
+        estimate = dict(usage)
+
+        prices = [MODEL_PRICES[model] for model in self.models if model in MODEL_PRICES]
+        if prices:
+            input_price = sum(price[0] for price in prices) / len(prices)
+            output_price = sum(price[1] for price in prices) / len(prices)
+            estimate["cost_usd"] = round((usage["prompt_tokens"] * input_price + usage["completion_tokens"] * output_price) / 1e6, 4)
+        else:
+            estimate["cost_usd"] = None
+
+        # Pooled median latency of the worker models
+        samples = sorted(sample for model in self.models for sample in self.llm.recent_latencies(model))
+        latency = samples[len(samples) // 2] if samples else DEFAULT_LATENCY
+        calls_per_second = worker_slots / max(latency, MIN_CALL_INTERVAL) if worker_slots else 0
+        if OPENAI_RPM_LIMIT:
+            calls_per_second = min(calls_per_second, OPENAI_RPM_LIMIT * len(self.models) / 60)
+        estimate["throughput"] = {
+            "worker_slots": worker_slots,
+            "latency_seconds": round(latency, 2),
+            "latency_observed": bool(samples),
+            "calls_per_minute": round(calls_per_second * 60, 1),
+        }
+
+        # Quota: breakers already open delay the start; a known daily limit caps today's calls
+        open_breakers, reset_times = {}, {}
+        if self.quota_breaker:
+            for model in self.models:
+                reset_at = self.quota_breaker.open_until(model)
+                if reset_at:
+                    reset_times[model] = reset_at
+                    open_breakers[model] = datetime.fromtimestamp(reset_at).isoformat()
+        quota = {"open_breakers": open_breakers, "daily_limit_per_model": OPENAI_RPD_LIMIT or None,
+                 "remaining_calls_today": None, "fits_before_reset": None,
+                 "reset_at": datetime.fromtimestamp(next_quota_reset()).isoformat()}
+        if OPENAI_RPD_LIMIT:
+            stats = self.llm.get_stats(self.models)
+            remaining = sum(max(OPENAI_RPD_LIMIT - stats[model]["calls"], 0) for model in self.models if model not in open_breakers)
+            quota["remaining_calls_today"] = remaining
+            quota["fits_before_reset"] = usage["api_calls"] + queued_tasks + inflight_rows <= remaining
+        estimate["quota"] = quota
+
+        if not calls_per_second:
+            # No workers answering - no way to tell when the job would run
+            estimate.update({"queue": {"queued_tasks": queued_tasks, "inflight_rows": inflight_rows, "wait_seconds": None},
+                             "eta_seconds": None, "finishes_at": None})
+        else:
+            start_delay = 0
+            if open_breakers and len(open_breakers) == len(self.models):
+                # The times read above: a breaker may have closed since, and open_until would return None
+                start_delay = max(reset_times.values()) - now
+            queue_wait = (queued_tasks + inflight_rows) / calls_per_second
+            eta = max(start_delay, 0) + queue_wait + usage["api_calls"] / calls_per_second
+            estimate.update({
+                "queue": {"queued_tasks": queued_tasks, "inflight_rows": inflight_rows, "wait_seconds": round(queue_wait)},
+                "eta_seconds": round(eta),
+                "finishes_at": datetime.fromtimestamp(now + eta).isoformat(),
+            })
+        estimate["prompt_version"] = PROMPT_VERSION
+        return estimate
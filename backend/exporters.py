@@ -0,0 +1,295 @@
+"""
+Streamed result exports built on the per-job JSONL row store
+(uploads/result_{job_id}.jsonl written by result_writer.write_result_file).
+"""
+import csv
+import io
+import json
+import os
+import uuid
+import zipfile
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+ROW_BATCH = 1000
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+COMPRESSIONS = {
+    "gzip": ("gz", "application/gzip"),
+    "zstd": ("zst", "application/zstd"),
+}
+
+
+def negotiate_format(requested, accept_header):
+    """Pick an export format from ?format= or, failing that, the Accept header.
+
+    Returns None when neither asks for anything specific.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in FORMATS:
+            raise ValueError(f"Unsupported format '{requested}'. Use one of: {', '.join(FORMATS)}")
+        return requested
+
+    for part in (accept_header or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        for name, format_media_type in FORMATS.items():
+            if media_type == format_media_type:
+                return name
+    return None
+
+
+def validate_compression(compression):
+    if compression and compression.lower() not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression '{compression}'. Use one of: {', '.join(COMPRESSIONS)}")
+    return compression.lower() if compression else None
+
+
+def check_dependencies(fmt, compression=None):
+    """Fail fast (before any bytes are sent) when an optional package is missing"""
+    try:
+        if fmt == "parquet":
+            import pyarrow.parquet  # noqa: F401
+        if compression == "zstd":
+            import zstandard  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"{fmt}/{compression or 'uncompressed'} export is not available: {e}")
+
+
+def export_filename(job_id, fmt, compression=None):
+    filename = f"result_{job_id}.{fmt}"
+    if compression:
+        filename += f".{COMPRESSIONS[compression][0]}"
+    return filename
+
+
+def export_media_type(fmt, compression=None):
+    return COMPRESSIONS[compression][1] if compression else FORMATS[fmt]
+
+
+def parse_range(range_header, size):
+    """Parse a single 'bytes=' range. Returns None (no range), (start, end) or raises ValueError."""
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("Only single byte ranges are supported")
+    start_text, _, end_text = spec.strip().partition("-")
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    else:
+        suffix = int(end_text)
+        start, end = max(size - suffix, 0), size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def iter_file(path, start=0, end=None):
+    """Yield a file's bytes from start to end (inclusive) in chunks"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def iter_jsonl_rows(jsonl_file):
+    with open(jsonl_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _jsonl_columns(jsonl_file):
+    for row in iter_jsonl_rows(jsonl_file):
+        return list(row)
+    return []
+
+
+def stream_csv(jsonl_file):
+    columns = _jsonl_columns(jsonl_file)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(iter_jsonl_rows(jsonl_file), 1):
+        writer.writerow(['' if row.get(column) is None else row.get(column) for column in columns])
+        if count % ROW_BATCH == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ByteSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _column_kinds(jsonl_file, columns):
+    """'bool', 'int', 'float' or 'string' per column: the narrowest kind that holds every non-null value"""
+    seen = {column: set() for column in columns}
+    for row in iter_jsonl_rows(jsonl_file):
+        for column in columns:
+            value = row.get(column)
+            if value is not None:
+                seen[column].add(type(value))
+    kinds = {}
+    for column, types in seen.items():
+        if types == {bool}:
+            kinds[column] = "bool"
+        elif types and types <= {int}:
+            kinds[column] = "int"
+        elif types and types <= {int, float}:
+            kinds[column] = "float"
+        else:
+            kinds[column] = "string"  # text, mixed or all-null columns
+    return kinds
+
+
+def _parquet_value(value, kind):
+    if value is None:
+        return None
+    if kind == "float":
+        return float(value)
+    if kind == "string":
+        return str(value)
+    return value
+
+
+def stream_parquet(jsonl_file):
+    """One Parquet row group per ROW_BATCH rows, columns typed from a first pass over the row store"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    columns = _jsonl_columns(jsonl_file)
+    kinds = _column_kinds(jsonl_file, columns)
+    arrow_types = {"bool": pa.bool_(), "int": pa.int64(), "float": pa.float64(), "string": pa.string()}
+    schema = pa.schema([(column, arrow_types[kinds[column]]) for column in columns])
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write_batch(batch):
+        writer.write_table(pa.Table.from_pydict(
+            {column: [_parquet_value(row.get(column), kinds[column]) for row in batch] for column in columns},
+            schema=schema,
+        ))
+
+    batch = []
+    for row in iter_jsonl_rows(jsonl_file):
+        batch.append(row)
+        if len(batch) >= ROW_BATCH:
+            write_batch(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_batch(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def stream_zip(paths):
+    """Zip files on the fly (stored, not deflated - xlsx is already compressed)"""
+    sink = _ByteSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for path in paths:
+            with archive.open(zipfile.ZipInfo.from_file(path, os.path.basename(path)), "w", force_zip64=True) as entry:
+                for chunk in iter_file(path):
+                    entry.write(chunk)
+                    yield sink.drain()
+        yield sink.drain()
+    yield sink.drain()
+
+
+def build_xlsx(jsonl_file, excel_file):
+    from result_writer import ResultWriter
+
+    with ResultWriter(excel_file, _jsonl_columns(jsonl_file)) as writer:
+        for row in iter_jsonl_rows(jsonl_file):
+            writer.write_row(row)
+    return excel_file
+
+
+def compress_stream(chunks, compression):
+    """gzip (deterministic header) or zstd compression over a byte stream"""
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires zstandard (pip install zstandard)")
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(jsonl_file, fmt, compression=None):
+    """Bytes of the requested format generated straight from the row store"""
+    if fmt == "jsonl":
+        chunks = iter_file(jsonl_file)
+    elif fmt == "csv":
+        chunks = stream_csv(jsonl_file)
+    elif fmt == "parquet":
+        chunks = stream_parquet(jsonl_file)
+    else:
+        raise ValueError(f"{fmt} is not a streamable format")
+    return compress_stream(chunks, compression)
+
+
+def tee_to_file(chunks, path):
+    """Pass chunks through while caching them at path; an interrupted stream leaves no cache"""
+    part_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(part_path, "wb") as f:
+        try:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        except BaseException:
+            f.close()
+            os.remove(part_path)
+            raise
+    os.replace(part_path, path)
@@ -0,0 +1,83 @@
+import heapq
+import json
+import os
+import shutil
+import tempfile
+
+COMBINE_RUN_SIZE = int(os.getenv("COMBINE_RUN_SIZE", 5000))  # results held in memory at once
+
+
+def _result_index(result):
+    return result.get('index', 0)
+
+
+class SortedRuns:
+    """External sort for row results.
+
+    Results are buffered up to run_size, sorted by index and spilled to disk
+    as a run; iterating k-way merges the runs back in index order. Peak
+    memory is one run plus one result per run, whatever the job size.
+    """
+
+    def __init__(self, run_size=COMBINE_RUN_SIZE, spill_dir="uploads"):
+        self.run_size = run_size
+        self.spill_dir = tempfile.mkdtemp(prefix="combine_", dir=spill_dir)
+        self.run_files = []
+        self.buffer = []
+        self.count = 0
+
+    def add(self, result):
+        self.buffer.append(result)
+        self.count += 1
+        if len(self.buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        if not self.buffer:
+            return
+        self.buffer.sort(key=_result_index)
+        run_file = os.path.join(self.spill_dir, f"run_{len(self.run_files):05d}.jsonl")
+        with open(run_file, "w", encoding="utf-8") as f:
+            for result in self.buffer:
+                f.write(json.dumps(result, default=str))
+                f.write("\n")
+        self.run_files.append(run_file)
+        self.buffer = []
+
+    def __len__(self):
+        """Results added, repeated indices included"""
+        return self.count
+
+    def __iter__(self):
+        """Merged results in index order, one per index; can be iterated more than once.
+
+        The row store is read with HSCAN, which may return a row twice, possibly
+        rewritten in between (e.g. by a hedge): of equal indices, now adjacent,
+        the first success is kept, else the first result.
+        """
+        self._spill()
+        files = [open(run_file, "r", encoding="utf-8") for run_file in self.run_files]
+        try:
+            previous = None
+            for result in heapq.merge(*((json.loads(line) for line in f) for f in files), key=_result_index):
+                if previous is not None and _result_index(result) == _result_index(previous):
+                    if previous.get('status') != 'success' and result.get('status') == 'success':
+                        previous = result
+                    continue
+                if previous is not None:
+                    yield previous
+                previous = result
+            if previous is not None:
+                yield previous
+        finally:
+            for f in files:
+                f.close()
+
+    def cleanup(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
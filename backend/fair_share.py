@@ -0,0 +1,186 @@
+import os
+
+from celery import signature
+from kombu.utils.json import dumps, loads
+
+from job_store import JOB_STATE_TTL
+
+FAIR_SHARE_JOBS_KEY = "fair_share_jobs"
+FEED_LOCK_KEY = "fair_share_feed_lock"
+FEED_REQUESTED_KEY = "fair_share_feed_requested"
+FEED_LOCK_TTL = 10  # seconds; a feeder that dies holding the lock blocks others this long at most
+
+
+def class_settings(setting):
+    """'interactive=8,bulk=1' -> {'interactive': 8, 'bulk': 1}"""
+    return {
+        name.strip(): int(value)
+        for name, _, value in (item.partition('=') for item in os.getenv(setting, "").split(',') if item.strip())
+    }
+
+
+# Job classes, each with its own queue. A class's weight sets its share of the capacity;
+# its cap limits how many row tasks of any one of its jobs run at once while another class is waiting
+JOB_CLASS_WEIGHTS = {"interactive": 4, "standard": 2, "bulk": 1, **class_settings("JOB_CLASS_WEIGHTS")}
+JOB_CLASS_CAPS = {"interactive": 8, "standard": 8, "bulk": 8, **class_settings("JOB_CLASS_CAPS")}
+JOB_CLASS_QUEUES = {job_class: f"rows_{job_class}" for job_class in JOB_CLASS_WEIGHTS}
+INTERACTIVE_MAX_ROWS = int(os.getenv("INTERACTIVE_MAX_ROWS", 100))  # jobs up to this size are interactive
+BULK_MIN_ROWS = int(os.getenv("BULK_MIN_ROWS", 5000))  # jobs from this size on are bulk
+
+
+def job_class_for(total_rows, requested=None):
+    """The class a job runs in: the one asked for at upload if valid, else by its size"""
+    if requested in JOB_CLASS_QUEUES:
+        return requested
+    if total_rows <= INTERACTIVE_MAX_ROWS:
+        return "interactive"
+    if total_rows >= BULK_MIN_ROWS:
+        return "bulk"
+    return "standard"
+
+
+def job_limit(job, contended):
+    """How many row tasks of a job may run at once: its max_concurrency, and its class cap when contended"""
+    limits = [job.get("max_concurrency"), job["cap"] if contended else None]
+    return min((limit for limit in limits if limit), default=float('inf'))
+
+
+class FairShareScheduler:
+    """Weighted fair-share dispatch of row tasks across the jobs running at once.
+
+    A job's row task signatures wait in a Redis backlog instead of the
+    broker. feed() keeps at most `capacity` row tasks queued or running in
+    total, giving each free slot to the job with the fewest running tasks
+    per unit of weight, never past the job's max_concurrency, nor its
+    class's cap while jobs of another class are waiting. Tasks go to their
+    class's queue. Once a job's backlog is empty and its last task has
+    finished, release() hands back the job's callback (what its chord used
+    to run), if it has one.
+
+    capacity is a number of tasks, or a function returning it (called on
+    every feed, so it can follow the workers that are running).
+    """
+
+    def __init__(self, redis_client, capacity):
+        self.redis = redis_client
+        self.capacity = capacity
+
+    def current_capacity(self):
+        return self.capacity() if callable(self.capacity) else self.capacity
+
+    def submit(self, job_id, signatures, callback, job_class, max_concurrency=None, append=False):
+        """Queue a job's row tasks; they are dispatched by feed().
+
+        With append, the tasks join the job's backlog instead of replacing it,
+        for jobs that send their rows a window at a time.
+        """
+        backlog_key = f"job_backlog_{job_id}"
+        pipe = self.redis.pipeline()
+        if not append:
+            pipe.delete(backlog_key)
+            pipe.set(f"job_running_{job_id}", 0, ex=JOB_STATE_TTL)
+        for i in range(0, len(signatures), 1000):
+            pipe.rpush(backlog_key, *(dumps(dict(task)) for task in signatures[i:i + 1000]))
+        pipe.expire(backlog_key, JOB_STATE_TTL)
+        pipe.hset(FAIR_SHARE_JOBS_KEY, job_id, dumps({
+            "job_class": job_class,
+            "queue": JOB_CLASS_QUEUES[job_class],
+            "weight": JOB_CLASS_WEIGHTS[job_class],
+            "cap": JOB_CLASS_CAPS[job_class],
+            "max_concurrency": int(max_concurrency) if max_concurrency else None,
+            "callback": dict(callback) if callback else None,
+        }))
+        pipe.execute()
+
+    def release(self, job_id):
+        """A job's row task finished; returns the job's callback if that was its last one"""
+        running = self.redis.decr(f"job_running_{job_id}")
+        if running < 0:
+            # A redelivered task finishing twice; never count below zero
+            self.redis.set(f"job_running_{job_id}", 0, ex=JOB_STATE_TTL)
+            running = 0
+        if running or self.redis.llen(f"job_backlog_{job_id}"):
+            return None
+        job = self.redis.hget(FAIR_SHARE_JOBS_KEY, job_id)
+        # hdel succeeds for exactly one caller, so the callback is sent once
+        if job is None or not self.redis.hdel(FAIR_SHARE_JOBS_KEY, job_id):
+            return None
+        self.redis.delete(f"job_running_{job_id}")
+        return loads(job)["callback"]
+
+    def cancel(self, job_id, pipe=None):
+        """Forget a job: its backlog is dropped and its callback never sent.
+
+        Queued on pipe instead when one is given (it must be on this scheduler's Redis).
+        """
+        commands = pipe or self.redis.pipeline(transaction=False)
+        commands.hdel(FAIR_SHARE_JOBS_KEY, job_id)
+        commands.delete(f"job_backlog_{job_id}", f"job_running_{job_id}")
+        if pipe is None:
+            commands.execute()
+
+    def feed(self):
+        """Dispatch row tasks into the free capacity; returns how many were sent.
+
+        If another process is feeding, it is asked to go round once more, so
+        a slot freed while it works from an older count is still filled.
+        """
+        sent = 0
+        while True:
+            if not self.redis.set(FEED_LOCK_KEY, 1, nx=True, ex=FEED_LOCK_TTL):
+                self.redis.set(FEED_REQUESTED_KEY, 1, ex=FEED_LOCK_TTL)
+                if self.redis.exists(FEED_LOCK_KEY):
+                    return sent  # the holder sees the request once it is done
+                continue  # released in between; it may have missed the request
+            try:
+                self.redis.delete(FEED_REQUESTED_KEY)
+                sent += self._dispatch()
+            finally:
+                self.redis.delete(FEED_LOCK_KEY)
+            if not self.redis.exists(FEED_REQUESTED_KEY):
+                return sent
+
+    def _dispatch(self):
+        """One feeding pass, under the feed lock"""
+        jobs = {job_id.decode('utf-8'): loads(job) for job_id, job in self.redis.hgetall(FAIR_SHARE_JOBS_KEY).items()}
+        if not jobs:
+            return 0
+        running = dict(zip(jobs, (int(count or 0) for count in self.redis.mget([f"job_running_{job_id}" for job_id in jobs]))))
+        free = self.current_capacity() - sum(running.values())
+        sent = 0
+        waiting = {job_id for job_id in jobs if self.redis.llen(f"job_backlog_{job_id}")}
+        while free > 0:
+            # Class caps only hold a class back while another class has rows waiting
+            contended = len({jobs[job_id]["job_class"] for job_id in waiting}) > 1
+            candidates = [job_id for job_id in waiting if running[job_id] < job_limit(jobs[job_id], contended)]
+            if not candidates:
+                break
+            job_id = min(candidates, key=lambda job_id: (running[job_id] + 1) / jobs[job_id]["weight"])
+            # Count the task as running before taking it, so release() never sees an empty backlog
+            # and no running tasks while it is in between
+            self.redis.incr(f"job_running_{job_id}")
+            task = self.redis.lpop(f"job_backlog_{job_id}")
+            if task is None:
+                self.redis.decr(f"job_running_{job_id}")
+                waiting.discard(job_id)
+                continue
+            signature(loads(task)).apply_async(queue=jobs[job_id]["queue"])
+            running[job_id] += 1
+            free -= 1
+            sent += 1
+        return sent
+
+    def snapshot(self):
+        """Active jobs with their class, cap, running tasks and backlog"""
+        jobs = {}
+        for job_id, job in self.redis.hgetall(FAIR_SHARE_JOBS_KEY).items():
+            job_id, job = job_id.decode('utf-8'), loads(job)
+            jobs[job_id] = {
+                "job_class": job["job_class"],
+                "weight": job["weight"],
+                "cap": job["cap"],
+                "max_concurrency": job.get("max_concurrency"),
+                "running": int(self.redis.get(f"job_running_{job_id}") or 0),
+                "backlog": self.redis.llen(f"job_backlog_{job_id}"),
+            }
+        return {"capacity": self.current_capacity(), "jobs": jobs}
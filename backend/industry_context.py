@@ -0,0 +1,101 @@
+import os
+import re
+import time
+import uuid
+
+from redis.exceptions import WatchError
+
+from job_store import JOB_STATE_TTL
+from prompt_templates import render
+
+SHARED_INDUSTRY_CACHE = os.getenv("INDUSTRY_CACHE_SHARED", "false").lower() == "true"
+SHARED_INDUSTRY_TTL = int(os.getenv("INDUSTRY_CACHE_TTL", 7 * 86400))
+LOCK_TTL = 60  # seconds one worker may spend generating a block before others stop waiting
+LOCK_WAIT = 20  # seconds other workers wait for that block before generating their own
+
+
+def normalize_industry(industry):
+    """Cache key for an industry: lower case, punctuation and extra spaces removed"""
+    if industry is None or industry != industry:  # missing / NaN cells
+        industry = ""
+    normalized = re.sub(r"[^a-z0-9&]+", " ", str(industry).lower()).strip()
+    return normalized or "general"
+
+
+class IndustryContextCache:
+    """Industry analysis blocks for follow-up 1, generated once per normalized industry.
+
+    Blocks are cached per job and, with INDUSTRY_CACHE_SHARED=true, across
+    jobs. A short Redis lock stops workers that hit the same new industry at
+    the same time from all generating it.
+    """
+
+    def __init__(self, redis_client, llm):
+        self.redis = redis_client
+        self.llm = llm
+
+    def get(self, job_id, industry, model):
+        """The analysis block for industry, generating it on a cache miss"""
+        key = normalize_industry(industry)
+        job_key = f"job_industry_{job_id}"
+        shared_key = f"industry_context:{key}"
+
+        context = self._cached(job_key, key, shared_key)
+        if context:
+            return context
+
+        lock_key = f"industry_lock:{job_id}:{key}"
+        token = uuid.uuid4().hex
+        locked = self.redis.set(lock_key, token, nx=True, ex=LOCK_TTL)
+        if not locked:
+            # Another worker is generating this industry - give it a moment, taking over if it lets go
+            deadline = time.time() + LOCK_WAIT
+            while time.time() < deadline and not locked:
+                time.sleep(0.5)
+                context = self._cached(job_key, key, shared_key)
+                if context:
+                    return context
+                locked = self.redis.set(lock_key, token, nx=True, ex=LOCK_TTL)
+            # Taken over: the holder may have stored the block just before letting go
+            context = self._cached(job_key, key, shared_key) if locked else None
+            if context:
+                self._unlock(lock_key, token)
+                return context
+
+        try:
+            print(f"Generating industry context for '{key}'")
+            context = self.llm.complete(
+                model=model,
+                messages=render("industry_analysis", industry=industry),
+                temperature=0.5,
+                max_tokens=250,
+            ).strip()
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(job_key, key, context)
+            pipe.expire(job_key, JOB_STATE_TTL)
+            if SHARED_INDUSTRY_CACHE:
+                pipe.set(shared_key, context, ex=SHARED_INDUSTRY_TTL)
+            pipe.execute()
+            return context
+        finally:
+            if locked:
+                self._unlock(lock_key, token)
+
+    def _unlock(self, lock_key, token):
+        """Delete the lock only while it still holds token: past LOCK_TTL it may be another worker's"""
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) != token.encode('utf-8'):
+                    return
+                pipe.multi()
+                pipe.delete(lock_key)
+                pipe.execute()
+            except WatchError:
+                pass  # changed hands in between, so it is no longer ours
+
+    def _cached(self, job_key, key, shared_key):
+        context = self.redis.hget(job_key, key)
+        if context is None and SHARED_INDUSTRY_CACHE:
+            context = self.redis.get(shared_key)
+        return context.decode('utf-8') if context is not None else None
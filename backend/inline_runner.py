@@ -0,0 +1,78 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from tasks import (
+    celery_app, combine_results, combine_sequence_results, job_store, row_task_signatures, update_status,
+)
+
+INLINE_MAX_ROWS = int(os.getenv("INLINE_MAX_ROWS", 10))  # uploads up to this many rows skip the broker
+INLINE_WORKERS = int(os.getenv("INLINE_WORKERS", 8))  # rows generated at once across all inline jobs
+INLINE_MAX_BYTES = 256 * 1024  # larger files are never counted - they can't be small enough
+
+
+def runs_inline(file_path, file_size):
+    """Whether an upload is small enough to run in the API process"""
+    if file_size > INLINE_MAX_BYTES:
+        return False
+    total_rows = count_rows(file_path)
+    return total_rows is not None and total_rows <= INLINE_MAX_ROWS
+
+
+def count_rows(file_path):
+    """Rows in an uploaded spreadsheet, or None if it can't be read here (the worker reports the error)"""
+    try:
+        if file_path.endswith('.csv'):
+            return len(pd.read_csv(file_path))
+        return len(pd.read_excel(file_path))
+    except Exception as e:
+        print(f"Could not count rows of {file_path}: {e}")
+        return None
+
+
+class InlineRunner:
+    """Runs small jobs in the API process instead of through the broker.
+
+    Rows are the usual row tasks, executed locally with .apply() on a shared
+    thread pool, so they go through the same prompt templates, rate limiter
+    and row store. The result file is written by the usual combine step.
+    A job's rows run in parallel, so it finishes in about one completion.
+    """
+
+    def __init__(self, max_workers=INLINE_WORKERS):
+        # Celery's current app is per thread; without this, tasks applied here see a default app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inline",
+                                           initializer=celery_app.set_current)
+        self.running = set()
+
+    def start(self, file_path, job_id, mode):
+        """Schedule a job on the event loop; returns immediately"""
+        job = asyncio.get_running_loop().create_task(self.run(file_path, job_id, mode))
+        # Keep a reference until it finishes, or the task may be garbage collected mid-run
+        self.running.add(job)
+        job.add_done_callback(self.running.discard)
+
+    async def run(self, file_path, job_id, mode):
+        loop = asyncio.get_running_loop()
+        try:
+            if file_path.endswith('.csv'):
+                df = await loop.run_in_executor(self.executor, pd.read_csv, file_path)
+            else:
+                df = await loop.run_in_executor(self.executor, pd.read_excel, file_path)
+            total_rows = len(df)
+            update_status(job_id, "PROCESSING", 0, total_rows)
+            job_store.save_job_meta(job_id, file_path=file_path, mode=mode, total_rows=total_rows, inline=1)
+            print(f"Running job {job_id} inline: {total_rows} rows, {mode} mode")
+
+            # Row failures are stored as error results by the row tasks themselves
+            await asyncio.gather(*(
+                loop.run_in_executor(self.executor, task.apply)
+                for task in row_task_signatures(df, list(range(total_rows)), job_id, mode)
+            ))
+            combine = combine_sequence_results if mode == "sequence" else combine_results
+            await loop.run_in_executor(self.executor, combine.si(None, job_id, total_rows).apply)
+        except Exception as e:
+            print(f"Inline job {job_id} failed: {e}")
+            update_status(job_id, "FAILURE", 0, 0)
@@ -0,0 +1,285 @@
+import os
+import json
+import pickle
+import time
+
+TASK_META_PREFIX = "celery-task-meta-"
+JOB_STATE_TTL = int(os.getenv("JOB_STATE_TTL", 86400))  # keep per-job state for a day
+QUOTA_WAITING_KEY = "quota_waiting_jobs"  # job_id -> when its parked rows can run again
+INFLIGHT_JOBS_KEY = "inflight_jobs"  # jobs the straggler watchdog keeps an eye on
+LATENCY_SAMPLES = 1000  # recent row latencies kept per job
+RESUME_LOCK_TTL = 300  # seconds a resume that never reaches a worker blocks the next one
+ROW_CLAIM_TTL = int(os.getenv("ROW_CLAIM_TTL", 600))  # a crashed worker's claim frees up after this
+
+
+def decode_task_meta(raw_result):
+    """Decode a Celery result record (JSON or pickle), None if unreadable"""
+    try:
+        return json.loads(raw_result.decode('utf-8'))
+    except Exception:
+        pass
+    try:
+        return pickle.loads(raw_result)
+    except Exception:
+        return None
+
+
+class JobStore:
+    """Per-job bookkeeping kept in Redis next to the Celery results"""
+
+    def __init__(self, redis_client, batch_size=500):
+        self.redis = redis_client
+        self.batch_size = batch_size
+
+    def record_task_ids(self, job_id, task_ids):
+        """Index the Celery task IDs that belong to a job"""
+        if not task_ids:
+            return
+        key = f"job_tasks_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        for i in range(0, len(task_ids), self.batch_size):
+            pipe.rpush(key, *task_ids[i:i + self.batch_size])
+        pipe.expire(key, JOB_STATE_TTL)
+        pipe.execute()
+
+    def get_task_ids(self, job_id):
+        return [task_id.decode('utf-8') for task_id in self.redis.lrange(f"job_tasks_{job_id}", 0, -1)]
+
+    def save_job_meta(self, job_id, **fields):
+        """Remember how a job was started (input file, mode, row count) so it can be resumed"""
+        meta_key = f"job_meta_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(meta_key, mapping={field: str(value) for field, value in fields.items()})
+        pipe.expire(meta_key, JOB_STATE_TTL)
+        pipe.execute()
+
+    def get_job_meta(self, job_id):
+        return {field.decode('utf-8'): value.decode('utf-8') for field, value in self.redis.hgetall(f"job_meta_{job_id}").items()}
+
+    def save_row_result(self, job_id, row_index, result):
+        """Store a finished row result and log the order rows complete in.
+
+        Returns True the first time the row finishes; only then is the
+        job's progress counter incremented, so a redelivered or duplicated
+        row execution never pushes progress past the row count.
+        """
+        rows_key = f"job_rows_{job_id}"
+        log_key = f"job_rowlog_{job_id}"
+        counted_key = f"job_counted_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(rows_key, row_index, json.dumps(result, default=str))
+        pipe.rpush(log_key, row_index)
+        pipe.sadd(counted_key, row_index)
+        pipe.expire(rows_key, JOB_STATE_TTL)
+        pipe.expire(log_key, JOB_STATE_TTL)
+        pipe.expire(counted_key, JOB_STATE_TTL)
+        first_completion = pipe.execute()[2] == 1
+        if first_completion:
+            self.redis.incr(f"progress_{job_id}")
+        return first_completion
+
+    def get_row_result(self, job_id, row_index):
+        raw_result = self.redis.hget(f"job_rows_{job_id}", row_index)
+        return json.loads(raw_result) if raw_result else None
+
+    def uncount_rows(self, job_id, row_indices):
+        """Let rows count towards progress again, e.g. when they are regenerated"""
+        for i in range(0, len(row_indices), self.batch_size):
+            self.redis.srem(f"job_counted_{job_id}", *row_indices[i:i + self.batch_size])
+
+    def claim_step(self, job_id, row_index, step, owner):
+        """Claim one (job, row, step) for owner (one execution of a row task) before calling the API.
+
+        The claim records its owner and when it expires. Every other
+        execution, including a redelivered copy of the same message while the
+        original still runs, is refused until the claim is released or
+        expires (ROW_CLAIM_TTL, so a crashed worker's rows free up).
+        """
+        claim_key = f"job_claim_{job_id}_{row_index}_{step}"
+        claim = json.dumps({"owner": owner, "expires": time.time() + ROW_CLAIM_TTL})
+        if self.redis.set(claim_key, claim, nx=True, ex=ROW_CLAIM_TTL):
+            return True
+        current = self.step_claim(job_id, row_index, step)
+        if current is None:
+            # Released or expired in between
+            return bool(self.redis.set(claim_key, claim, nx=True, ex=ROW_CLAIM_TTL))
+        return current['owner'] == owner
+
+    def step_claim(self, job_id, row_index, step):
+        """{"owner": ..., "expires": ...} of a claimed step, None when it is free"""
+        raw_claim = self.redis.get(f"job_claim_{job_id}_{row_index}_{step}")
+        return json.loads(raw_claim) if raw_claim else None
+
+    def release_claims(self, job_id, row_index, steps, owner):
+        for step in steps:
+            current = self.step_claim(job_id, row_index, step)
+            if current is not None and current['owner'] == owner:
+                self.redis.delete(f"job_claim_{job_id}_{row_index}_{step}")
+
+    def completed_row_indices(self, job_id):
+        return sorted(int(row_index) for row_index in self.redis.hkeys(f"job_rows_{job_id}"))
+
+    def iter_row_results(self, job_id, row_indices):
+        """Yield stored row results for row_indices, in that order, with batched HMGETs"""
+        for i in range(0, len(row_indices), self.batch_size):
+            batch = row_indices[i:i + self.batch_size]
+            for raw_result in self.redis.hmget(f"job_rows_{job_id}", batch):
+                if raw_result:
+                    yield json.loads(raw_result)
+
+    def iter_all_row_results(self, job_id):
+        """Yield every stored row result of a job in hash order (unsorted), batch by batch"""
+        for _, raw_result in self.redis.hscan_iter(f"job_rows_{job_id}", count=self.batch_size):
+            yield json.loads(raw_result)
+
+    def save_step(self, job_id, row_index, step, output):
+        """Checkpoint one generated step of a row so a retry can skip it"""
+        steps_key = f"job_steps_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(steps_key, f"{row_index}:{step}", output)
+        pipe.expire(steps_key, JOB_STATE_TTL)
+        pipe.execute()
+
+    def load_steps(self, job_id, row_index, steps):
+        """Checkpointed outputs of a row as {step: output}, finished steps only"""
+        outputs = self.redis.hmget(f"job_steps_{job_id}", [f"{row_index}:{step}" for step in steps])
+        return {step: output.decode('utf-8') for step, output in zip(steps, outputs) if output is not None}
+
+    def clear_steps(self, job_id, row_index, steps):
+        self.redis.hdel(f"job_steps_{job_id}", *[f"{row_index}:{step}" for step in steps])
+
+    def defer_row(self, job_id, row_index, reset_at):
+        """Park a row until quota resets at reset_at (unix seconds)"""
+        deferred_key = f"job_deferred_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(deferred_key, row_index)
+        pipe.expire(deferred_key, JOB_STATE_TTL)
+        pipe.hset(QUOTA_WAITING_KEY, job_id, reset_at)
+        pipe.execute()
+
+    def deferred_count(self, job_id):
+        return self.redis.scard(f"job_deferred_{job_id}")
+
+    def deferred_rows(self, job_id):
+        return {int(row_index) for row_index in self.redis.smembers(f"job_deferred_{job_id}")}
+
+    def quota_reset_at(self, job_id):
+        """When a job waiting for quota will be resumed, None if it is not waiting"""
+        reset_at = self.redis.hget(QUOTA_WAITING_KEY, job_id)
+        return float(reset_at) if reset_at else None
+
+    def due_quota_jobs(self, now):
+        """Jobs with parked rows whose quota has reset by now"""
+        return [
+            job_id.decode('utf-8') for job_id, reset_at in self.redis.hgetall(QUOTA_WAITING_KEY).items()
+            if float(reset_at) <= now
+        ]
+
+    def clear_deferred(self, job_id, pipe=None):
+        """Forget a job's deferred rows; queued on pipe instead when one is given"""
+        commands = pipe or self.redis.pipeline(transaction=False)
+        commands.delete(f"job_deferred_{job_id}")
+        commands.hdel(QUOTA_WAITING_KEY, job_id)
+        if pipe is None:
+            commands.execute()
+
+    def cancel_job(self, job_id, pipe=None):
+        """Flag a job as cancelled; its row tasks check this before (and while) calling the API"""
+        (pipe or self.redis).set(f"job_cancelled_{job_id}", 1, ex=JOB_STATE_TTL)
+
+    def is_cancelled(self, job_id):
+        return bool(self.redis.exists(f"job_cancelled_{job_id}"))
+
+    def clear_cancelled(self, job_id):
+        self.redis.delete(f"job_cancelled_{job_id}")
+
+    def mark_inflight(self, job_id, row_index, info):
+        """Note a row execution that has started (info: task_id, host, started, row_data)"""
+        inflight_key = f"job_inflight_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(inflight_key, row_index, json.dumps(info, default=str))
+        pipe.expire(inflight_key, JOB_STATE_TTL)
+        pipe.sadd(INFLIGHT_JOBS_KEY, job_id)
+        pipe.execute()
+
+    def finish_inflight(self, job_id, row_index, elapsed=None):
+        """Drop a row from the in-flight set, recording how long it took"""
+        latency_key = f"job_latency_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hdel(f"job_inflight_{job_id}", row_index)
+        if elapsed is not None:
+            pipe.lpush(latency_key, round(elapsed, 3))
+            pipe.ltrim(latency_key, 0, LATENCY_SAMPLES - 1)
+            pipe.expire(latency_key, JOB_STATE_TTL)
+        pipe.execute()
+
+    def inflight_rows(self, job_id):
+        return {int(row_index): json.loads(info) for row_index, info in self.redis.hgetall(f"job_inflight_{job_id}").items()}
+
+    def inflight_count(self, job_id):
+        return self.redis.hlen(f"job_inflight_{job_id}")
+
+    def latency_samples(self, job_id):
+        return [float(sample) for sample in self.redis.lrange(f"job_latency_{job_id}", 0, -1)]
+
+    def inflight_jobs(self):
+        return [job_id.decode('utf-8') for job_id in self.redis.smembers(INFLIGHT_JOBS_KEY)]
+
+    def drop_inflight_job(self, job_id, pipe=None):
+        (pipe or self.redis).srem(INFLIGHT_JOBS_KEY, job_id)
+
+    def mark_hedged(self, job_id, row_index):
+        """True the first time a row is re-dispatched, so each row is hedged at most once"""
+        hedged_key = f"job_hedged_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(hedged_key, row_index)
+        pipe.expire(hedged_key, JOB_STATE_TTL)
+        return pipe.execute()[0] == 1
+
+    def finished_row_count(self, job_id):
+        """Rows that have a result or are parked - the job is ready to combine when this reaches its row count"""
+        return self.redis.scard(f"job_counted_{job_id}") + self.redis.scard(f"job_deferred_{job_id}")
+
+    def claim_finalize(self, job_id):
+        """True for exactly one combine run of a job (chord callback or watchdog, whichever is first)"""
+        return bool(self.redis.set(f"job_finalize_{job_id}", 1, nx=True, ex=JOB_STATE_TTL))
+
+    def claim_resume(self, job_id):
+        """True for one resume of a job at a time; held until resume_job has dispatched its rows"""
+        return bool(self.redis.set(f"job_resume_{job_id}", 1, nx=True, ex=RESUME_LOCK_TTL))
+
+    def release_resume(self, job_id):
+        self.redis.delete(f"job_resume_{job_id}")
+
+    def reset_finalize(self, job_id):
+        """Allow the job to be combined again (it is being resumed)"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(f"job_finalize_{job_id}")
+        pipe.delete(f"job_hedged_{job_id}")
+        pipe.execute()
+
+    def read_row_log(self, job_id, cursor=0, limit=1000, by_index=True):
+        """Row indices completed since cursor, and the cursor for the next call.
+
+        Sorted by index, or with by_index=False in the order they completed.
+        """
+        entries = self.redis.lrange(f"job_rowlog_{job_id}", cursor, cursor + limit - 1)
+        row_indices = list(dict.fromkeys(int(entry) for entry in entries))
+        if by_index:
+            row_indices.sort()
+        return row_indices, cursor + len(entries)
+
+    def iter_task_results(self, job_id):
+        """Yield (task_id, meta) for every Celery result of a job.
+
+        Reads only the job's indexed task IDs with batched MGETs; a job with
+        no index (older than its results' expiry) yields nothing. meta is
+        None when the stored record could not be decoded.
+        """
+        task_ids = self.get_task_ids(job_id)
+        for i in range(0, len(task_ids), self.batch_size):
+            batch = task_ids[i:i + self.batch_size]
+            raw_results = self.redis.mget([f"{TASK_META_PREFIX}{task_id}" for task_id in batch])
+            for task_id, raw_result in zip(batch, raw_results):
+                if raw_result:
+                    yield task_id, decode_task_meta(raw_result)
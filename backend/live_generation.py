@@ -0,0 +1,55 @@
+import json
+
+from prompt_templates import PROMPT_VERSION
+from quota_breaker import is_quota_exhausted
+from tasks import (
+    SEQUENCE_STEPS, SEQUENCE_STEP_SETTINGS, llm, quota_breaker, rate_limited_api_call, sequence_step_messages,
+    single_email_messages,
+)
+
+LIVE_JOB_ID = "live"  # on-demand requests share one set of per-job caches (industry context)
+SINGLE_EMAIL_SETTINGS = (0.8, 200)  # (temperature, max_tokens), as in process_single_email
+
+
+def generate_events(prospect, mode, builder, model):
+    """(event, data) pairs for one prospect's email or sequence, tokens streamed as they arrive.
+
+    Events: 'step' when a step starts, 'token' per text delta, then 'done'
+    with the full result (the same fields as a row result), or 'error'.
+    """
+    steps = SEQUENCE_STEPS if mode == "sequence" else ['email']
+    result, usage = {}, {}
+    try:
+        for step in steps:
+            if step == 'email':
+                messages = single_email_messages(prospect, builder)
+                temperature, max_tokens = SINGLE_EMAIL_SETTINGS
+            else:
+                messages = sequence_step_messages(step, prospect, builder, LIVE_JOB_ID, model)
+                temperature, max_tokens = SEQUENCE_STEP_SETTINGS[step]
+            rate_limited_api_call()
+            yield "step", {"step": step}
+            parts = []
+            for text in llm.stream(model, messages, temperature, max_tokens, usage=usage):
+                parts.append(text)
+                yield "token", {"step": step, "text": text}
+            result[step] = "".join(parts).strip()
+    except Exception as e:
+        if is_quota_exhausted(e):
+            quota_breaker.trip(model, e)
+        print(f"Live generation failed: {e}")
+        yield "error", {"error": str(e), "completed": result}
+        return
+    yield "done", {
+        **result,
+        "status": "success",
+        "model_used": model,
+        "prompt_tokens": usage.get('prompt_tokens'),
+        "prompt_version": PROMPT_VERSION,
+    }
+
+
+def sse(events):
+    """Server-Sent Events wire format for (event, data) pairs"""
+    for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from prompt_builder import messages_tokens
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))  # deadline for one completion, hedges included
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))  # hedge once a call is slower than this
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 2))  # ...but never sooner than this (seconds)
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", 0.05))  # at most this share of calls may send a hedge
+HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL")  # model for the hedge request; default is the same model
+LATENCY_SAMPLES = 500  # recent latencies kept per model
+MIN_LATENCY_SAMPLES = 50  # no hedging until a model has this many samples
+THRESHOLD_REFRESH = 30  # seconds a worker reuses its cached hedge threshold
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))  # completions one process runs at once (e.g. inline runner threads)
+CANCEL_POLL_INTERVAL = 0.25  # seconds between should_cancel checks while waiting for an answer
+
+
+class CallCancelled(Exception):
+    pass
+
+
+class LLMClient:
+    """Chat completions with a deadline and optional request hedging.
+
+    Every completion is streamed on a helper thread so it can be abandoned:
+    at the deadline, or when the other request of a hedged pair answers
+    first. With hedging on, a call still running after the model's rolling
+    latency percentile gets a second request (budget permitting) and the
+    first answer wins. Latencies and hedge counters are shared across
+    workers in Redis.
+    """
+
+    def __init__(self, client, redis_client, hedge=HEDGE_ENABLED, hedge_model=HEDGE_MODEL, concurrency=LLM_CONCURRENCY):
+        self.client = client
+        self.redis = redis_client
+        self.hedge = hedge
+        self.hedge_model = hedge_model
+        # Every call in flight may hold a primary and a hedge request
+        self.pool_size = concurrency * (2 if hedge else 1)
+        self._executor = None
+        self._executor_pid = None
+        self._thresholds = {}
+
+    @property
+    def executor(self):
+        # Celery forks its pool processes, so each process needs its own threads
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="llm")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def complete(self, model, messages, temperature, max_tokens, deadline=LLM_TIMEOUT, should_cancel=None, usage=None):
+        """Text of the first completion to finish; raises TimeoutError past the deadline.
+
+        should_cancel, if given, is polled while waiting; once it returns True
+        the call raises CallCancelled and its requests are closed. usage, if
+        given, is a dict whose 'prompt_tokens' gets this call's estimated input
+        tokens added.
+        """
+        if usage is not None:
+            usage['prompt_tokens'] = usage.get('prompt_tokens', 0) + messages_tokens(messages)
+        started = time.time()
+        cancel = threading.Event()
+        streams = []
+        primary = self.executor.submit(self._attempt, model, messages, temperature, max_tokens, deadline, cancel, should_cancel, streams)
+        attempts = [primary]
+        self._count(model, "calls")
+
+        try:
+            threshold = self._hedge_threshold(model) if self.hedge else None
+            if threshold is not None and threshold < deadline:
+                done, _ = self._wait(attempts, threshold, should_cancel, model)
+                if not done and self._within_budget(model):
+                    hedge_model = self.hedge_model or model
+                    print(f"Hedging {model} call after {threshold:.1f}s with {hedge_model}")
+                    attempts.append(self.executor.submit(self._attempt, hedge_model, messages, temperature, max_tokens,
+                                                         deadline, cancel, should_cancel, streams))
+                    self._count(model, "hedges")
+
+            pending, error = set(attempts), None
+            while pending:
+                done, pending = self._wait(pending, deadline - (time.time() - started), should_cancel, model)
+                if not done:
+                    self._count(model, "timeouts")
+                    raise TimeoutError(f"LLM call timeout: no answer from {model} within {deadline:.0f}s")
+                succeeded = [future for future in done if future.exception() is None]
+                if succeeded:
+                    if succeeded[0] is not primary:
+                        self._count(model, "hedge_wins")
+                    self._record_latency(model, time.time() - started)
+                    return succeeded[0].result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            # Abandon whatever is still streaming. Closing the response ends its read straight away,
+            # so the attempt's thread goes back to the pool instead of waiting for the next chunk
+            cancel.set()
+            for stream in list(streams):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+
+    def stream(self, model, messages, temperature, max_tokens, deadline=LLM_TIMEOUT, usage=None):
+        """Yield a completion's text as it arrives (no hedging - the caller is already reading the first request).
+
+        Closing the generator, e.g. when an HTTP client disconnects, closes the request.
+        """
+        if usage is not None:
+            usage['prompt_tokens'] = usage.get('prompt_tokens', 0) + messages_tokens(messages)
+        started = time.time()
+        self._count(model, "calls")
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            timeout=deadline,
+        )
+        try:
+            for chunk in stream:
+                if time.time() - started > deadline:
+                    self._count(model, "timeouts")
+                    raise TimeoutError(f"LLM call timeout: {model} still streaming after {deadline:.0f}s")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            self._record_latency(model, time.time() - started)
+        finally:
+            stream.close()
+
+    def _wait(self, futures, timeout, should_cancel, model):
+        """wait() for the first of futures, raising CallCancelled as soon as should_cancel() says so"""
+        end = time.time() + max(timeout, 0)
+        while True:
+            poll = min(end - time.time(), CANCEL_POLL_INTERVAL) if should_cancel else end - time.time()
+            done, pending = wait(futures, timeout=max(poll, 0), return_when=FIRST_COMPLETED)
+            if done or time.time() >= end:
+                return done, pending
+            if should_cancel and should_cancel():
+                raise CallCancelled(f"{model} call cancelled")
+
+    def _attempt(self, model, messages, temperature, max_tokens, timeout, cancel, should_cancel, streams):
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            timeout=timeout,
+        )
+        # Registered before checking cancel, so either complete() closes it or this attempt sees the cancel
+        streams.append(stream)
+        parts = []
+        try:
+            if cancel.is_set():
+                raise CallCancelled(f"{model} call abandoned")
+            for chunk in stream:
+                if cancel.is_set() or (should_cancel and should_cancel()):
+                    raise CallCancelled(f"{model} call cancelled")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            stream.close()
+        return "".join(parts)
+
+    def _hedge_threshold(self, model):
+        """Rolling latency percentile for model (cached per worker), None until enough samples"""
+        cached = self._thresholds.get(model)
+        if cached and time.time() - cached[1] < THRESHOLD_REFRESH:
+            return cached[0]
+        samples = self.recent_latencies(model)
+        threshold = None
+        if len(samples) >= MIN_LATENCY_SAMPLES:
+            percentile = samples[min(int(len(samples) * HEDGE_PERCENTILE / 100), len(samples) - 1)]
+            threshold = max(percentile, HEDGE_MIN_DELAY)
+        self._thresholds[model] = (threshold, time.time())
+        return threshold
+
+    def recent_latencies(self, model):
+        """The model's last LATENCY_SAMPLES completion latencies in seconds, sorted"""
+        return sorted(float(sample) for sample in self.redis.lrange(f"llm_latency:{model}", 0, -1))
+
+    def _within_budget(self, model):
+        calls, hedges = self.redis.hmget(self._stats_key(model), "calls", "hedges")
+        return int(hedges or 0) < HEDGE_BUDGET * int(calls or 0)
+
+    def _record_latency(self, model, elapsed):
+        key = f"llm_latency:{model}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpush(key, round(elapsed, 3))
+        pipe.ltrim(key, 0, LATENCY_SAMPLES - 1)
+        pipe.execute()
+
+    def _stats_key(self, model):
+        return f"llm_stats:{model}:{datetime.now().strftime('%Y-%m-%d')}"
+
+    def _count(self, model, field):
+        key = self._stats_key(model)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(key, field, 1)
+        pipe.expire(key, 86400 * 2)
+        pipe.execute()
+
+    def get_stats(self, models):
+        """Today's calls, hedges, hedge wins and timeouts per model, plus the current hedge threshold"""
+        stats = {}
+        for model in models:
+            counters = {field.decode('utf-8'): int(value) for field, value in self.redis.hgetall(self._stats_key(model)).items()}
+            hedges = counters.get("hedges", 0)
+            stats[model] = {
+                "calls": counters.get("calls", 0),
+                "hedges": hedges,
+                "hedge_wins": counters.get("hedge_wins", 0),
+                "hedge_win_rate": round(counters.get("hedge_wins", 0) / hedges, 3) if hedges else None,
+                "timeouts": counters.get("timeouts", 0),
+                "hedge_threshold": self._hedge_threshold(model),
+            }
+        return stats
@@ -1,19 +1,41 @@
 import os
 import uuid
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse, HTMLResponse
+from typing import List, Optional, Union
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 from celery.result import AsyncResult
-from tasks import process_spreadsheet_task, process_spreadsheet_sequence_task, celery_app, update_status
+from tasks import (
+    process_spreadsheet_task, process_spreadsheet_sequence_task, resume_job, update_status,
+    quota_breaker, queued_task_count, scheduler, worker_slot_count, model_assigner, job_store, webhook_notifier, INDUSTRY_CONTEXT, PACK_SIZE, PACK_SIZES,
+)
 import redis
 from worker_models import WorkerModelAssigner
+from job_store import JobStore
+from llm_client import LLMClient
+from prompt_builder import PromptBuilder
+from estimator import JobEstimator, estimate_usage
+from fair_share import JOB_CLASS_QUEUES, job_class_for
+from inline_runner import InlineRunner, runs_inline
+from live_generation import generate_events, sse
+from batch_generation import BATCH_MAX_ROWS, parse_prospects, stream_batch
+from webhooks import WEBHOOK_SECRET, valid_callback_url
+from sanitize import sanitize_columns
+from result_writer import EXPORT_SHARD_ROWS, build_result_row, write_jsonl_snapshot
+from exporters import (
+    FORMATS, negotiate_format, validate_compression, check_dependencies, export_filename, export_media_type,
+    parse_range, iter_file, stream_export, stream_zip, compress_stream, build_xlsx, tee_to_file,
+)
 from datetime import datetime
 import json
-import pickle
 import pandas as pd
 
 Path("./uploads").mkdir(exist_ok=True)
+Path("./uploads/exports").mkdir(exist_ok=True)
 app = FastAPI()
 
 # Add CORS middleware
@@ -27,6 +49,9 @@ app.add_middleware(
 
 job_status_db = {}
 
+# Small uploads run in this process instead of through the broker
+inline_runner = InlineRunner()
+
 async def attempt_recovery(job_id: str):
     """Attempt to recover generated emails from Redis when combine step failed"""
     try:
@@ -49,33 +74,18 @@ async def attempt_recovery(job_id: str):
         
         print(f"Found {progress_count} processed emails for {job_id}, recovering...")
         
-        # Get all Celery task result keys
-        task_keys = r.keys("celery-task-meta-*")
-        recovered_results = []
-        
-        for key in task_keys:
-            try:
-                raw_result = r.get(key)
-                if not raw_result:
-                    continue
-                
-                # Try to deserialize the result
-                try:
-                    result_data = pickle.loads(raw_result)
-                except:
-                    try:
-                        result_data = json.loads(raw_result.decode('utf-8'))
-                    except:
-                        continue
-                
+        # Every finished row is in the job's row store; packed tasks return only a summary,
+        # so the task results are a fallback for jobs whose row store has expired
+        store = JobStore(r)
+        recovered_results = [result for result in store.iter_all_row_results(job_id) if 'row_data' in result and 'email' in result]
+        if not recovered_results:
+            # Read only this job's task results from its index
+            for task_id, result_data in store.iter_task_results(job_id):
                 # Look for email generation results
                 if isinstance(result_data, dict) and 'result' in result_data:
                     result = result_data['result']
                     if isinstance(result, dict) and 'row_data' in result and 'email' in result:
                         recovered_results.append(result)
-                        
-            except Exception:
-                continue
         
         if not recovered_results:
             print(f"No recoverable email results found for {job_id}")
@@ -90,20 +100,14 @@ async def attempt_recovery(job_id: str):
         final_data = []
         for result in recovered_results:
             row = result['row_data'].copy()
-            
-            # Clean email text
-            email_text = result['email']
-            if isinstance(email_text, str):
-                email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
-                email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
-            
-            row['generated_email'] = email_text
+            row['generated_email'] = result['email']
             row['model_used'] = result.get('model_used', 'unknown')
             row['recovery_status'] = 'recovered'
             final_data.append(row)
         
         # Save recovered data
         df = pd.DataFrame(final_data)
+        sanitize_columns(df, ['generated_email'])
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_file = f"uploads/RECOVERED_{job_id}_{timestamp}.csv"
         df.to_csv(output_file, index=False, encoding='utf-8')
@@ -117,7 +121,11 @@ async def attempt_recovery(job_id: str):
 
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), mode: str = Form("single")):
+async def upload_file(file: UploadFile = File(...), mode: str = Form("single"),
+                      include_columns: Optional[str] = Form(None), exclude_columns: Optional[str] = Form(None),
+                      sample: Optional[int] = Form(None), sample_by: Optional[str] = Form(None),
+                      job_class: Optional[str] = Form(None), max_concurrency: Optional[int] = Form(None),
+                      callback_url: Optional[str] = Form(None)):
     # Validate file extension
     allowed_extensions = {".csv", ".xlsx", ".xls"}
     file_ext = Path(file.filename).suffix.lower()
@@ -127,6 +135,17 @@ async def upload_file(file: UploadFile = File(...), mode: str = Form("single")):
             detail=f"File type {file_ext} not allowed. Please upload CSV or Excel files only."
         )
     
+    if job_class and job_class not in JOB_CLASS_QUEUES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown job_class '{job_class}'. Use one of: {', '.join(JOB_CLASS_QUEUES)}."
+        )
+    
+    if callback_url and not WEBHOOK_SECRET:
+        raise HTTPException(status_code=400, detail="callback_url needs WEBHOOK_SECRET to be set on the server")
+    if callback_url and not await run_in_threadpool(valid_callback_url, callback_url):
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL on an allowed, public host")
+    
     # Validate file size (10MB limit)
     file.file.seek(0, 2)
     file_size = file.file.tell()
@@ -156,23 +175,140 @@ async def upload_file(file: UploadFile = File(...), mode: str = Form("single")):
             while chunk := file.file.read(8192):  # 8KB chunks
                 f.write(chunk)
         
+        # Which columns go into the prompts (comma-separated lists, read by the workers)
+        if include_columns or exclude_columns:
+            JobStore(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))).save_job_meta(
+                job_id, include_columns=include_columns or "", exclude_columns=exclude_columns or ""
+            )
+        
+        # Job events (started, milestones, completed/failed) are POSTed there instead of polling /status
+        if callback_url:
+            webhook_notifier.register(job_id, callback_url)
+        
         # Queue the task - pass mode as parameter
-        task = process_spreadsheet_task.delay(file_location, job_id, mode)
+        # Small uploads skip the broker; the result is ready in about one completion
+        inline = not sample and await run_in_threadpool(runs_inline, file_location, file_size)
+        if inline:
+            inline_runner.start(file_location, job_id, mode)
+        else:
+            # With sample=N only a stratified sample runs until the job is approved
+            # job_class (interactive/standard/bulk) defaults by size; max_concurrency caps the job's running rows
+            process_spreadsheet_task.delay(file_location, job_id, mode, sample, sample_by, job_class, max_concurrency)
         job_status_db[job_id] = {
             "status": "QUEUED", 
             "progress": 0, 
             "total": 0, 
             "result_file": None,
             "original_filename": file.filename,
-            "mode": mode
+            "mode": mode,
+            "sample": sample,
+            "inline": inline,
+            "callback_url": callback_url
         }
-        return {"job_id": job_id, "status": "QUEUED"}
+        return {"job_id": job_id, "status": "QUEUED", "inline": inline}
     except Exception as e:
         # Clean up file if error occurs
         if 'file_location' in locals() and os.path.exists(file_location):
             os.remove(file_location)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+@app.post("/estimate")
+async def estimate_job(file: UploadFile = File(...), mode: str = Form("single"),
+                       include_columns: Optional[str] = Form(None), exclude_columns: Optional[str] = Form(None)):
+    """Estimated API calls, tokens, cost and wall-clock time for an upload - nothing is queued or generated"""
+    file_ext = Path(file.filename).suffix.lower()
+    if file_ext not in {".csv", ".xlsx", ".xls"}:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type {file_ext} not allowed. Please upload CSV or Excel files only."
+        )
+    try:
+        df = await run_in_threadpool(pd.read_csv if file_ext == ".csv" else pd.read_excel, file.file)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {str(e)}")
+    if df.empty:
+        raise HTTPException(status_code=400, detail="File is empty.")
+    
+    try:
+        r = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        models = WorkerModelAssigner().models
+        # Each worker packs as many rows as its model allows
+        pack_size = max(round(sum(PACK_SIZES.get(model, PACK_SIZE) for model in models) / len(models)), 1)
+        usage = await run_in_threadpool(
+            estimate_usage, df, mode, PromptBuilder(include_columns, exclude_columns), pack_size, INDUSTRY_CONTEXT
+        )
+        
+        def estimate_behind_queue():
+            # Work already ahead of this job; broker, Redis and breaker reads, so run on the threadpool
+            store = JobStore(r)
+            inflight_rows = sum(store.inflight_count(job_id) for job_id in store.inflight_jobs())
+            return JobEstimator(LLMClient(None, r), models, quota_breaker).estimate(
+                usage, worker_slot_count(), queued_task_count(), inflight_rows
+            )
+        
+        estimate = await run_in_threadpool(estimate_behind_queue)
+        return {"mode": mode, "rows": len(df), **estimate}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Estimate failed: {str(e)}")
+
+class GenerateRequest(BaseModel):
+    prospect: dict
+    mode: str = "single"
+    include_columns: Optional[Union[str, List[str]]] = None
+    exclude_columns: Optional[Union[str, List[str]]] = None
+
+@app.post("/generate")
+async def generate_email(body: GenerateRequest):
+    """One prospect's email (mode=single) or 3-email sequence (mode=sequence), streamed as Server-Sent Events"""
+    if body.mode not in ("single", "sequence"):
+        raise HTTPException(status_code=400, detail="mode must be 'single' or 'sequence'")
+    if not body.prospect:
+        raise HTTPException(status_code=400, detail="prospect is empty")
+    
+    model = model_assigner.get_worker_model()
+    reset_at = await run_in_threadpool(quota_breaker.open_until, model)
+    if reset_at:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Daily API quota for {model} is exhausted until {datetime.fromtimestamp(reset_at).isoformat()}",
+            headers={"Retry-After": str(max(int(reset_at - datetime.now().timestamp()), 1))},
+        )
+    
+    builder = PromptBuilder(body.include_columns, body.exclude_columns)
+    return StreamingResponse(
+        sse(generate_events(body.prospect, body.mode, builder, model)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/generate/batch")
+async def generate_batch(request: Request, mode: str = "single", include_columns: Optional[str] = None,
+                         exclude_columns: Optional[str] = None, job_class: Optional[str] = None):
+    """Emails for a JSON or NDJSON array of prospects, streamed back as NDJSON lines as rows finish"""
+    if mode not in ("single", "sequence", "packed"):
+        raise HTTPException(status_code=400, detail="mode must be 'single', 'sequence' or 'packed'")
+    if job_class and job_class not in JOB_CLASS_QUEUES:
+        raise HTTPException(status_code=400, detail=f"job_class must be one of: {', '.join(JOB_CLASS_QUEUES)}")
+    try:
+        prospects = parse_prospects(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid prospects: {e}")
+    if not prospects:
+        raise HTTPException(status_code=400, detail="No prospects given")
+    if len(prospects) > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ROWS} prospects per request")
+    
+    job_id = str(uuid.uuid4())
+    job_class = job_class_for(len(prospects), job_class)
+    job_store.save_job_meta(job_id, mode=mode, total_rows=len(prospects), source="api", job_class=job_class,
+                            include_columns=include_columns or "", exclude_columns=exclude_columns or "")
+    print(f"Batch job {job_id}: {len(prospects)} prospects, {mode} mode, {job_class} class")
+    return StreamingResponse(
+        stream_batch(prospects, job_id, mode, job_class),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Job-Id": job_id},
+    )
+
 @app.get("/status/{job_id}")
 async def get_task_status(job_id: str):
     if job_id not in job_status_db:
@@ -198,25 +334,196 @@ async def get_task_status(job_id: str):
     except:
         pass
     
-    # Check if result file exists
+    # Parked rows resume on their own once the API quota resets
+    if job_status_db[job_id]['status'] == "WAITING_FOR_QUOTA":
+        try:
+            reset_at = JobStore(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))).quota_reset_at(job_id)
+            job_status_db[job_id]['quota_reset_at'] = datetime.fromtimestamp(reset_at).isoformat() if reset_at else None
+        except:
+            pass
+    else:
+        job_status_db[job_id].pop('quota_reset_at', None)
+    
+    # Check if result file exists (a resumed or waiting job keeps its partial file until the new one is written)
     result_file_path = f"uploads/result_{job_id}.xlsx"
-    if Path(result_file_path).exists():
+    if Path(result_file_path).exists() and job_status_db[job_id]['status'] not in ("RESUMING", "PROCESSING", "WRITING_SHARDS", "WAITING_FOR_QUOTA", "SAMPLING", "AWAITING_APPROVAL"):
         job_status_db[job_id]['status'] = "SUCCESS"
         job_status_db[job_id]['result_file'] = result_file_path
         job_status_db[job_id]['progress'] = job_status_db[job_id]['total']
     
     return job_status_db[job_id]
 
+def ranged_file_response(request: Request, path: str, filename: str, media_type: str):
+    """Serve a file on disk, honouring a single HTTP Range for resumed downloads"""
+    size = os.path.getsize(path)
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    
+    if byte_range is None:
+        return FileResponse(path=path, filename=filename, media_type=media_type, headers={"Accept-Ranges": "bytes"})
+    
+    start, end = byte_range
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Range": f"bytes {start}-{end}/{size}",
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    return StreamingResponse(iter_file(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+def materialize_export(job_id: str, jsonl_file: str, fmt: str, compression, cache_path: str):
+    """Write an export to the cache so Range requests have stable bytes to slice"""
+    if fmt == "xlsx":
+        excel_file = f"uploads/result_{job_id}.xlsx"
+        if not os.path.exists(excel_file):
+            excel_file = f"uploads/exports/result_{job_id}.xlsx"
+            build_xlsx(jsonl_file, excel_file)
+        if excel_file == cache_path:
+            return cache_path
+        chunks = compress_stream(iter_file(excel_file), compression)
+    else:
+        chunks = stream_export(jsonl_file, fmt, compression)
+    for _ in tee_to_file(chunks, cache_path):
+        pass
+    return cache_path
+
+async def export_response(request: Request, job_id: str, jsonl_file: str, fmt: str, compression):
+    """Stream the job's rows in the requested format, generated from the JSONL row store"""
+    filename = export_filename(job_id, fmt, compression)
+    media_type = export_media_type(fmt, compression)
+    try:
+        check_dependencies(fmt, compression)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    # Files we already keep on disk are served as-is
+    if not compression and fmt == "jsonl":
+        return ranged_file_response(request, jsonl_file, filename, media_type)
+    if not compression and fmt == "xlsx" and os.path.exists(f"uploads/result_{job_id}.xlsx"):
+        return ranged_file_response(request, f"uploads/result_{job_id}.xlsx", filename, media_type)
+    
+    # Exports are deterministic, so a cached copy newer than the row store is reusable
+    cache_path = f"uploads/exports/{filename}"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(jsonl_file):
+        return ranged_file_response(request, cache_path, filename, media_type)
+    
+    # xlsx is a zip container and resumed downloads need byte offsets: build those first
+    if fmt == "xlsx" or request.headers.get("range"):
+        await run_in_threadpool(materialize_export, job_id, jsonl_file, fmt, compression, cache_path)
+        return ranged_file_response(request, cache_path, filename, media_type)
+    
+    # Otherwise stream straight to the client, caching the bytes on the way
+    return StreamingResponse(
+        tee_to_file(stream_export(jsonl_file, fmt, compression), cache_path),
+        media_type=media_type,
+        headers={"Accept-Ranges": "bytes", "Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+async def partial_export_response(job_id: str, fmt: str, compression):
+    """Export the rows a job has finished so far, in index order, from the Redis row store"""
+    try:
+        check_dependencies(fmt, compression)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    store = JobStore(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    row_indices = store.completed_row_indices(job_id)
+    if not row_indices:
+        raise HTTPException(status_code=404, detail="No rows have finished yet.")
+    if fmt == "xlsx" and len(row_indices) > EXPORT_SHARD_ROWS:
+        raise HTTPException(status_code=413, detail="Too many finished rows for one workbook; use format=csv, jsonl or parquet")
+    
+    # Snapshot the finished rows so the export sees one consistent set
+    snapshot_id = uuid.uuid4().hex
+    snapshot_file = f"uploads/exports/partial_{job_id}_{snapshot_id}.jsonl"
+    await run_in_threadpool(write_jsonl_snapshot, snapshot_file, lambda: store.iter_row_results(job_id, row_indices))
+    temp_files = [snapshot_file]
+    
+    if fmt == "xlsx":
+        excel_file = f"uploads/exports/partial_{job_id}_{snapshot_id}.xlsx"
+        await run_in_threadpool(build_xlsx, snapshot_file, excel_file)
+        temp_files.append(excel_file)
+        chunks = compress_stream(iter_file(excel_file), compression)
+    else:
+        chunks = stream_export(snapshot_file, fmt, compression)
+    
+    def cleanup():
+        for path in temp_files:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    filename = export_filename(f"{job_id}_partial", fmt, compression)
+    return StreamingResponse(
+        chunks,
+        media_type=export_media_type(fmt, compression),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Rows-Included": str(len(row_indices)),
+        },
+        background=BackgroundTask(cleanup),
+    )
+
 @app.get("/download/{job_id}")
-async def download_result(job_id: str):
+async def download_result(job_id: str, request: Request, format: Optional[str] = None,
+                          compression: Optional[str] = None, partial: bool = False):
+    """Download results as xlsx (default), csv, jsonl or parquet, optionally gzip/zstd compressed.
+    
+    The format comes from ?format= or the Accept header. partial=true exports the
+    rows finished so far while the job is still running.
+    """
     result_file_path = f"uploads/result_{job_id}.xlsx"
     csv_file_path = f"uploads/result_{job_id}.csv"
+    jsonl_file_path = f"uploads/result_{job_id}.jsonl"
+    
+    try:
+        fmt = negotiate_format(format, request.headers.get("accept"))
+        compression = validate_compression(compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Check if result file exists
-    if os.path.exists(result_file_path):
-        return FileResponse(path=result_file_path, filename=f"result_{job_id}.xlsx")
-    elif os.path.exists(csv_file_path):
-        return FileResponse(path=csv_file_path, filename=f"result_{job_id}.csv")
+    if partial:
+        return await partial_export_response(job_id, fmt or "xlsx", compression)
+    
+    # A result too big for one workbook has no xlsx until its shard workbooks are written
+    status_file = Path(f"uploads/{job_id}_status.txt")
+    if fmt in (None, "xlsx") and status_file.exists() and status_file.read_text().split(',')[0] == "WRITING_SHARDS":
+        raise HTTPException(status_code=409, detail="Result workbooks are still being written; csv, jsonl and parquet are ready now")
+    
+    # Results too big for one workbook come as a zip of shard workbooks
+    shards_manifest = f"uploads/result_{job_id}_shards.json"
+    if fmt in (None, "xlsx") and os.path.exists(shards_manifest):
+        with open(shards_manifest) as f:
+            manifest = json.load(f)
+        shard_files = manifest["files"]
+        # Never a zip with workbooks missing: the rows in them would silently be gone
+        missing = [f"part {number}" for number in manifest.get("missing_shards", [])]
+        missing += [os.path.basename(path) for path in shard_files if not os.path.exists(path)]
+        if missing:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Result workbooks missing ({', '.join(missing)}); csv, jsonl and parquet are complete, "
+                       "and resuming the job writes the workbooks again",
+            )
+        return StreamingResponse(
+            compress_stream(stream_zip(shard_files), compression),
+            media_type=export_media_type("xlsx", compression) if compression else "application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{export_filename(job_id, "zip", compression)}"'},
+        )
+    
+    # Jobs with a row store can be exported in any format
+    if os.path.exists(jsonl_file_path):
+        return await export_response(request, job_id, jsonl_file_path, fmt or "xlsx", compression)
+    
+    # Older jobs only have the file combine wrote
+    if os.path.exists(result_file_path) and fmt in (None, "xlsx") and not compression:
+        return ranged_file_response(request, result_file_path, f"result_{job_id}.xlsx", FORMATS["xlsx"])
+    elif os.path.exists(csv_file_path) and fmt in (None, "csv") and not compression:
+        return ranged_file_response(request, csv_file_path, f"result_{job_id}.csv", FORMATS["csv"])
+    elif os.path.exists(result_file_path) or os.path.exists(csv_file_path):
+        raise HTTPException(status_code=406, detail="This job's result is only available in its original format.")
     
     # Try recovery from Redis if no result file exists
     try:
@@ -229,20 +536,57 @@ async def download_result(job_id: str):
     
     raise HTTPException(status_code=404, detail="Result file not found and recovery failed.")
 
+@app.get("/jobs/{job_id}/rows")
+async def get_job_rows(job_id: str, cursor: int = 0, limit: int = 1000):
+    """Rows finished since `cursor`, in index order, as NDJSON.
+    
+    Send the X-Next-Cursor response header back as ?cursor= to fetch the next increment.
+    """
+    if cursor < 0 or limit < 1:
+        raise HTTPException(status_code=400, detail="cursor must be >= 0 and limit >= 1")
+    
+    store = JobStore(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    row_indices, next_cursor = await run_in_threadpool(store.read_row_log, job_id, cursor, min(limit, 10000))
+    
+    def generate():
+        for result in store.iter_row_results(job_id, row_indices):
+            row = build_result_row(result, result.get('index'))
+            row.setdefault('row_index', result.get('index'))
+            yield json.dumps(row, default=str) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "X-Next-Cursor": str(next_cursor),
+            "X-Job-Complete": str(Path(f"uploads/result_{job_id}.jsonl").exists()).lower(),
+        },
+    )
+
 @app.get("/model-stats")
 async def get_model_stats():
     """Get worker-model assignment info"""
     try:
         assigner = WorkerModelAssigner()
+        llm_stats = LLMClient(None, redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))).get_stats(assigner.models)
         return {
             "status": "success",
             "worker_assignments": assigner.model_assignments,
             "models": assigner.models,
+            "llm_stats": llm_stats,
             "info": "Each worker uses a dedicated model. Run start_workers.bat/sh to launch 4 workers."
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/scheduler")
+async def get_scheduler():
+    """Fair-share scheduler state: each active job's class, cap, running row tasks and backlog"""
+    try:
+        return await run_in_threadpool(scheduler.snapshot)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/jobs")
 async def list_jobs():
     """List all jobs with their status"""
@@ -269,7 +613,7 @@ async def list_jobs():
             
             # Check if result file exists
             result_file = Path(f"uploads/result_{job_id}.xlsx")
-            has_result = result_file.exists()
+            has_result = result_file.exists() or Path(f"uploads/result_{job_id}_shards.json").exists()
             
             # Get file info
             csv_file = Path(f"uploads/{job_id}.csv")
@@ -300,12 +644,78 @@ async def list_jobs():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs/{job_id}/resume")
+async def resume_failed_rows(job_id: str):
+    """Regenerate only the rows that have no successful result and rebuild the result file"""
+    r = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    meta = JobStore(r).get_job_meta(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="No resumable state for this job (it may have expired)")
+    if not meta.get('file_path'):
+        # /generate/batch jobs keep no input file to rebuild rows from
+        raise HTTPException(status_code=409, detail="Batch API jobs cannot be resumed; resubmit the rows that did not succeed")
+    
+    # One resume at a time: two requests racing past the status check would pay for the same rows twice
+    if not JobStore(r).claim_resume(job_id):
+        raise HTTPException(status_code=409, detail="Job is already being resumed")
+    status_file = Path(f"uploads/{job_id}_status.txt")
+    status = status_file.read_text().split(',')[0] if status_file.exists() else "UNKNOWN"
+    if status in ("RESUMING", "PROCESSING", "WRITING_SHARDS", "SAMPLING"):
+        JobStore(r).release_resume(job_id)
+        raise HTTPException(status_code=409, detail=f"Job is still running ({status})")
+    if status == "WAITING_FOR_QUOTA":
+        JobStore(r).release_resume(job_id)
+        reset_at = JobStore(r).quota_reset_at(job_id)
+        raise HTTPException(
+            status_code=409,
+            detail="Job resumes on its own once the API quota resets" + (f" ({datetime.fromtimestamp(reset_at).isoformat()})" if reset_at else ""),
+        )
+    
+    JobStore(r).clear_cancelled(job_id)  # resuming a cancelled job picks it up again
+    update_status(job_id, "RESUMING", 0, int(meta['total_rows']))
+    resume_job.delay(job_id)  # releases the resume claim once its rows are dispatched
+    if job_id in job_status_db:
+        job_status_db[job_id]['status'] = "RESUMING"
+    return {"job_id": job_id, "status": "RESUMING", "previous_status": status}
+
+@app.post("/jobs/{job_id}/approve")
+async def approve_sample(job_id: str):
+    """Run the rest of a sample-first job; the sample's rows keep their results"""
+    job_store = JobStore(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    meta = job_store.get_job_meta(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Job not found (its state may have expired)")
+    if meta.get('approval') != "pending":
+        raise HTTPException(status_code=409, detail="Job has no sample awaiting approval")
+    
+    status_file = Path(f"uploads/{job_id}_status.txt")
+    status = status_file.read_text().split(',')[0] if status_file.exists() else "UNKNOWN"
+    if status != "AWAITING_APPROVAL":
+        raise HTTPException(status_code=409, detail=f"Sample is not ready for review yet ({status})")
+    if not job_store.claim_resume(job_id):
+        raise HTTPException(status_code=409, detail="Job is already being approved or resumed")
+    
+    job_store.save_job_meta(job_id, approval="approved")
+    update_status(job_id, "RESUMING", 0, int(meta['total_rows']))
+    resume_job.delay(job_id)
+    if job_id in job_status_db:
+        job_status_db[job_id]['status'] = "RESUMING"
+    return {"job_id": job_id, "status": "RESUMING"}
+
+def stop_job(job_id):
+    """Stop a job's API spend: rows still queued return without calling the API,
+    calls in flight are aborted, rows not yet dispatched are dropped, and rows
+    parked for quota are forgotten so resume_quota_jobs stops checking the job"""
+    job_store.cancel_job(job_id)
+    scheduler.cancel(job_id)
+    job_store.clear_deferred(job_id)
+    job_store.drop_inflight_job(job_id)
+
 @app.post("/cancel/{job_id}")
 async def cancel_job(job_id: str):
     """Cancel a running job"""
     try:
-        # Revoke the celery task
-        celery_app.control.revoke(job_id, terminate=True)
+        stop_job(job_id)
         
         # Update status file
         update_status(job_id, "CANCELLED", 0, 0)
@@ -319,20 +729,29 @@ async def delete_job(job_id: str):
     """Delete a job and its files"""
     try:
         # Cancel if running
-        celery_app.control.revoke(job_id, terminate=True)
+        stop_job(job_id)
+        webhook_notifier.forget(job_id)
         
         # Delete files
         files_to_delete = [
             f"uploads/{job_id}.csv",
             f"uploads/{job_id}_status.txt",
-            f"uploads/result_{job_id}.xlsx"
+            f"uploads/result_{job_id}.xlsx",
+            f"uploads/result_{job_id}.csv",
+            f"uploads/result_{job_id}.jsonl",
+            f"uploads/result_{job_id}_shards.json"
         ]
+        files_to_delete += [str(path) for path in Path("uploads").glob(f"result_{job_id}_part*.xlsx")]
         
         for file_path in files_to_delete:
             path = Path(file_path)
             if path.exists():
                 path.unlink()
         
+        # Cached exports of the result
+        for path in Path("uploads/exports").glob(f"result_{job_id}*"):
+            path.unlink()
+        
         # Remove from job_status_db
         if job_id in job_status_db:
             del job_status_db[job_id]
@@ -345,10 +764,6 @@ async def delete_job(job_id: str):
 async def debug_job(job_id: str):
     """Debug a failed job by examining task results"""
     try:
-        import redis
-        import json
-        import pickle
-        
         redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
         r = redis.from_url(redis_url)
         
@@ -356,60 +771,46 @@ async def debug_job(job_id: str):
         progress_key = f"progress_{job_id}"
         progress = r.get(progress_key)
         
-        # Get all task result keys and analyze them
-        task_keys = r.keys("celery-task-meta-*")
+        # Analyze only this job's task results
         successful_tasks = 0
         failed_tasks = 0
         malformed_tasks = 0
+        total_for_job = 0
         task_details = []
         
-        for key in task_keys:
-            try:
-                raw_result = r.get(key)
-                if not raw_result:
-                    continue
-                
-                # Try to deserialize
-                try:
-                    result_data = pickle.loads(raw_result)
-                except:
-                    try:
-                        result_data = json.loads(raw_result.decode('utf-8'))
-                    except:
-                        malformed_tasks += 1
-                        continue
+        for task_id, result_data in JobStore(r).iter_task_results(job_id):
+            total_for_job += 1
+            if result_data is None:
+                malformed_tasks += 1
+                continue
+            
+            # Check if this is an email task result
+            if isinstance(result_data, dict) and 'result' in result_data:
+                result = result_data['result']
                 
-                # Check if this is an email task result
-                if isinstance(result_data, dict) and 'result' in result_data:
-                    result = result_data['result']
-                    task_id = key.decode('utf-8').replace('celery-task-meta-', '')
-                    
-                    if isinstance(result, dict):
-                        if 'row_data' in result or 'email' in result or 'initial_email' in result:
-                            task_info = {
-                                "task_id": task_id[:8] + "...",
-                                "status": result.get('status', 'unknown'),
-                                "index": result.get('index', 'unknown'),
-                                "has_email": 'email' in result or 'initial_email' in result,
-                                "error_preview": None
-                            }
-                            
-                            if result.get('status') == 'success':
-                                successful_tasks += 1
-                            else:
-                                failed_tasks += 1
-                                # Get error preview
-                                for field in ['initial_email', 'email']:
-                                    if field in result and 'ERROR' in str(result[field]):
-                                        task_info["error_preview"] = str(result[field])[:200]
-                                        break
-                            
-                            task_details.append(task_info)
-                    else:
-                        malformed_tasks += 1
+                if isinstance(result, dict):
+                    if 'row_data' in result or 'email' in result or 'initial_email' in result:
+                        task_info = {
+                            "task_id": task_id[:8] + "...",
+                            "status": result.get('status', 'unknown'),
+                            "index": result.get('index', 'unknown'),
+                            "has_email": 'email' in result or 'initial_email' in result,
+                            "error_preview": None
+                        }
                         
-            except Exception:
-                malformed_tasks += 1
+                        if result.get('status') == 'success':
+                            successful_tasks += 1
+                        else:
+                            failed_tasks += 1
+                            # Get error preview
+                            for field in ['initial_email', 'email']:
+                                if field in result and 'ERROR' in str(result[field]):
+                                    task_info["error_preview"] = str(result[field])[:200]
+                                    break
+                        
+                        task_details.append(task_info)
+                else:
+                    malformed_tasks += 1
         
         return {
             "job_id": job_id,
@@ -418,7 +819,7 @@ async def debug_job(job_id: str):
                 "successful": successful_tasks,
                 "failed": failed_tasks,
                 "malformed": malformed_tasks,
-                "total_in_redis": len(task_keys)
+                "total_for_job": total_for_job
             },
             "task_details": task_details[:10],  # First 10 tasks
             "recommendations": [
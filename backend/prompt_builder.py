@@ -0,0 +1,99 @@
+import math
+import os
+import re
+
+MAX_FIELD_CHARS = int(os.getenv("PROMPT_MAX_FIELD_CHARS", 300))  # longer values are cut with an ellipsis
+# Columns left out of prompts unless an upload's include list names them: IDs, URLs, photos, socials, internal bookkeeping
+DEFAULT_EXCLUDE_PATTERNS = [
+    r"(^|[\s_])(id|uuid|guid)$",
+    r"url|link|linkedin|twitter|facebook|photo|image|logo",
+    r"^(row_index|index|unnamed.*)$",
+]
+EMPTY_VALUES = {"", "nan", "none", "null", "n/a", "na", "-"}
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Token count with tiktoken when it is installed, else the ~4 characters per token rule of thumb"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def messages_tokens(messages):
+    """Estimated input tokens of a chat message list"""
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def parse_column_list(value):
+    """'a, b,c' (as sent in an upload form) -> ['a', 'b', 'c']"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(column).strip() for column in value if str(column).strip()]
+    return [column.strip() for column in str(value).split(",") if column.strip()]
+
+
+def is_empty(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return True
+    return str(value).strip().lower() in EMPTY_VALUES
+
+
+class PromptBuilder:
+    """Turns a spreadsheet row into the prospect block of a prompt.
+
+    Only columns worth paying tokens for make it in: the include list (if
+    given) wins, then the exclude list and DEFAULT_EXCLUDE_PATTERNS drop
+    columns; empty/NaN values are skipped and long values truncated.
+    Column names are matched case-insensitively.
+    """
+
+    def __init__(self, include_columns=None, exclude_columns=None, max_field_chars=MAX_FIELD_CHARS):
+        self.include = {column.lower() for column in parse_column_list(include_columns)}
+        self.exclude = {column.lower() for column in parse_column_list(exclude_columns)}
+        self.max_field_chars = max_field_chars
+        self._exclude_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in DEFAULT_EXCLUDE_PATTERNS]
+        self._keep = {}
+
+    def keeps(self, column):
+        """Whether column goes into prompts (cached - rows of one upload share their columns)"""
+        if column not in self._keep:
+            name = str(column).strip().lower()
+            if self.include:
+                keep = name in self.include
+            else:
+                keep = name not in self.exclude and not any(pattern.search(name) for pattern in self._exclude_patterns)
+            self._keep[column] = keep
+        return self._keep[column]
+
+    def fields(self, row_data):
+        """(column, value) pairs that go into the prompt, values cleaned and truncated"""
+        fields = []
+        for column, value in row_data.items():
+            if not self.keeps(column) or is_empty(value):
+                continue
+            value = " ".join(str(value).split())
+            if len(value) > self.max_field_chars:
+                value = value[:self.max_field_chars - 3].rstrip() + "..."
+            fields.append((column, value))
+        return fields
+
+    def prospect_info(self, row_data):
+        return "\n".join(f"{column}: {value}" for column, value in self.fields(row_data))
+
+    def value(self, row_data, *columns, default=None):
+        """First non-empty value among columns (e.g. 'first_name', 'name'), else default"""
+        for column in columns:
+            value = row_data.get(column)
+            if not is_empty(value):
+                return str(value).strip()
+        return default
@@ -0,0 +1,49 @@
+import hashlib
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+RETRY_AFTER_RE = re.compile(r"try again in\s+(?:(\d+)h)?\s*(?:(\d+)m(?!s))?\s*(?:([\d.]+)s)?\s*(?:([\d.]+)ms)?", re.IGNORECASE)
+
+
+def is_quota_exhausted(error):
+    """Daily request limit or exhausted billing quota - retrying soon will not help"""
+    message = str(error)
+    return "requests per day" in message or "insufficient_quota" in message
+
+
+def quota_reset_time(error):
+    """When the quota should be back: the API's 'try again in ...' hint, else next UTC midnight"""
+    match = RETRY_AFTER_RE.search(str(error))
+    if match and any(match.groups()):
+        hours, minutes, seconds, millis = (float(group or 0) for group in match.groups())
+        return time.time() + hours * 3600 + minutes * 60 + seconds + millis / 1000
+    tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc).timestamp()
+
+
+class QuotaBreaker:
+    """Circuit breaker shared by all workers, one per (model, API key).
+
+    Opens on a quota-exhaustion error and stays open until the quota resets,
+    so queued rows can be parked without calling the API.
+    """
+
+    def __init__(self, redis_client, api_key):
+        self.redis = redis_client
+        self.key_fingerprint = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+    def _key(self, model):
+        return f"quota_breaker:{model}:{self.key_fingerprint}"
+
+    def trip(self, model, error):
+        """Open the breaker for model; returns the reset time (unix seconds)"""
+        reset_at = quota_reset_time(error)
+        self.redis.set(self._key(model), reset_at, ex=max(int(reset_at - time.time()), 1))
+        print(f"Quota breaker OPEN for {model} until {datetime.fromtimestamp(reset_at).isoformat()}")
+        return reset_at
+
+    def open_until(self, model):
+        """Reset time if the breaker for model is open, else None"""
+        reset_at = self.redis.get(self._key(model))
+        return float(reset_at) if reset_at else None
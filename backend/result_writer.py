@@ -0,0 +1,283 @@
+import csv
+import json
+import math
+import os
+from openpyxl import Workbook
+from sanitize import sanitize_text
+
+EXCEL_CELL_LIMIT = 32767  # Excel refuses cells longer than this
+# Rows per workbook before results are split (Excel's hard limit is 1,048,576 rows per sheet)
+EXPORT_SHARD_ROWS = int(os.getenv("EXPORT_SHARD_ROWS", 1000000))
+SEQUENCE_OUTPUT_COLUMNS = ['initial_email', 'followup_1', 'followup_2', 'sequence_status', 'model_used', 'row_index']
+
+
+def output_row_columns(source_columns, output_columns):
+    """Prospect columns in first-seen order, then our own columns"""
+    columns = dict.fromkeys(source_columns)
+    for column in output_columns:
+        columns.pop(column, None)
+    return list(columns) + list(output_columns)
+
+
+def result_columns(results, output_columns):
+    """Ordered union of the prospect columns across results, then our own columns"""
+    columns = {}
+    for result in results:
+        row_data = result.get('row_data') if isinstance(result, dict) else None
+        if isinstance(row_data, dict):
+            columns.update(dict.fromkeys(row_data))
+    return output_row_columns(columns, output_columns)
+
+
+def build_sequence_row(result, position):
+    """Flatten one sequence result into an output row"""
+    try:
+        # Safely copy row data
+        row_data = result.get('row_data', {})
+        if isinstance(row_data, dict):
+            row = row_data.copy()
+        else:
+            row = {"original_data": str(row_data)}
+
+        # Add the 3 emails as separate columns with robust error handling
+        row['initial_email'] = result.get('initial_email', 'ERROR: Not generated')
+        row['followup_1'] = result.get('followup_1', 'ERROR: Not generated')
+        row['followup_2'] = result.get('followup_2', 'ERROR: Not generated')
+        row['sequence_status'] = result.get('status', 'unknown')
+        row['model_used'] = result.get('model_used', 'unknown')
+        row['row_index'] = result.get('index', position)  # Add for debugging
+
+        # Add error details if available
+        if 'error_type' in result:
+            row['error_type'] = result['error_type']
+        if 'retry_count' in result:
+            row['retry_count'] = result['retry_count']
+        if 'prompt_tokens' in result:
+            row['prompt_tokens'] = result['prompt_tokens']
+        if 'prompt_version' in result:
+            row['prompt_version'] = result['prompt_version']
+        return row
+
+    except Exception as row_error:
+        print(f"Error processing result row: {row_error}")
+        # Emergency fallback row
+        return {
+            "initial_email": f"PROCESSING_ERROR: {str(row_error)}",
+            "followup_1": "SKIPPED: Row processing failed",
+            "followup_2": "SKIPPED: Row processing failed",
+            "sequence_status": "processing_error",
+            "model_used": "none",
+            "row_index": position
+        }
+
+
+def build_single_row(result):
+    """Flatten one single-mode result into an output row"""
+    row = result['row_data'].copy()
+
+    # Handle both old single email format and new sequence format
+    if 'initial_email' in result:
+        row['initial_email'] = result.get('initial_email', '')
+        row['followup_1'] = result.get('followup_1', '')
+        row['followup_2'] = result.get('followup_2', '')
+        row['sequence_status'] = result.get('status', 'unknown')
+    else:
+        row['generated_email'] = result['email']
+
+    # Add model info for tracking
+    row['model_used'] = result.get('model_used', 'unknown')
+    if 'prompt_tokens' in result:
+        row['prompt_tokens'] = result['prompt_tokens']
+    if 'prompt_version' in result:
+        row['prompt_version'] = result['prompt_version']
+    return row
+
+
+def build_result_row(result, position):
+    """Flatten a row result of either mode"""
+    if 'initial_email' in result:
+        return build_sequence_row(result, position)
+    return build_single_row(result)
+
+
+def _cell_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (dict, list, tuple)):
+        value = str(value)
+    if isinstance(value, str):
+        return sanitize_text(value)[:EXCEL_CELL_LIMIT]
+    return value
+
+
+def _json_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return sanitize_text(value)
+
+
+class ResultWriter:
+    """Streams result rows into an xlsx file using openpyxl's write-only mode.
+
+    Rows are flushed to a temp file as they are appended, so memory stays flat
+    no matter how many rows or how long the email columns get.
+    """
+
+    def __init__(self, excel_file, columns, sheet_title="Sheet1"):
+        self.excel_file = excel_file
+        self.columns = list(columns)
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(sheet_title)
+        self.sheet.append(self.columns)
+        self.rows_written = 0
+
+    def write_row(self, row):
+        self.sheet.append([_cell_value(row.get(column)) for column in self.columns])
+        self.rows_written += 1
+
+    def close(self):
+        self.workbook.save(self.excel_file)
+        return self.excel_file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class JsonlWriter:
+    """Writes the job's JSONL row store (one object per row, columns in order).
+
+    This is the per-job result data /download exports other formats from.
+    The file only appears under its final name once it is complete.
+    """
+
+    def __init__(self, jsonl_file, columns, shard_rows=None):
+        self.jsonl_file = jsonl_file
+        self.columns = list(columns)
+        self.file = open(f"{jsonl_file}.part", "wb")
+        self.shard_rows = shard_rows
+        self.shard_offsets = []  # byte offset of the first row of each shard
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    def write_row(self, row):
+        if self.shard_rows and self.rows_written % self.shard_rows == 0:
+            self.shard_offsets.append(self.bytes_written)
+        record = {column: _json_value(row.get(column)) for column in self.columns}
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self.file.write(line)
+        self.rows_written += 1
+        self.bytes_written += len(line)
+
+    def close(self):
+        self.file.close()
+        os.replace(f"{self.jsonl_file}.part", self.jsonl_file)
+        return self.jsonl_file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(f"{self.jsonl_file}.part")
+
+
+def write_jsonl_snapshot(jsonl_file, make_results):
+    """Flatten row results into a JSONL file, e.g. the rows a running job has finished.
+
+    make_results() must return a fresh iterator of results in index order.
+    """
+    first = next(iter(make_results()), None)
+    if first is not None and 'initial_email' in first:
+        output_columns = SEQUENCE_OUTPUT_COLUMNS + ['error_type', 'retry_count', 'prompt_tokens', 'prompt_version']
+    else:
+        output_columns = ['generated_email', 'model_used', 'row_index', 'prompt_tokens', 'prompt_version']
+    columns = result_columns(make_results(), output_columns)
+
+    with JsonlWriter(jsonl_file, columns) as store:
+        for position, result in enumerate(make_results()):
+            row = build_result_row(result, position)
+            row.setdefault('row_index', result.get('index', position))
+            store.write_row(row)
+    return jsonl_file
+
+
+def _tee(rows, store):
+    for row in rows:
+        store.write_row(row)
+        yield row
+
+
+def write_csv(csv_file, columns, rows):
+    with open(csv_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            values = [_cell_value(row.get(column)) for column in columns]
+            writer.writerow(['' if value is None else value for value in values])
+    return csv_file
+
+
+def write_result_file(job_id, columns, make_rows):
+    """Stream rows to uploads/result_{job_id}.xlsx, falling back to CSV.
+
+    The JSONL row store (uploads/result_{job_id}.jsonl) is written in the
+    same pass. make_rows() must return a fresh iterator of row dicts; it is
+    called again if the Excel write fails part way.
+    """
+    excel_file = f"uploads/result_{job_id}.xlsx"
+    csv_file = f"uploads/result_{job_id}.csv"
+    jsonl_file = f"uploads/result_{job_id}.jsonl"
+
+    try:
+        with ResultWriter(excel_file, columns) as writer, JsonlWriter(jsonl_file, columns) as store:
+            for row in _tee(make_rows(), store):
+                writer.write_row(row)
+        print(f"Saved {writer.rows_written} rows to Excel: {excel_file}")
+        return excel_file
+    except Exception as excel_error:
+        print(f"Excel save failed: {excel_error}, saving as CSV instead")
+        with JsonlWriter(jsonl_file, columns) as store:
+            return write_csv(csv_file, columns, _tee(make_rows(), store))
+
+
+def shard_file(job_id, shard_number):
+    return f"uploads/result_{job_id}_part{shard_number + 1:03d}.xlsx"
+
+
+def write_row_store(job_id, columns, rows, shard_rows=EXPORT_SHARD_ROWS):
+    """Write only the JSONL row store, noting where each shard of shard_rows rows starts.
+
+    Used for results too big for one workbook; the shards are then written
+    from these offsets in parallel (see write_shard).
+    """
+    jsonl_file = f"uploads/result_{job_id}.jsonl"
+    with JsonlWriter(jsonl_file, columns, shard_rows=shard_rows) as store:
+        for row in rows:
+            store.write_row(row)
+    print(f"Saved {store.rows_written} rows to {jsonl_file} in {len(store.shard_offsets)} shards")
+    return jsonl_file, store.shard_offsets
+
+
+def write_shard(job_id, shard_number, offset, row_count):
+    """Write one workbook from row_count rows of the row store starting at byte offset"""
+    jsonl_file = f"uploads/result_{job_id}.jsonl"
+    excel_file = shard_file(job_id, shard_number)
+
+    with open(jsonl_file, "rb") as f:
+        columns = list(json.loads(f.readline()))
+        f.seek(offset)
+        with ResultWriter(excel_file, columns) as writer:
+            for _ in range(row_count):
+                line = f.readline()
+                if not line:
+                    break
+                writer.write_row(json.loads(line))
+    print(f"Saved shard {shard_number + 1} ({writer.rows_written} rows) to {excel_file}")
+    return excel_file
@@ -0,0 +1,30 @@
+import re
+import pandas as pd
+
+# Everything openpyxl refuses to write (its ILLEGAL_CHARACTERS_RE: C0 controls
+# except \t \n \r) plus code points XML 1.0 cannot carry at all
+ILLEGAL_CHARACTERS_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def sanitize_text(value):
+    """Strip characters Excel/openpyxl can't store from a single value"""
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value
+
+
+def sanitize_columns(df, columns):
+    """Strip illegal characters from whole DataFrame columns in one pass each.
+
+    Text columns may be object or string dtype (pandas 3 reads text as
+    'str'); non-string cells (NaN, numbers) are left untouched.
+    """
+    for column in columns:
+        if column not in df.columns:
+            continue
+        if not (pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column])):
+            continue
+        series = df[column]
+        cleaned = series.str.replace(ILLEGAL_CHARACTERS_RE, '', regex=True)
+        df[column] = cleaned.where(cleaned.notna(), series)
+    return df
@@ -7,13 +7,17 @@ start "Worker2 - gpt-3.5-turbo-0125" cmd /k "celery -A tasks worker --loglevel=i
 start "Worker3 - gpt-3.5-turbo-1106" cmd /k "celery -A tasks worker --loglevel=info --hostname=worker3@%%h --concurrency=1"
 start "Worker4 - gpt-3.5-turbo-16k" cmd /k "celery -A tasks worker --loglevel=info --hostname=worker4@%%h --concurrency=1"
 
+REM Periodic jobs: quota resume, straggler watchdog, fair-share feed, webhook progress
+start "Beat - periodic jobs" cmd /k "celery -A tasks beat --loglevel=info"
+
 echo Workers started! Each worker uses a different model:
 echo - Worker1: gpt-3.5-turbo
 echo - Worker2: gpt-3.5-turbo-0125
 echo - Worker3: gpt-3.5-turbo-1106
 echo - Worker4: gpt-3.5-turbo-16k
+echo Beat runs the periodic jobs (quota resume, watchdog, fair-share feed, webhooks).
 echo.
-echo Press any key to stop all workers...
+echo Press any key to stop all workers and beat...
 pause
 
 REM Kill all celery workers
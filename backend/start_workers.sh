@@ -14,7 +14,11 @@ WORKER3_PID=$!
 celery -A tasks worker --loglevel=info --hostname=worker4@%h --concurrency=1 &
 WORKER4_PID=$!
 
-echo "Workers started with PIDs: $WORKER1_PID, $WORKER2_PID, $WORKER3_PID, $WORKER4_PID"
+# Periodic jobs: quota resume, straggler watchdog, fair-share feed, webhook progress
+celery -A tasks beat --loglevel=info &
+BEAT_PID=$!
+
+echo "Workers started with PIDs: $WORKER1_PID, $WORKER2_PID, $WORKER3_PID, $WORKER4_PID (beat: $BEAT_PID)"
 echo "Each worker uses a different model:"
 echo "- Worker1: gpt-3.5-turbo"
 echo "- Worker2: gpt-3.5-turbo-0125"
@@ -25,5 +29,5 @@ echo "Press Enter to stop all workers..."
 read
 
 # Kill all workers
-kill $WORKER1_PID $WORKER2_PID $WORKER3_PID $WORKER4_PID
+kill $WORKER1_PID $WORKER2_PID $WORKER3_PID $WORKER4_PID $BEAT_PID
 echo "All workers stopped."
\ No newline at end of file
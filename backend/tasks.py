@@ -1,13 +1,30 @@
+import functools
 import os
 import time
 import pandas as pd
-from celery import Celery, chord
+from celery import Celery, chord, signature
+from celery.exceptions import Retry
+from celery.signals import task_postrun
+from kombu import Queue
 from openai import OpenAI
 from dotenv import load_dotenv
 import json
 import threading
 import redis
 from worker_models import WorkerModelAssigner
+from job_store import JobStore
+from quota_breaker import QuotaBreaker, is_quota_exhausted
+from llm_client import LLM_TIMEOUT, CallCancelled, LLMClient
+from industry_context import IndustryContextCache, normalize_industry
+from prompt_builder import PromptBuilder, parse_column_list
+from prompt_templates import PROMPT_VERSION, render
+from result_writer import (
+    EXPORT_SHARD_ROWS, SEQUENCE_OUTPUT_COLUMNS, build_sequence_row, build_single_row,
+    output_row_columns, write_result_file, write_row_store, write_shard,
+)
+from external_merge import SortedRuns
+from fair_share import FairShareScheduler, JOB_CLASS_QUEUES, job_class_for
+from webhooks import WEBHOOK_MAX_ATTEMPTS, WebhookNotifier, is_retryable, post_event, retry_delay
 
 load_dotenv()
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -34,6 +51,11 @@ celery_app.conf.update(
     task_acks_late=True,
     worker_prefetch_multiplier=1,
     
+    # Message priorities within each queue on the Redis broker (0 = highest): priority_steps gives every
+    # queue one list per level, so sample rows jump the queue. Queues themselves are read round-robin
+    broker_transport_options={'priority_steps': list(range(10))},
+    task_default_priority=5,
+    
     # Improve error reporting
     task_send_sent_event=True,
     task_send_retry_event=True,
@@ -56,9 +78,124 @@ celery_app.conf.update(
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Completions with a deadline and opt-in hedging (LLM_HEDGE=true)
+llm = LLMClient(client, redis.from_url(redis_url))
+
+# Industry analysis for follow-up 1, generated once per industry instead of once per row
+INDUSTRY_CONTEXT = os.getenv("INDUSTRY_CONTEXT", "true").lower() == "true"
+industry_contexts = IndustryContextCache(redis.from_url(redis_url), llm)
+
 # Initialize worker model assigner
 model_assigner = WorkerModelAssigner()
 
+# Per-job task index and other job bookkeeping in Redis
+job_store = JobStore(redis.from_url(redis_url))
+
+# Packed mode: prospects per completion, PACK_SIZE by default or per model via
+# PACK_SIZES="gpt-3.5-turbo=8,gpt-3.5-turbo-16k=20"
+PACK_SIZE = int(os.getenv("PACK_SIZE", 5))
+PACK_SIZES = {
+    model.strip(): int(size)
+    for model, _, size in (item.partition('=') for item in os.getenv("PACK_SIZES", "").split(',') if item.strip())
+}
+MAX_PACK_SIZE = max([PACK_SIZE, *PACK_SIZES.values()])
+# A packed request writes one email per prospect, so each prospect past the first adds this to its deadline
+PACK_ROW_TIMEOUT = float(os.getenv("PACK_ROW_TIMEOUT", 10))
+
+PROMPT_BUILDER_CACHE_SIZE = 128  # jobs per process whose PromptBuilder is kept
+
+# Shared per-model/per-key breaker that parks rows once the daily quota is gone
+quota_breaker = QuotaBreaker(redis.from_url(redis_url), os.getenv("OPENAI_API_KEY"))
+QUOTA_CHECK_INTERVAL = int(os.getenv("QUOTA_CHECK_INTERVAL", 300))  # seconds between checks for reset quota
+
+# Straggler watchdog: rows running longer than STRAGGLER_FACTOR x the job's
+# STRAGGLER_PERCENTILE latency (or on a worker that stopped answering pings) are re-dispatched
+WATCHDOG_INTERVAL = int(os.getenv("WATCHDOG_INTERVAL", 30))
+STRAGGLER_PERCENTILE = float(os.getenv("STRAGGLER_PERCENTILE", 95))
+STRAGGLER_FACTOR = float(os.getenv("STRAGGLER_FACTOR", 2.0))
+STRAGGLER_MIN_SECONDS = float(os.getenv("STRAGGLER_MIN_SECONDS", 60))
+STRAGGLER_MIN_SAMPLES = 20  # finished rows needed before the percentile means anything
+
+# Fair-share scheduling: row tasks wait in per-job backlogs and are fed into their job class's
+# queue, at most FAIR_SHARE_CAPACITY queued or running at once (FAIR_SHARE=false: one chord per job).
+# Without FAIR_SHARE_CAPACITY the capacity is the cluster's worker slots, counted every WORKER_SLOTS_TTL seconds
+FAIR_SHARE = os.getenv("FAIR_SHARE", "true").lower() == "true"
+FAIR_SHARE_CAPACITY = int(os.getenv("FAIR_SHARE_CAPACITY", 0))
+WORKER_SLOTS_TTL = 60
+FALLBACK_WORKER_SLOTS = 8  # used for a feed interval when no worker answers
+FEED_INTERVAL = int(os.getenv("FEED_INTERVAL", 5))  # seconds between feeds besides the one after each row
+
+def worker_slot_count():
+    """Pool processes across the workers that answer, 0 if none do"""
+    try:
+        stats = celery_app.control.inspect(timeout=1.0).stats() or {}
+    except Exception as e:
+        print(f"Worker inspect failed: {e}")
+        return 0
+    return sum(int(worker.get('pool', {}).get('max-concurrency', 1)) for worker in stats.values())
+
+def worker_slots():
+    """Row tasks the cluster runs at once: FAIR_SHARE_CAPACITY, else worker_slot_count() cached in Redis"""
+    if FAIR_SHARE_CAPACITY:
+        return FAIR_SHARE_CAPACITY
+    cached = job_store.redis.get("worker_slots")
+    if cached:
+        return int(cached)
+    slots = worker_slot_count()
+    if not slots:
+        job_store.redis.set("worker_slots", FALLBACK_WORKER_SLOTS, ex=FEED_INTERVAL)
+        return FALLBACK_WORKER_SLOTS
+    job_store.redis.set("worker_slots", slots, ex=WORKER_SLOTS_TTL)
+    return slots
+
+scheduler = FairShareScheduler(redis.from_url(redis_url), worker_slots)
+
+# Workers read the default queue (job control, combines) and the class queues round-robin; how much
+# each class gets is decided by the fair-share feeder, which only keeps a few tasks in these queues
+celery_app.conf.task_queues = [Queue(celery_app.conf.task_default_queue)] + [Queue(queue) for queue in JOB_CLASS_QUEUES.values()]
+
+def queued_task_count():
+    """Row tasks waiting: messages in every queue over all priority levels (kombu keeps one Redis
+    list per level), plus the fair-share backlogs"""
+    steps = celery_app.conf.broker_transport_options['priority_steps']
+    queued = sum(
+        job_store.redis.llen(f"{queue.name}\x06\x16{step}" if step else queue.name)
+        for queue in celery_app.conf.task_queues for step in steps
+    )
+    return queued + sum(job['backlog'] for job in scheduler.snapshot()['jobs'].values())
+
+# Signed job events POSTed to the callback URL given at upload; progress milestones are checked this often
+webhook_notifier = WebhookNotifier(redis.from_url(redis_url))
+WEBHOOK_PROGRESS_INTERVAL = int(os.getenv("WEBHOOK_PROGRESS_INTERVAL", 5))
+
+# Cancelled jobs: row tasks check the job's cancel flag before each API call, and calls in flight
+# every CANCEL_CHECK_INTERVAL seconds, so a cancelled job stops spending within about a second
+CANCEL_CHECK_INTERVAL = 0.5
+
+# Sample-first jobs: sample rows are stratified on these columns (first one present) unless
+# the upload names its own, and run ahead of everything else until the job is approved
+DEFAULT_SAMPLE_COLUMNS = ['industry', 'title', 'job_title', 'role', 'seniority']
+SAMPLE_PRIORITY = 0
+
+celery_app.conf.beat_schedule = {
+    'resume-quota-jobs': {
+        'task': 'tasks.resume_quota_jobs',
+        'schedule': QUOTA_CHECK_INTERVAL,
+    },
+    'watch-stragglers': {
+        'task': 'tasks.watch_stragglers',
+        'schedule': WATCHDOG_INTERVAL,
+    },
+    'feed-row-queues': {
+        'task': 'tasks.feed_row_queues',
+        'schedule': FEED_INTERVAL,
+    },
+    'webhook-progress': {
+        'task': 'tasks.send_webhook_progress',
+        'schedule': WEBHOOK_PROGRESS_INTERVAL,
+    },
+}
+
 # Per-worker rate limiter - allows parallel processing
 worker_last_times = {}
 request_lock = threading.Lock()
@@ -79,53 +216,204 @@ def rate_limited_api_call():
         
         worker_last_times[worker_id] = time.time()
 
+# Steps of a sequence, in generation order; each is checkpointed once generated
+SEQUENCE_STEPS = ['initial_email', 'followup_1', 'followup_2']
+SEQUENCE_STEP_SETTINGS = {'initial_email': (0.8, 200), 'followup_1': (0.7, 200), 'followup_2': (0.8, 300)}  # (temperature, max_tokens)
+
 def update_status(job_id, status, progress, total):
     with open(f"uploads/{job_id}_status.txt", "w") as f:
         f.write(f"{status},{progress},{total}")
+    try:
+        # Queued, never sent from here - a slow receiver must not hold up the job
+        for delivery in webhook_notifier.status_changed(job_id, status, progress, total):
+            deliver_webhook.delay(delivery)
+    except Exception as e:
+        print(f"Could not queue webhook event for job {job_id}: {e}")
+
+def claim_owner(task):
+    """Identifies one execution of a task: a redelivered copy of the message (same task ID) gets a different owner"""
+    return f"{task.request.id}:{task.request.hostname}:{os.getpid()}:{threading.get_ident()}"
+
+class RowClaimed(Exception):
+    """Another execution still holds a row step after every retry; it stores the row"""
+
+def claim_row_step(task, job_id, row_index, step, hedge=False):
+    """Claim a row step before spending on it; if another execution holds it, retry once the claim expires.
+    
+    By then the holder has either stored the row (and the retry returns it) or died.
+    Out of retries, raises RowClaimed: the row is left to the holder, never stored as an error.
+    Hedged re-dispatches (see watch_stragglers) run alongside the original on purpose.
+    """
+    if hedge:
+        return
+    if not job_store.claim_step(job_id, row_index, step, claim_owner(task)):
+        if task.request.retries >= task.max_retries:
+            raise RowClaimed(f"row {row_index} step {step} of job {job_id} is claimed by another execution")
+        claim = job_store.step_claim(job_id, row_index, step)
+        countdown = max(int(claim['expires'] - time.time()), 0) + 1 if claim else 1
+        print(f"Row {row_index} step {step} is claimed by another execution, retrying in {countdown}s")
+        raise task.retry(countdown=countdown)
+
+def finished_row_result(job_id, row_index):
+    """The stored result if this row already finished successfully (e.g. a redelivered message)"""
+    result = job_store.get_row_result(job_id, row_index)
+    if is_successful_result(result):
+        print(f"Row {row_index} already finished, returning stored result")
+        return result
+    return None
+
+def start_row(task, job_id, row_index, row_data):
+    """Register a row execution with the straggler watchdog; returns its start time"""
+    started = time.time()
+    job_store.mark_inflight(job_id, row_index, {
+        "task_id": task.request.id,
+        "host": task.request.hostname,
+        "started": started,
+        "row_data": row_data,
+    })
+    return started
+
+def store_row_result(job_id, row_index, result, started):
+    """Save a row's result; if another execution (original or hedge) already succeeded, keep that one"""
+    stored_result = finished_row_result(job_id, row_index)
+    if stored_result:
+        return stored_result
+    result.setdefault("prompt_version", PROMPT_VERSION)
+    job_store.save_row_result(job_id, row_index, result)
+    job_store.finish_inflight(job_id, row_index, time.time() - started)
+    return result
+
+def park_row(job_id, row_index, reset_at):
+    """Defer a row until quota resets instead of calling the API; resume_quota_jobs picks it up"""
+    job_store.defer_row(job_id, row_index, reset_at)
+    print(f"Row {row_index} parked until quota resets")
+    return {"index": row_index, "job_id": job_id, "status": "deferred", "reset_at": reset_at}
+
+def cancel_check(job_id):
+    """should_cancel for llm.complete: whether the job was cancelled, read at most every CANCEL_CHECK_INTERVAL"""
+    checked = {"at": 0, "cancelled": False}
+    def should_cancel():
+        if not checked["cancelled"] and time.time() - checked["at"] >= CANCEL_CHECK_INTERVAL:
+            checked.update(at=time.time(), cancelled=job_store.is_cancelled(job_id))
+        return checked["cancelled"]
+    return should_cancel
+
+def stop_if_cancelled(job_id):
+    """Raise CallCancelled instead of spending on a cancelled job"""
+    if job_store.is_cancelled(job_id):
+        raise CallCancelled(f"job {job_id} was cancelled")
+
+def claimed_row(job_id, row_index, error):
+    """A row another execution is generating: left for it to store"""
+    print(f"{error}; leaving the row to it")
+    return {"index": row_index, "job_id": job_id, "status": "claimed"}
+
+def cancelled_row(job_id, row_index):
+    """A row of a cancelled job: dropped without calling the API or storing a result"""
+    print(f"Row {row_index} of cancelled job {job_id} dropped")
+    return {"index": row_index, "job_id": job_id, "status": "cancelled"}
+
+def is_successful_result(result):
+    """A stored row result that does not need generating again"""
+    if not isinstance(result, dict) or result.get('status') != 'success':
+        return False
+    result_text = ''.join(str(result.get(field, '')) for field in ('email', 'initial_email', 'followup_1', 'followup_2'))
+    return "DAILY_LIMIT_HIT" not in result_text
+
+@functools.lru_cache(maxsize=PROMPT_BUILDER_CACHE_SIZE)
+def prompt_builder_for(job_id):
+    """The job's PromptBuilder, with the column lists given at upload (built once per process,
+    the least recently used jobs' builders are dropped first)"""
+    meta = job_store.get_job_meta(job_id)
+    return PromptBuilder(meta.get('include_columns'), meta.get('exclude_columns'))
+
+def single_email_messages(row_data, builder):
+    """System + user messages for one single-mode email"""
+    return render(
+        "cold_email",
+        prospect_info=builder.prospect_info(row_data),
+        first_name=builder.value(row_data, 'first_name', 'name', default='there'),
+    )
+
+def packed_email_messages(rows, builder):
+    """System + user messages asking for one email per prospect in rows ([row_index, row_data] pairs), as JSON"""
+    prospects = '\n\n'.join(
+        f"Prospect {row_index}:\n" + builder.prospect_info(row_data)
+        for row_index, row_data in rows
+    )
+    return render("cold_email_packed", count=len(rows), prospects=prospects)
+
+def parse_packed_emails(text):
+    """{row_index: email} from a packed completion; malformed or missing entries are left out"""
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        entries = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    emails = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict) or not isinstance(entry.get('email'), str) or not entry['email'].strip():
+            continue
+        try:
+            emails[int(entry.get('id'))] = entry['email'].strip()
+        except (TypeError, ValueError):
+            continue
+    return emails
+
+def sequence_step_messages(step, row_data, builder, job_id, model):
+    """Messages for one step of a prospect's sequence (one of SEQUENCE_STEPS)"""
+    first_name = builder.value(row_data, 'first_name', 'name', default='there')
+    company_name = builder.value(row_data, 'organization_name', 'company', default='your company')
+    if step == 'initial_email':
+        return render("cold_email", prospect_info=builder.prospect_info(row_data), first_name=first_name)
+    if step == 'followup_2':
+        return render("followup_2", first_name=first_name, company_name=company_name)
+    
+    # Follow-up 1 recommends AI services for the prospect's industry
+    industry = builder.value(row_data, 'industry', default='your industry')
+    if INDUSTRY_CONTEXT:
+        # With the industry worked out once per job, this call only personalizes
+        try:
+            return render(
+                "followup_1_context", first_name=first_name, company_name=company_name,
+                industry=industry, industry_context=industry_contexts.get(job_id, industry, model),
+            )
+        except Exception as context_error:
+            if is_quota_exhausted(context_error):
+                raise
+            print(f"Industry context unavailable ({context_error}), using the full follow-up prompt")
+    return render("followup_1", first_name=first_name, company_name=company_name, industry=industry)
 
 @celery_app.task(bind=True, max_retries=5, ignore_result=False)
-def process_single_email(self, row_data, row_index, job_id):
+def process_single_email(self, row_data, row_index, job_id, hedge=False):
     """Process a single email - this can run in parallel"""
+    if job_store.is_cancelled(job_id):
+        return cancelled_row(job_id, row_index)
+    stored_result = finished_row_result(job_id, row_index)
+    if stored_result:
+        return stored_result
+    # Claimed before the row is registered, so an execution that is refused leaves the holder's entry alone
+    try:
+        claim_row_step(self, job_id, row_index, 'email', hedge)
+    except RowClaimed as e:
+        return claimed_row(job_id, row_index, e)
+    started = start_row(self, job_id, row_index, row_data)
+    
     try:
-        prospect_info = '\n'.join([f"{col}: {val}" for col, val in row_data.items()])
-        
-        # Get first_name for the prompt
-        first_name = row_data.get('first_name') or row_data.get('name', 'there')
-        
-        user_prompt = f"""
-Write a natural, conversational cold email using this contact information:
----
-{prospect_info}
----
-Write like you're a real person reaching out - natural, authentic, non-promotional tone.
-Key guidelines:
-- Start casually: "Hey {first_name}", "Hi {first_name}", "{first_name}, hope you're well"
-- Mention you work with AI automation in a casual way.
-- Reference their specific situation when possible.
-- Keep it conversational and authentic.
-- End with "if you're open to a chat, let me know - if not, all good." NO apologetic language like "totally fine", "no pressure", "totally understand", etc.
-- Use proper spacing with blank lines between paragraphs for readability.
-- NO signatures, names, or formal closings.
-- 50-70 words max.
-Make each email sound completely different - vary greetings, structure, tone, and phrasing naturally.
-"""
-        
-        system_prompt = """
-You are an AI assistant writing a cold email. The user will provide you with information about a prospect. Your job is to write a short, casual email FROM a person who works in "AI automation" TO that prospect.
-It is critical that you understand this role. You are the sender. The prospect information is for the recipient. Do not get confused and act as if you work for the prospect's company.
-Follow all formatting rules from the user, especially the negative constraints about what NOT to include. The required output format is: Greeting\\n\\nMain Content\\n\\nCTA\\n\\nFallback with smiley.
-
-CRITICAL: Avoid ALL spam trigger words including: free, guaranteed, act now, click here, limited time, urgent, instant, promise, risk-free, money back, get paid, earn money, cash, income, deal, promotion, sign up, call now, order now, exclusive, miracle, incredible, satisfaction guaranteed, once in lifetime, double your, 100% free, best price, lowest price, giveaway, prize, bonus, and 150+ other spam words. Use natural, conversational language instead.
-
-TONE: Be confident and direct. End with "if not, all good" ONLY. Do NOT add any of these apologetic phrases: "totally fine", "no pressure", "no worries", "totally understand", "totally get it", "I understand", "completely understand", or any similar accommodating language. Be direct and confident.
-"""
-        
         # Rate limit API calls
         rate_limited_api_call()
+        stop_if_cancelled(job_id)
         
         # Get model assigned to this worker
         model = model_assigner.get_worker_model()
         
+        # Quota already gone for this model/key - don't spend a request finding out again
+        reset_at = quota_breaker.open_until(model)
+        if reset_at:
+            return park_row(job_id, row_index, reset_at)
+        
         try:
             # Log which worker and model we're using
             worker_info = f"Worker {os.getpid()}"
@@ -133,62 +421,183 @@ TONE: Be confident and direct. End with "if not, all good" ONLY. Do NOT add any
                 worker_info = self.request.hostname
             print(f"[{worker_info}] Using model: {model} for row {row_index}")
             
-            completion = client.chat.completions.create(
+            usage = {}
+            email_text = llm.complete(
                 model=model,  # Use worker-assigned model
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=single_email_messages(row_data, prompt_builder_for(job_id)),
                 temperature=0.8,
                 max_tokens=200,
-            )
+                should_cancel=cancel_check(job_id),
+                usage=usage,
+            ).strip()
                 
         except Exception as api_error:
-            if "429" in str(api_error) or "rate_limit" in str(api_error).lower():
-                # Check if it's daily limit (don't retry if daily limit hit)
-                if "requests per day" in str(api_error) and self.request.retries >= 2:
-                    # Daily limit hit - save what we have so far
-                    email_text = f"DAILY_LIMIT_HIT: {str(api_error)}"
-                else:
-                    # Regular rate limit - retry with exponential backoff
-                    raise self.retry(exc=api_error, countdown=10 + (2 ** self.request.retries))
-            else:
-                raise
-        
-        if 'completion' in locals():
-            email_text = completion.choices[0].message.content.strip()
-        # email_text already set if daily limit hit
+            if is_quota_exhausted(api_error):
+                # Daily limit hit - open the breaker so queued rows park instead of retrying
+                return park_row(job_id, row_index, quota_breaker.trip(model, api_error))
+            if "429" in str(api_error) or "rate_limit" in str(api_error).lower() or isinstance(api_error, TimeoutError):
+                # Regular rate limit, or no answer within LLM_TIMEOUT - retry with exponential backoff
+                raise self.retry(exc=api_error, countdown=10 + (2 ** self.request.retries))
+            raise
         
         # Return the result with row index for ordering
-        return {
+        result = {
             "index": row_index,
+            "job_id": job_id,
             "row_data": row_data,
             "email": email_text,
             "status": "success",
-            "model_used": model if 'model' in locals() else "none"
+            "model_used": model if 'model' in locals() else "none",
+            "prompt_tokens": usage.get('prompt_tokens')
         }
+        return store_row_result(job_id, row_index, result, started)
         
+    except Retry:
+        raise
+    except CallCancelled:
+        return cancelled_row(job_id, row_index)
     except Exception as e:
-        return {
+        result = {
             "index": row_index,
+            "job_id": job_id,
             "row_data": row_data,
             "email": f"ERROR: {str(e)}",
             "status": "error"
         }
+        return store_row_result(job_id, row_index, result, started)
     finally:
-        # Update progress counter in Redis (thread-safe)
-        redis_key = f"progress_{job_id}"
-        from celery import current_app
-        current_app.backend.client.incr(redis_key)
+        # Progress is counted by save_row_result, once per row
+        job_store.finish_inflight(job_id, row_index)
+        job_store.release_claims(job_id, row_index, ['email'], claim_owner(self))
 
 
 
+@celery_app.task(bind=True, max_retries=5, ignore_result=False)
+def process_packed_emails(self, rows, job_id):
+    """Packed mode: single emails for several prospects ([row_index, row_data] pairs) per completion.
+    
+    Rows are sent PACK_SIZES[model] at a time; any the reply leaves out or
+    mangles are generated on their own, and so is every row of a request
+    that times out or fails for a reason other than quota or rate limits.
+    Results are stored per row exactly like process_single_email's.
+    """
+    if job_store.is_cancelled(job_id):
+        print(f"Pack of {len(rows)} rows of cancelled job {job_id} dropped")
+        return {"job_id": job_id, "rows": len(rows), "status": "cancelled"}
+    pending = [(row_index, row_data) for row_index, row_data in rows if finished_row_result(job_id, row_index) is None]
+    # Rows this execution claimed, with their start times; only these are its to store, finish and release
+    started = {}
+    model = "none"
+    
+    try:
+        model = model_assigner.get_worker_model()
+        size = PACK_SIZES.get(model, PACK_SIZE)
+        for i in range(0, len(pending), size):
+            # Rows another execution is already working on are left to it
+            batch = [(row_index, row_data) for row_index, row_data in pending[i:i + size]
+                     if job_store.claim_step(job_id, row_index, 'email', claim_owner(self))]
+            if not batch:
+                continue
+            for row_index, row_data in batch:
+                started[row_index] = start_row(self, job_id, row_index, row_data)
+            
+            reset_at = quota_breaker.open_until(model)
+            if reset_at:
+                for row_index, _ in batch:
+                    park_row(job_id, row_index, reset_at)
+                continue
+            
+            rate_limited_api_call()
+            stop_if_cancelled(job_id)
+            print(f"[{self.request.hostname}] Using model: {model} for {len(batch)} packed rows")
+            usage = {}
+            try:
+                emails = parse_packed_emails(llm.complete(
+                    model=model,
+                    messages=packed_email_messages(batch, prompt_builder_for(job_id)),
+                    temperature=0.8,
+                    max_tokens=250 * len(batch),
+                    deadline=LLM_TIMEOUT + PACK_ROW_TIMEOUT * (len(batch) - 1),
+                    should_cancel=cancel_check(job_id),
+                    usage=usage,
+                ))
+            except CallCancelled:
+                raise
+            except Exception as api_error:
+                if is_quota_exhausted(api_error):
+                    reset_at = quota_breaker.trip(model, api_error)
+                    for row_index, _ in batch:
+                        park_row(job_id, row_index, reset_at)
+                    continue
+                if "429" in str(api_error) or "rate_limit" in str(api_error).lower():
+                    raise
+                # Timed out or failed as a whole: each row of the batch gets its own request below
+                print(f"Packed request for {len(batch)} rows failed ({api_error}), generating them one by one")
+                emails = {}
+            
+            for row_index, row_data in batch:
+                # Each row is charged its share of the packed request
+                row_usage = {'prompt_tokens': round(usage.get('prompt_tokens', 0) / len(batch))}
+                result = {"index": row_index, "job_id": job_id, "row_data": row_data, "model_used": model}
+                email_text = emails.get(row_index)
+                if email_text is None:
+                    print(f"Packed reply had no usable email for row {row_index}, generating it on its own")
+                    try:
+                        rate_limited_api_call()
+                        stop_if_cancelled(job_id)
+                        email_text = llm.complete(
+                            model=model,
+                            messages=single_email_messages(row_data, prompt_builder_for(job_id)),
+                            temperature=0.8,
+                            max_tokens=200,
+                            should_cancel=cancel_check(job_id),
+                            usage=row_usage,
+                        ).strip()
+                    except Exception as row_error:
+                        if (isinstance(row_error, (CallCancelled, TimeoutError))
+                                or "429" in str(row_error) or "rate_limit" in str(row_error).lower()):
+                            raise
+                        result.update({"email": f"ERROR: {str(row_error)}", "status": "error"})
+                if email_text is not None:
+                    result.update({"email": email_text, "status": "success"})
+                result["prompt_tokens"] = row_usage['prompt_tokens']
+                store_row_result(job_id, row_index, result, started[row_index])
+        
+        return {"job_id": job_id, "rows": len(rows), "model_used": model}
+        
+    except Retry:
+        raise
+    except CallCancelled:
+        print(f"Pack of cancelled job {job_id} stopped; rows without a result are dropped")
+        return {"job_id": job_id, "rows": len(rows), "status": "cancelled"}
+    except Exception as e:
+        if (("429" in str(e) or "rate_limit" in str(e).lower() or isinstance(e, TimeoutError))
+                and self.request.retries < self.max_retries):
+            # Rows already stored are skipped when the pack runs again
+            raise self.retry(exc=e, countdown=10 + (2 ** self.request.retries))
+        # store_row_result keeps any success already stored, e.g. by the watchdog's hedge of a row
+        for row_index, row_data in pending:
+            if row_index in started:
+                store_row_result(job_id, row_index, {
+                    "index": row_index,
+                    "job_id": job_id,
+                    "row_data": row_data,
+                    "email": f"ERROR: {str(e)}",
+                    "status": "error"
+                }, started[row_index])
+        return {"job_id": job_id, "rows": len(rows), "error": str(e)}
+    finally:
+        for row_index in started:
+            job_store.finish_inflight(job_id, row_index)
+            job_store.release_claims(job_id, row_index, ['email'], claim_owner(self))
+
 @celery_app.task(bind=True, max_retries=3, default_retry_delay=30, ignore_result=False)
-def process_email_sequence(self, row_data, row_index, job_id):
+def process_email_sequence(self, row_data, row_index, job_id, hedge=False):
     """Generate complete email sequence: initial + 2 follow-ups"""
     # Ensure we always return a valid dictionary structure
     default_result = {
         "index": row_index,
+        "job_id": job_id,
         "row_data": row_data,
         "initial_email": "ERROR: Task failed to execute",
         "followup_1": "SKIPPED: Initial failed",
@@ -197,321 +606,284 @@ def process_email_sequence(self, row_data, row_index, job_id):
         "model_used": "none"
     }
     
+    if job_store.is_cancelled(job_id):
+        return cancelled_row(job_id, row_index)
+    stored_result = finished_row_result(job_id, row_index)
+    if stored_result:
+        return stored_result
+    # Steps already generated by an earlier attempt of this task (retries resume from here)
+    completed_steps = job_store.load_steps(job_id, row_index, SEQUENCE_STEPS)
+    # The next step is claimed before the row is registered, so an execution that is refused
+    # leaves the holder's entry alone
+    try:
+        claim_row_step(self, job_id, row_index, next(step for step in SEQUENCE_STEPS if step not in completed_steps), hedge)
+    except RowClaimed as e:
+        return claimed_row(job_id, row_index, e)
+    started = start_row(self, job_id, row_index, row_data)
+    
     try:
         print(f"🚀 PROCESS_EMAIL_SEQUENCE CALLED for row {row_index}")
-        prospect_info = '\n'.join([f"{col}: {val}" for col, val in row_data.items()])
-        first_name = row_data.get('first_name') or row_data.get('name', 'there')
-        company_name = row_data.get('organization_name') or row_data.get('company', 'your company')
-        industry = row_data.get('industry', 'your industry')
+        builder = prompt_builder_for(job_id)
+        usage = {}
         
         # Get model assigned to this worker
         model = model_assigner.get_worker_model()
         
-        # STEP 1: Generate initial email
-        user_prompt_initial = f"""
-Write a natural, conversational cold email using this contact information:
----
-{prospect_info}
----
-Write like you're a real person reaching out - natural, authentic, non-promotional tone.
-Key guidelines:
-- Start casually: "Hey {first_name}", "Hi {first_name}", "{first_name}, hope you're well"
-- Mention you work with AI automation in a casual way.
-- Reference their specific situation when possible.
-- Keep it conversational and authentic.
-- End with "if you're open to a chat, let me know - if not, all good." NO apologetic language like "totally fine", "no pressure", "totally understand", etc.
-- Use proper spacing with blank lines between paragraphs for readability.
-- NO signatures, names, or formal closings.
-- 50-70 words max.
-Make each email sound completely different - vary greetings, structure, tone, and phrasing naturally.
-"""
-        
-        system_prompt_initial = """
-You are an AI assistant writing a cold email. The user will provide you with information about a prospect. Your job is to write a short, casual email FROM a person who works in "AI automation" TO that prospect.
-It is critical that you understand this role. You are the sender. The prospect information is for the recipient. Do not get confused and act as if you work for the prospect's company.
-Follow all formatting rules from the user, especially the negative constraints about what NOT to include. The required output format is: Greeting\\n\\nMain Content\\n\\nCTA\\n\\nFallback with smiley.
-
-CRITICAL: Avoid ALL spam trigger words including: free, guaranteed, act now, click here, limited time, urgent, instant, promise, risk-free, money back, get paid, earn money, cash, income, deal, promotion, sign up, call now, order now, exclusive, miracle, incredible, satisfaction guaranteed, once in lifetime, double your, 100% free, best price, lowest price, giveaway, prize, bonus, and 150+ other spam words. Use natural, conversational language instead.
-
-TONE: Be confident and direct. End with "if not, all good" ONLY. Do NOT add any of these apologetic phrases: "totally fine", "no pressure", "no worries", "totally understand", "totally get it", "I understand", "completely understand", or any similar accommodating language. Be direct and confident.
-"""
+        if completed_steps:
+            print(f"Row {row_index}: resuming after {', '.join(completed_steps)}")
         
-        # Rate limit API calls
-        rate_limited_api_call()
-        
-        completion_initial = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt_initial},
-                {"role": "user", "content": user_prompt_initial}
-            ],
-            temperature=0.8,
-            max_tokens=200,
-        )
-        initial_email = completion_initial.choices[0].message.content.strip()
-        
-        # STEP 2: Generate first follow-up with intelligent AI service recommendations
-        user_prompt_followup1 = f"""
-Write a follow-up email to {first_name} at {company_name}.
-
-Start with: "Hey {first_name}, hope you're good. Just wanted to shoot you this quick email with a little more info about how we would be able to help."
-
-Based on {company_name} being in {industry}, intelligently mention 2-3 of our AI services that would specifically benefit their type of business:
-
-1. AI chatbots - Think about what this industry needs: customer support automation, lead qualification, technical assistance, appointment booking, etc. Mention the specific use case that makes sense for {industry} businesses.
-
-2. Automated lead generation - Consider what type of leads this industry needs and how AI could identify and qualify prospects specifically for {industry} companies.
-
-3. Database reactivation campaigns - AI systems that re-engage dormant customers with personalized outreach relevant to {industry} businesses.
-
-Present these services as solutions that directly address what {industry} companies like {company_name} typically need, not generic AI mentions. Be specific about the value for their industry.
-
-End with: "Happy to hop on a call if this sounds useful - if not, all good!"
-
-60-80 words. NO signatures.
-"""
-        
-        rate_limited_api_call()
+        reset_at = quota_breaker.open_until(model)
+        if reset_at:
+            return park_row(job_id, row_index, reset_at)
         
-        system_prompt_followup1 = """
-You are an AI automation expert writing a follow-up email. Your job is to intelligently analyze the prospect's industry and recommend specific AI services that would genuinely benefit their type of business.
-
-Think like a business consultant: What challenges does this industry typically face? What processes could be automated? What kind of customer interactions do they have? What types of leads do they need?
-
-Be specific and industry-relevant, not generic. Don't just say "AI chatbots" - explain how chatbots would specifically help THEIR type of business. Show you understand their industry.
-
-Follow the exact format and length requirements. Be conversational and authentic.
-"""
-        
-        completion_followup1 = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt_followup1},
-                {"role": "user", "content": user_prompt_followup1}
-            ],
-            temperature=0.7,
-            max_tokens=200,
-        )
-        followup_1_email = completion_followup1.choices[0].message.content.strip()
-        
-        # STEP 3: Generate second follow-up
-        user_prompt_followup2 = f"""
-Write a final follow-up email to {first_name} at {company_name}.
-
-Start with: "{first_name}, one more try?"
-
-Say you'll assume they're not interested if you don't hear back and will leave them alone. Add some humor like "you probably deserve a break from the grind."
-
-End with a short playful P.S.
-
-50-70 words. NO signatures.
-"""
-        
-        rate_limited_api_call()
-        
-        completion_followup2 = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are writing a final follow-up email. Follow the exact format provided. Add humor and personality. NO signatures."},
-                {"role": "user", "content": user_prompt_followup2}
-            ],
-            temperature=0.8,
-            max_tokens=300,
-        )
-        followup_2_email = completion_followup2.choices[0].message.content.strip()
+        # STEP 1: initial email, STEP 2: first follow-up with intelligent AI service
+        # recommendations, STEP 3: second follow-up
+        for step in SEQUENCE_STEPS:
+            if step in completed_steps:
+                continue
+            claim_row_step(self, job_id, row_index, step, hedge)
+            stop_if_cancelled(job_id)
+            messages = sequence_step_messages(step, row_data, builder, job_id, model)
+            # Rate limit API calls
+            rate_limited_api_call()
+            
+            temperature, max_tokens = SEQUENCE_STEP_SETTINGS[step]
+            completed_steps[step] = llm.complete(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                should_cancel=cancel_check(job_id),
+                usage=usage,
+            ).strip()
+            if step != SEQUENCE_STEPS[-1]:
+                job_store.save_step(job_id, row_index, step, completed_steps[step])
+        initial_email, followup_1_email, followup_2_email = (completed_steps[step] for step in SEQUENCE_STEPS)
         
         # Return complete sequence
-        return {
+        result = {
             "index": row_index,
+            "job_id": job_id,
             "row_data": row_data,
             "initial_email": initial_email,
             "followup_1": followup_1_email,
             "followup_2": followup_2_email,
             "status": "success",
-            "model_used": model
+            "model_used": model,
+            "prompt_tokens": usage['prompt_tokens'] if usage else None
         }
-        
+        result = store_row_result(job_id, row_index, result, started)
+        job_store.clear_steps(job_id, row_index, SEQUENCE_STEPS)
+        return result
+        
+    except Retry:
+        raise
+    except RowClaimed as e:
+        return claimed_row(job_id, row_index, e)
+    except CallCancelled:
+        # Steps already generated stay checkpointed in case the job is resumed
+        return cancelled_row(job_id, row_index)
     except Exception as e:
         # Log the full error for debugging
         print(f"ERROR in process_email_sequence row {row_index}: {str(e)}")
         
+        # Daily limit hit - park the row (its finished steps stay checkpointed)
+        if is_quota_exhausted(e) and 'model' in locals():
+            return park_row(job_id, row_index, quota_breaker.trip(model, e))
+        
         # Check if this is a retryable error
         if ("429" in str(e) or "rate_limit" in str(e).lower() or 
             "timeout" in str(e).lower() or "connection" in str(e).lower()) and self.request.retries < 3:
             # Retry with exponential backoff
             raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
         
-        # Return detailed error information
+        # Return detailed error information, keeping any steps that did succeed
         error_result = default_result.copy()
         error_result.update({
             "initial_email": f"ERROR: {str(e)[:200]}...",  # Truncate long errors
             "error_type": type(e).__name__,
             "retry_count": self.request.retries
         })
-        return error_result
+        completed_steps = locals().get('completed_steps') or {}
+        if completed_steps:
+            error_result.update(completed_steps)
+            failed_step = next((step for step in SEQUENCE_STEPS if step not in completed_steps), None)
+            if failed_step:
+                error_result[failed_step] = f"ERROR: {str(e)[:200]}..."
+                for step in SEQUENCE_STEPS[SEQUENCE_STEPS.index(failed_step) + 1:]:
+                    error_result[step] = f"SKIPPED: {failed_step} failed"
+            error_result["model_used"] = model
+        return store_row_result(job_id, row_index, error_result, started)
     finally:
-        # Update progress counter in Redis (count as 1 sequence processed)
-        redis_key = f"progress_{job_id}"
-        from celery import current_app
-        current_app.backend.client.incr(redis_key)
+        # Progress is counted by save_row_result, once per sequence
+        job_store.finish_inflight(job_id, row_index)
+        job_store.release_claims(job_id, row_index, SEQUENCE_STEPS, claim_owner(self))
+
+SHARD_MAX_RETRIES = 2  # attempts at a shard workbook after the first
+SHARD_RETRY_DELAY = 30  # seconds
+
+def save_results(job_id, columns, make_rows, row_count, final_status, final_progress, total_rows):
+    """Write the result file(s) and publish the job's final status.
+    
+    Results over EXPORT_SHARD_ROWS rows are split into several workbooks that
+    are written in parallel; the status is published once they all exist.
+    """
+    if row_count <= EXPORT_SHARD_ROWS:
+        output_file = write_result_file(job_id, columns, make_rows)
+        update_status(job_id, final_status, final_progress, total_rows)
+        return output_file
+    
+    jsonl_file, shard_offsets = write_row_store(job_id, columns, make_rows())
+    update_status(job_id, "WRITING_SHARDS", final_progress, total_rows)
+    shard_tasks = [
+        write_result_shard.s(job_id, shard_number, offset, EXPORT_SHARD_ROWS)
+        for shard_number, offset in enumerate(shard_offsets)
+    ]
+    chord(shard_tasks)(finalize_sharded_result.s(job_id, final_status, final_progress, total_rows))
+    return jsonl_file
+
+@celery_app.task(bind=True, max_retries=SHARD_MAX_RETRIES, ignore_result=False)
+def write_result_shard(self, job_id, shard_number, offset, row_count):
+    """Write one workbook of an oversized result, retrying a failed write"""
+    try:
+        return {"status": "SUCCESS", "shard": shard_number, "file": write_shard(job_id, shard_number, offset, row_count)}
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            print(f"Shard {shard_number + 1} failed for {job_id} ({e}), retrying")
+            raise self.retry(exc=e, countdown=SHARD_RETRY_DELAY)
+        print(f"Shard {shard_number + 1} failed for {job_id} after {self.request.retries + 1} attempts: {e}")
+        return {"status": "FAILURE", "shard": shard_number, "error": str(e)}
+
+@celery_app.task(ignore_result=False)
+def finalize_sharded_result(shard_results, job_id, final_status, final_progress, total_rows):
+    """Record which shard workbooks exist, then publish the final status.
+    
+    If any shard could not be written the status becomes
+    SHARDS_FAILED_<missing>_OF_<shards> instead, and the manifest lists the
+    missing shard numbers (1-based), so the workbooks are never served incomplete.
+    """
+    shard_files = [result['file'] for result in shard_results if result.get('status') == 'SUCCESS']
+    missing_shards = [result['shard'] + 1 for result in shard_results if result.get('status') != 'SUCCESS']
+    with open(f"uploads/result_{job_id}_shards.json", "w") as f:
+        json.dump({"files": shard_files, "rows_per_shard": EXPORT_SHARD_ROWS,
+                   "shard_count": len(shard_results), "missing_shards": missing_shards, "job_status": final_status}, f)
+    
+    if missing_shards:
+        print(f"Shard workbooks {missing_shards} failed for {job_id}; the JSONL/CSV exports are complete")
+        final_status = f"SHARDS_FAILED_{len(missing_shards)}_OF_{len(shard_results)}"
+    update_status(job_id, final_status, final_progress, total_rows)
+    return {"status": "SUCCESS" if not missing_shards else "PARTIAL", "files": shard_files, "missing_shards": missing_shards}
+
+def validate_sequence_result(result, i):
+    """Normalise one sequence result; None/non-dict results become error placeholders"""
+    # Handle None or empty results
+    if result is None:
+        print(f"WARNING: Task {i} returned None")
+        error = "Task returned None"
+    # Handle non-dict results
+    elif not isinstance(result, dict):
+        print(f"WARNING: Task {i} returned non-dict: {type(result)} - {result}")
+        error = f"Non-dict result: {type(result)}"
+    else:
+        # Validate required fields
+        required_fields = ['index', 'row_data', 'initial_email', 'followup_1', 'followup_2', 'status']
+        missing_fields = [field for field in required_fields if field not in result]
+        if not missing_fields:
+            return result
+        
+        print(f"WARNING: Task {i} missing fields: {missing_fields}")
+        # Create a default result for missing fields
+        return {
+            "index": result.get('index', i),
+            "row_data": result.get('row_data', {}),
+            "initial_email": result.get('initial_email', f"ERROR: Missing fields {missing_fields}"),
+            "followup_1": result.get('followup_1', "SKIPPED: Task incomplete"),
+            "followup_2": result.get('followup_2', "SKIPPED: Task incomplete"),
+            "status": "error",
+            "model_used": result.get('model_used', 'unknown')
+        }
+    
+    # For completely invalid results, create placeholder entries
+    return {
+        "index": i,
+        "row_data": {"error": "Task failed completely"},
+        "initial_email": f"ERROR: {error}",
+        "followup_1": "SKIPPED: Task failed",
+        "followup_2": "SKIPPED: Task failed",
+        "status": "error",
+        "model_used": "none"
+    }
 
 @celery_app.task(ignore_result=False)
 def combine_sequence_results(results, job_id, total_rows):
-    """Combine sequence results (initial + 2 follow-ups) into final Excel file"""
+    """Combine sequence results (initial + 2 follow-ups) into final Excel file
+    
+    With results=None (how the chord calls it) rows are read from the job's
+    Redis row store. Either way they go through index-sorted runs spilled to
+    disk and a k-way merge, so memory stays flat however big the job is.
+    """
+    if job_store.is_cancelled(job_id):
+        print(f"Job {job_id} was cancelled, not combining")
+        return {"status": "CANCELLED"}
+    if results is None and not job_store.claim_finalize(job_id):
+        print(f"Job {job_id} was already combined, skipping")
+        return {"status": "SKIPPED", "reason": "already combined"}
+    
     try:
-        # Handle case where results is None or empty
-        if results is None:
-            results = []
-            print("🔥 COMBINE_SEQUENCE_RESULTS WARNING: results is None, using empty list")
-        elif not isinstance(results, list):
+        if results is not None and not isinstance(results, list):
             print(f"🔥 COMBINE_SEQUENCE_RESULTS WARNING: results is not a list: {type(results)}")
             results = [results] if results else []
-        
-        print(f"🔥 COMBINE_SEQUENCE_RESULTS CALLED: Combining sequence results from {len(results)} tasks")
-        
-        # Robust result filtering and validation
-        valid_results = []
-        invalid_results = []
-        
-        for i, result in enumerate(results):
-            # Handle None or empty results
-            if result is None:
-                print(f"WARNING: Task {i} returned None")
-                invalid_results.append({"index": i, "error": "Task returned None"})
-                continue
+        source = job_store.iter_all_row_results(job_id) if results is None else results
+        
+        with SortedRuns() as runs:
+            # One pass over the results: validate, collect columns, spill sorted runs
+            source_columns = {}
+            optional_columns = set()
+            for i, result in enumerate(source):
+                result = validate_sequence_result(result, i)
+                if isinstance(result.get('row_data'), dict):
+                    source_columns.update(dict.fromkeys(result['row_data']))
+                optional_columns.update(column for column in ('error_type', 'retry_count', 'prompt_tokens', 'prompt_version') if column in result)
+                runs.add(result)
             
-            # Handle non-dict results
-            if not isinstance(result, dict):
-                print(f"WARNING: Task {i} returned non-dict: {type(result)} - {result}")
-                invalid_results.append({"index": i, "error": f"Non-dict result: {type(result)}"})
-                continue
+            # Counted on the merged runs, where a row the scan returned twice appears once
+            row_count = successful_sequences = 0
+            for result in runs:
+                row_count += 1
+                successful_sequences += result.get('status') == 'success'
+            
+            print(f"🔥 COMBINE_SEQUENCE_RESULTS CALLED: Combining sequence results from {row_count} tasks in {len(runs.run_files) or 1} sorted runs")
+            missing_rows = max(total_rows - row_count, 0)
+            if missing_rows:
+                print(f"WARNING: {missing_rows} rows have no stored result")
+            error_sequences = row_count - successful_sequences + missing_rows
+            
+            # Stream rows straight into the result file (Excel with CSV fallback)
+            output_columns = list(SEQUENCE_OUTPUT_COLUMNS) + [column for column in ('error_type', 'retry_count', 'prompt_tokens', 'prompt_version') if column in optional_columns]
+            columns = output_row_columns(source_columns, output_columns)
             
-            # Validate required fields
-            required_fields = ['index', 'row_data', 'initial_email', 'followup_1', 'followup_2', 'status']
-            missing_fields = [field for field in required_fields if field not in result]
+            # Final status with detailed reporting
+            print(f"Final stats: {successful_sequences} successful, {error_sequences} errors, {row_count} total rows")
             
-            if missing_fields:
-                print(f"WARNING: Task {i} missing fields: {missing_fields}")
-                # Create a default result for missing fields
-                fixed_result = {
-                    "index": result.get('index', i),
-                    "row_data": result.get('row_data', {}),
-                    "initial_email": result.get('initial_email', f"ERROR: Missing fields {missing_fields}"),
-                    "followup_1": result.get('followup_1', "SKIPPED: Task incomplete"),
-                    "followup_2": result.get('followup_2', "SKIPPED: Task incomplete"),
-                    "status": "error",
-                    "model_used": result.get('model_used', 'unknown')
-                }
-                valid_results.append(fixed_result)
+            if successful_sequences == total_rows:
+                final_status, final_progress = "SUCCESS", total_rows
+            elif successful_sequences > 0:
+                final_status, final_progress = f"PARTIAL_{successful_sequences}_OF_{total_rows}", row_count
             else:
-                valid_results.append(result)
-        
-        # Log recovery stats
-        print(f"Result validation: {len(valid_results)} valid, {len(invalid_results)} invalid")
-        
-        # For completely invalid results, create placeholder entries
-        for invalid in invalid_results:
-            placeholder = {
-                "index": invalid['index'],
-                "row_data": {"error": "Task failed completely"},
-                "initial_email": f"ERROR: {invalid['error']}",
-                "followup_1": "SKIPPED: Task failed",
-                "followup_2": "SKIPPED: Task failed",
-                "status": "error",
-                "model_used": "none"
-            }
-            valid_results.append(placeholder)
-        
-        # Sort results by index to maintain original order
-        sorted_results = sorted(valid_results, key=lambda x: x.get('index', 0))
-        
-        # Build final dataframe with enhanced error handling
-        final_data = []
-        successful_sequences = 0
-        error_sequences = 0
-        
-        for result in sorted_results:
-            try:
-                # Safely copy row data
-                row_data = result.get('row_data', {})
-                if isinstance(row_data, dict):
-                    row = row_data.copy()
-                else:
-                    row = {"original_data": str(row_data)}
-                
-                # Debug: print what keys are in the result
-                print(f"Sequence result keys: {list(result.keys())}")
-                
-                # Clean email text to avoid Excel character issues
-                def clean_email_text(email_text):
-                    if isinstance(email_text, str):
-                        email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
-                        email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
-                    return email_text
+                final_status, final_progress = f"FAILED_ALL_{error_sequences}_ERRORS", row_count
+            if job_store.deferred_count(job_id):
+                # Parked rows run once quota resets (resume_quota_jobs)
+                final_status = "WAITING_FOR_QUOTA"
             
-                # Add the 3 emails as separate columns with robust error handling
-                row['initial_email'] = clean_email_text(result.get('initial_email', 'ERROR: Not generated'))
-                row['followup_1'] = clean_email_text(result.get('followup_1', 'ERROR: Not generated'))
-                row['followup_2'] = clean_email_text(result.get('followup_2', 'ERROR: Not generated'))
-                row['sequence_status'] = result.get('status', 'unknown')
-                row['model_used'] = result.get('model_used', 'unknown')
-                row['row_index'] = result.get('index', len(final_data))  # Add for debugging
-                
-                # Add error details if available
-                if 'error_type' in result:
-                    row['error_type'] = result['error_type']
-                if 'retry_count' in result:
-                    row['retry_count'] = result['retry_count']
-                
-                final_data.append(row)
-                
-                # Count success/error rates
-                if result.get('status') == 'success':
-                    successful_sequences += 1
-                else:
-                    error_sequences += 1
-                    
-            except Exception as row_error:
-                print(f"Error processing result row: {row_error}")
-                # Create emergency fallback row
-                fallback_row = {
-                    "initial_email": f"PROCESSING_ERROR: {str(row_error)}",
-                    "followup_1": "SKIPPED: Row processing failed",
-                    "followup_2": "SKIPPED: Row processing failed",
-                    "sequence_status": "processing_error",
-                    "model_used": "none",
-                    "row_index": len(final_data)
-                }
-                final_data.append(fallback_row)
-                error_sequences += 1
-        
-        # Save to Excel with CSV fallback
-        df = pd.DataFrame(final_data)
-        excel_file = f"uploads/result_{job_id}.xlsx"
-        csv_file = f"uploads/result_{job_id}.csv"
-        
-        try:
-            df.to_excel(excel_file, index=False)
-            output_file = excel_file
-            print(f"Saved sequence results to Excel: {excel_file}")
-        except Exception as excel_error:
-            print(f"Excel save failed: {excel_error}, saving as CSV instead")
-            df.to_csv(csv_file, index=False, encoding='utf-8')
-            output_file = csv_file
-        
-        # Update final status with detailed reporting
-        print(f"Final stats: {successful_sequences} successful, {error_sequences} errors, {len(final_data)} total rows")
-        
-        if successful_sequences == total_rows:
-            update_status(job_id, "SUCCESS", total_rows, total_rows)
-        elif successful_sequences > 0:
-            update_status(job_id, f"PARTIAL_{successful_sequences}_OF_{total_rows}", len(final_data), total_rows)
-        else:
-            update_status(job_id, f"FAILED_ALL_{error_sequences}_ERRORS", len(final_data), total_rows)
+            output_file = save_results(
+                job_id, columns,
+                lambda: (build_sequence_row(result, position) for position, result in enumerate(runs)),
+                row_count, final_status, final_progress, total_rows
+            )
         
-        # Clean up Redis progress counter
-        from celery import current_app
-        current_app.backend.client.delete(f"progress_{job_id}")
+        # Clean up Redis progress counter (through our own client: on the inline runner's threads
+        # celery's current_app is a fallback app with no result backend)
+        job_store.redis.delete(f"progress_{job_id}")
         
         print(f"Sequence processing complete: {successful_sequences}/{total_rows} successful sequences")
         
@@ -538,7 +910,7 @@ def combine_sequence_results(results, job_id, total_rows):
                             result['index'] = i
                         salvageable_results.append(result)
                 
-                if salvageable_results:
+                if salvageable_results and len(salvageable_results) < len(results):
                     # Recursive call with cleaned data
                     print(f"Attempting recovery with {len(salvageable_results)} salvageable results")
                     return combine_sequence_results(salvageable_results, job_id, total_rows)
@@ -551,79 +923,75 @@ def combine_sequence_results(results, job_id, total_rows):
 
 @celery_app.task(ignore_result=False)
 def combine_results(results, job_id, total_rows):
-    """Combine all results into final Excel file"""
+    """Combine all results into final Excel file
+    
+    Reads the job's Redis row store when results is None and merges
+    index-sorted runs from disk, like combine_sequence_results.
+    """
+    if job_store.is_cancelled(job_id):
+        print(f"Job {job_id} was cancelled, not combining")
+        return {"status": "CANCELLED"}
+    if results is None and not job_store.claim_finalize(job_id):
+        print(f"Job {job_id} was already combined, skipping")
+        return {"status": "SKIPPED", "reason": "already combined"}
+    
     try:
-        print(f"⚠️ COMBINE_RESULTS CALLED (should not be called for sequence mode): {len(results)} tasks")
-        # Sort results by index to maintain original order
-        sorted_results = sorted(results, key=lambda x: x['index'])
-        
-        # Build final dataframe
-        final_data = []
-        daily_limit_hit = False
-        successful_emails = 0
-        
-        for result in sorted_results:
-            row = result['row_data'].copy()
+        source = job_store.iter_all_row_results(job_id) if results is None else results
+        
+        with SortedRuns() as runs:
+            daily_limit_hit = False
+            successful_emails = 0
+            has_sequence_results = False
+            optional_columns = set()
+            source_columns = {}
             
-            # Debug: print what keys are in the result
-            print(f"Result keys: {list(result.keys())}")
+            for result in source:
+                has_sequence_results = has_sequence_results or 'initial_email' in result
+                optional_columns.update(column for column in ('prompt_tokens', 'prompt_version') if column in result)
+                source_columns.update(dict.fromkeys(result['row_data']))
+                runs.add(result)
             
-            # Handle both old single email format and new sequence format
-            if 'initial_email' in result:
-                # New sequence format with 3 emails
-                print("Using sequence format")
-                def clean_email_text(email_text):
-                    if isinstance(email_text, str):
-                        email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
-                        email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
-                    return email_text
-                
-                row['initial_email'] = clean_email_text(result.get('initial_email', ''))
-                row['followup_1'] = clean_email_text(result.get('followup_1', ''))
-                row['followup_2'] = clean_email_text(result.get('followup_2', ''))
-                row['sequence_status'] = result.get('status', 'unknown')
+            # Counted on the merged runs, where a row the scan returned twice appears once
+            row_count = 0
+            for result in runs:
+                row_count += 1
+                # Check for daily limit hit in any email field
+                result_text = str(result.get('email', '')) + str(result.get('initial_email', '')) + str(result.get('followup_1', '')) + str(result.get('followup_2', ''))
+                if "DAILY_LIMIT_HIT" in result_text:
+                    daily_limit_hit = True
+                elif result['status'] == 'success':
+                    successful_emails += 1
+            
+            print(f"⚠️ COMBINE_RESULTS CALLED (should not be called for sequence mode): {row_count} tasks")
+            
+            # Stream rows straight into the result file (even partial results), with CSV fallback
+            if has_sequence_results:
+                output_columns = ['initial_email', 'followup_1', 'followup_2', 'sequence_status', 'generated_email', 'model_used']
             else:
-                # Old single email format (for backward compatibility)
-                email_text = result['email']
-                if isinstance(email_text, str):
-                    email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
-                    email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
-                
-                row['generated_email'] = email_text
+                output_columns = ['generated_email', 'model_used']
+            output_columns += [column for column in ('prompt_tokens', 'prompt_version') if column in optional_columns]
+            columns = output_row_columns(source_columns, output_columns)
             
-            # Add model info for tracking
-            row['model_used'] = result.get('model_used', 'unknown')
-            final_data.append(row)
+            # Final status
+            if daily_limit_hit:
+                final_status, final_progress = f"PARTIAL_{successful_emails}_OF_{total_rows}", row_count
+            elif row_count < total_rows:
+                final_status, final_progress = f"PARTIAL_{successful_emails}_OF_{total_rows}", row_count
+            else:
+                final_status, final_progress = "SUCCESS", total_rows
+            if job_store.deferred_count(job_id):
+                # Parked rows run once quota resets (resume_quota_jobs)
+                final_status = "WAITING_FOR_QUOTA"
             
-            # Check for daily limit hit in any email field
-            result_text = str(result.get('email', '')) + str(result.get('initial_email', '')) + str(result.get('followup_1', '')) + str(result.get('followup_2', ''))
-            if "DAILY_LIMIT_HIT" in result_text:
-                daily_limit_hit = True
-            elif result['status'] == 'success':
-                successful_emails += 1
-        
-        # Save to Excel (even partial results), with CSV fallback
-        df = pd.DataFrame(final_data)
-        excel_file = f"uploads/result_{job_id}.xlsx"
-        csv_file = f"uploads/result_{job_id}.csv"
-        
-        try:
-            df.to_excel(excel_file, index=False)
-            output_file = excel_file
-        except Exception as excel_error:
-            print(f"Excel save failed: {excel_error}, saving as CSV instead")
-            df.to_csv(csv_file, index=False, encoding='utf-8')
-            output_file = csv_file
-        
-        # Update final status
-        if daily_limit_hit:
-            update_status(job_id, f"PARTIAL_{successful_emails}_OF_{total_rows}", len(results), total_rows)
-        else:
-            update_status(job_id, "SUCCESS", total_rows, total_rows)
+            output_file = save_results(
+                job_id, columns,
+                lambda: (build_single_row(result) for result in runs),
+                row_count, final_status, final_progress, total_rows
+            )
         
-        # Clean up Redis progress counter
-        from celery import current_app
-        current_app.backend.client.delete(f"progress_{job_id}")
+        # Clean up Redis progress counter (through our own client: on the inline runner's threads
+        # celery's current_app is a fallback app with no result backend)
+        job_store.redis.delete(f"progress_{job_id}")
         
         return {"status": "SUCCESS", "file": output_file, "successful": successful_emails, "total": total_rows}
         
@@ -631,9 +999,109 @@ def combine_results(results, job_id, total_rows):
         update_status(job_id, "FAILURE", 0, 0)
         return {"status": "FAILURE", "error": str(e)}
 
+def iter_rows_by_industry(df):
+    """(index, row) pairs with each industry's rows together, so its context block is cached once and reused"""
+    if 'industry' not in df.columns:
+        return df.iterrows()
+    order = df['industry'].map(normalize_industry).sort_values(kind='stable').index
+    return df.loc[order].iterrows()
+
+def pack_row_tasks(indexed_rows, job_id):
+    """process_packed_emails signatures for [row_index, row_data] pairs, MAX_PACK_SIZE rows each"""
+    return [
+        process_packed_emails.s(indexed_rows[i:i + MAX_PACK_SIZE], job_id)
+        for i in range(0, len(indexed_rows), MAX_PACK_SIZE)
+    ]
+
+def dispatch_rows(job_id, email_tasks, callback, job_class, max_concurrency=None):
+    """Send a job's row tasks, then callback once they are all done: through the fair-share
+    scheduler, or as one chord with FAIR_SHARE=false"""
+    if not FAIR_SHARE:
+        return chord(email_tasks)(callback)
+    scheduler.submit(job_id, email_tasks, callback, job_class, max_concurrency)
+    scheduler.feed()
+
+def dispatch_more_rows(job_id, email_tasks, job_class):
+    """Send more row tasks of a job that has no callback (its rows are read as they finish)"""
+    if not FAIR_SHARE:
+        for task in email_tasks:
+            task.apply_async(queue=JOB_CLASS_QUEUES[job_class])
+        return
+    scheduler.submit(job_id, email_tasks, None, job_class, append=True)
+    scheduler.feed()
+
+def row_task_signatures(df, row_indices, job_id, mode):
+    """Row task signatures for the given rows of df, dispatched the way mode needs them"""
+    if mode == "sequence" and 'industry' in df.columns:
+        row_indices = sorted(row_indices, key=lambda index: normalize_industry(df.iloc[index]['industry']))
+    return row_signatures([[index, df.iloc[index].to_dict()] for index in row_indices], job_id, mode)
+
+def row_signatures(indexed_rows, job_id, mode):
+    """Row task signatures for [row_index, row_data] pairs, in the given order"""
+    if mode == "packed":
+        return pack_row_tasks(indexed_rows, job_id)
+    row_task = process_email_sequence if mode == "sequence" else process_single_email
+    return [row_task.s(row_data, index, job_id) for index, row_data in indexed_rows]
+
+def sample_columns(df, sample_by=None):
+    """Columns to stratify a sample on: those named in sample_by, else the first of DEFAULT_SAMPLE_COLUMNS in df"""
+    lookup = {str(column).strip().lower(): column for column in df.columns}
+    if sample_by:
+        return [lookup[column.lower()] for column in parse_column_list(sample_by) if column.lower() in lookup]
+    return [lookup[column] for column in DEFAULT_SAMPLE_COLUMNS if column in lookup][:1]
+
+def stratified_sample(df, size, columns):
+    """Positions of up to size rows: one from every stratum (distinct values of columns) that fits, the rest in proportion"""
+    strata = {}
+    keys = zip(*(df[column].map(normalize_industry) for column in columns)) if columns else ((),) * len(df)
+    for position, key in enumerate(keys):
+        strata.setdefault(key, []).append(position)
+    strata = sorted(strata.values(), key=len, reverse=True)
+    if len(strata) >= size:
+        return sorted(rows[0] for rows in strata[:size])
+    
+    shares = [(size - len(strata)) * len(rows) / len(df) for rows in strata]
+    quotas = [1 + min(int(share), len(rows) - 1) for share, rows in zip(shares, strata)]
+    # Seats left over from rounding go to the largest remainders
+    for i in sorted(range(len(strata)), key=lambda i: shares[i] - int(shares[i]), reverse=True):
+        if sum(quotas) >= size:
+            break
+        if quotas[i] < len(strata[i]):
+            quotas[i] += 1
+    # Evenly spaced picks within each stratum
+    return sorted(
+        position
+        for rows, quota in zip(strata, quotas)
+        for position in rows[::max(len(rows) // quota, 1)][:quota]
+    )
+
+def sample_row_indices(meta):
+    return [int(index) for index in meta.get('sample_rows', '').split(',') if index]
+
 @celery_app.task(ignore_result=False)
-def process_spreadsheet_task(file_path: str, job_id: str, mode: str = "single"):
+def sample_ready(results, job_id, total_rows):
+    """Chord callback of a job's sample rows: pause the job until POST /jobs/{id}/approve"""
+    if job_store.is_cancelled(job_id):
+        return {"status": "CANCELLED"}
+    if job_store.get_job_meta(job_id).get('approval') != "pending":
+        # Queued (e.g. by the watchdog) just before the sample was approved: the full run owns the status now
+        print(f"Sample of job {job_id} was already approved")
+        return {"status": "APPROVED"}
+    if job_store.deferred_count(job_id):
+        # resume_quota_jobs finishes the sample once the quota is back
+        update_status(job_id, "WAITING_FOR_QUOTA", job_store.finished_row_count(job_id), total_rows)
+        return {"status": "WAITING_FOR_QUOTA"}
+    update_status(job_id, "AWAITING_APPROVAL", job_store.finished_row_count(job_id), total_rows)
+    print(f"Sample of job {job_id} is ready for review")
+    return {"status": "AWAITING_APPROVAL"}
+
+@celery_app.task(ignore_result=False)
+def process_spreadsheet_task(file_path: str, job_id: str, mode: str = "single", sample: int = None, sample_by: str = None,
+                             job_class: str = None, max_concurrency: int = None):
     """Main task that creates subtasks for each row"""
+    if job_store.is_cancelled(job_id):
+        print(f"Job {job_id} was cancelled before it started")
+        return {"status": "CANCELLED"}
     try:
         # Read the spreadsheet
         if file_path.endswith('.csv'):
@@ -643,10 +1111,25 @@ def process_spreadsheet_task(file_path: str, job_id: str, mode: str = "single"):
         
         total_rows = len(df)
         update_status(job_id, "PROCESSING", 0, total_rows)
+        job_class = job_class_for(total_rows, job_class)
+        job_store.save_job_meta(job_id, file_path=file_path, mode=mode, total_rows=total_rows,
+                                job_class=job_class, max_concurrency=max_concurrency or "")
         
         # Create a chord - parallel tasks with a callback
         from celery import chord
         
+        if sample and sample < total_rows:
+            # Sample first: only these rows run now, ahead of other jobs; approval runs the rest
+            sample_rows = stratified_sample(df, sample, sample_columns(df, sample_by))
+            print(f"Processing a {len(sample_rows)}-row sample of job {job_id} first")
+            update_status(job_id, "SAMPLING", 0, total_rows)
+            job_store.save_job_meta(job_id, sample_rows=','.join(map(str, sample_rows)), approval="pending")
+            email_tasks = [task.set(priority=SAMPLE_PRIORITY) for task in row_task_signatures(df, sample_rows, job_id, mode)]
+            job_store.record_task_ids(job_id, [task.freeze().id for task in email_tasks])
+            # The sample is for a person waiting on it, whatever the job's size
+            dispatch_rows(job_id, email_tasks, sample_ready.si(None, job_id, total_rows), "interactive", max_concurrency)
+            return {"status": "SAMPLING", "sample_rows": len(sample_rows), "total_rows": total_rows}
+        
         # Route based on mode parameter
         print(f"Received mode parameter: '{mode}'")
         if mode == "sequence":
@@ -654,10 +1137,15 @@ def process_spreadsheet_task(file_path: str, job_id: str, mode: str = "single"):
             # Create email sequence tasks (generates 3 emails per row)
             email_tasks = [
                 process_email_sequence.s(row.to_dict(), index, job_id) 
-                for index, row in df.iterrows()
+                for index, row in iter_rows_by_industry(df)
             ]
             # Use sequence-specific combine function
-            callback = combine_sequence_results.s(job_id, total_rows)
+            callback = combine_sequence_results.si(None, job_id, total_rows)
+        elif mode == "packed":
+            print(f"Processing in PACKED mode - up to {MAX_PACK_SIZE} prospects per request")
+            # Single emails, several rows per completion
+            email_tasks = pack_row_tasks([[index, row.to_dict()] for index, row in df.iterrows()], job_id)
+            callback = combine_results.si(None, job_id, total_rows)
         else:
             print(f"Processing in SINGLE mode - will generate 1 email per row")
             # Create individual email tasks (generates 1 email per row)
@@ -666,13 +1154,15 @@ def process_spreadsheet_task(file_path: str, job_id: str, mode: str = "single"):
                 for index, row in df.iterrows()
             ]
             # Use regular combine function
-            callback = combine_results.s(job_id, total_rows)
+            callback = combine_results.si(None, job_id, total_rows)
+        
+        # Index the row task IDs so recovery/debug only read this job's results
+        job_store.record_task_ids(job_id, [task.freeze().id for task in email_tasks])
         
-        # Simple, reliable chord creation
+        # Simple, reliable chord creation (or fair-share scheduling, see dispatch_rows)
         try:
-            print(f"Creating chord with {len(email_tasks)} tasks and callback")
-            chord_result = chord(email_tasks)(callback)
-            print(f"Chord created successfully with ID: {chord_result.id}")
+            print(f"Dispatching {len(email_tasks)} {job_class} row tasks and callback")
+            dispatch_rows(job_id, email_tasks, callback, job_class, max_concurrency)
             
         except Exception as chord_error:
             print(f"Chord creation failed: {chord_error}")
@@ -689,6 +1179,9 @@ def process_spreadsheet_task(file_path: str, job_id: str, mode: str = "single"):
 @celery_app.task(ignore_result=False)
 def process_spreadsheet_sequence_task(file_path: str, job_id: str):
     """Main task that creates email sequence subtasks (initial + 2 follow-ups)"""
+    if job_store.is_cancelled(job_id):
+        print(f"Job {job_id} was cancelled before it started")
+        return {"status": "CANCELLED"}
     try:
         # Read the spreadsheet
         if file_path.endswith('.csv'):
@@ -698,6 +1191,7 @@ def process_spreadsheet_sequence_task(file_path: str, job_id: str):
         
         total_rows = len(df)
         update_status(job_id, "PROCESSING", 0, total_rows)
+        job_store.save_job_meta(job_id, file_path=file_path, mode="sequence", total_rows=total_rows)
         
         # Create a chord - parallel tasks with a callback
         from celery import chord
@@ -705,16 +1199,209 @@ def process_spreadsheet_sequence_task(file_path: str, job_id: str):
         # Create email sequence tasks (generates 3 emails per row)
         email_tasks = [
             process_email_sequence.s(row.to_dict(), index, job_id) 
-            for index, row in df.iterrows()
+            for index, row in iter_rows_by_industry(df)
         ]
         
-        # Use chord to run all tasks and then combine sequence results
-        callback = combine_sequence_results.s(job_id, total_rows)
-        chord(email_tasks)(callback)
+        job_store.record_task_ids(job_id, [task.freeze().id for task in email_tasks])
+        
+        # Run all tasks and then combine sequence results
+        callback = combine_sequence_results.si(None, job_id, total_rows)
+        dispatch_rows(job_id, email_tasks, callback, job_class_for(total_rows))
         
         # Return immediately - the chord handles everything
         return {"status": "STARTED", "total_rows": total_rows, "mode": "sequence"}
         
     except Exception as e:
         update_status(job_id, "FAILURE", 0, 0)
-        return {"status": "FAILURE", "error": str(e)}
\ No newline at end of file
+        return {"status": "FAILURE", "error": str(e)}
+
+@celery_app.task(ignore_result=False)
+def resume_job(job_id: str):
+    """Regenerate only the rows of a job without a successful stored result.
+    
+    The rows are dispatched like a fresh job; the combine callback then
+    rewrites the result file from the row store, where the retried rows
+    replace the failed ones and every other row keeps its earlier result.
+    """
+    try:
+        meta = job_store.get_job_meta(job_id)
+        if not meta or not meta.get('file_path'):
+            return {"status": "FAILURE", "error": "No resumable state for this job"}
+        file_path, mode, total_rows = meta['file_path'], meta['mode'], int(meta['total_rows'])
+        
+        job_store.clear_deferred(job_id)
+        job_store.reset_finalize(job_id)
+        successful_rows = {
+            result['index'] for result in job_store.iter_all_row_results(job_id) if is_successful_result(result)
+        }
+        # A sample awaiting approval only finishes its own rows
+        sampling = meta.get('approval') == "pending"
+        candidate_rows = sample_row_indices(meta) if sampling else range(total_rows)
+        retry_rows = [index for index in candidate_rows if index not in successful_rows]
+        print(f"Resuming job {job_id}: {len(retry_rows)} of {total_rows} rows to regenerate")
+        
+        # Progress counts up from the rows that are already done
+        job_store.uncount_rows(job_id, retry_rows)
+        job_store.redis.set(f"progress_{job_id}", len(successful_rows))
+        update_status(job_id, "SAMPLING" if sampling else "PROCESSING", len(successful_rows), total_rows)
+        
+        if sampling:
+            callback = sample_ready.si(None, job_id, total_rows)
+        elif mode == "sequence":
+            callback = combine_sequence_results.si(None, job_id, total_rows)
+        else:
+            callback = combine_results.si(None, job_id, total_rows)
+        
+        if not retry_rows:
+            # Nothing to regenerate - just rebuild the result file from the store
+            callback.delay()
+            return {"status": "STARTED", "retry_rows": 0, "total_rows": total_rows}
+        
+        if file_path.endswith('.csv'):
+            df = pd.read_csv(file_path)
+        else:
+            df = pd.read_excel(file_path)
+        
+        email_tasks = row_task_signatures(df, retry_rows, job_id, mode)
+        if sampling:
+            email_tasks = [task.set(priority=SAMPLE_PRIORITY) for task in email_tasks]
+        job_store.record_task_ids(job_id, [task.freeze().id for task in email_tasks])
+        job_class = "interactive" if sampling else job_class_for(total_rows, meta.get('job_class'))
+        dispatch_rows(job_id, email_tasks, callback, job_class, meta.get('max_concurrency') or None)
+        
+        return {"status": "STARTED", "retry_rows": len(retry_rows), "total_rows": total_rows}
+        
+    except Exception as e:
+        print(f"Resume failed for job {job_id}: {e}")
+        update_status(job_id, "RESUME_FAILED", 0, 0)
+        return {"status": "FAILURE", "error": str(e)}
+    finally:
+        # The job's status (PROCESSING/SAMPLING) now keeps further resumes out until it finishes
+        job_store.release_resume(job_id)
+
+@celery_app.task(ignore_result=True)
+def resume_quota_jobs():
+    """Periodic (celery beat): resume jobs whose parked rows can run again"""
+    for job_id in job_store.due_quota_jobs(time.time()):
+        status_file = f"uploads/{job_id}_status.txt"
+        status = open(status_file).read().split(',')[0] if os.path.exists(status_file) else None
+        if status is None:
+            job_store.clear_deferred(job_id)  # job was deleted
+            continue
+        if status != "WAITING_FOR_QUOTA":
+            continue  # still running; the combine step sets WAITING_FOR_QUOTA when it is done
+        if not job_store.claim_resume(job_id):
+            continue  # already being resumed
+        print(f"Quota reset - resuming parked rows of job {job_id}")
+        update_status(job_id, "RESUMING", 0, job_store.get_job_meta(job_id).get('total_rows', 0))
+        resume_job.delay(job_id)
+
+def straggler_threshold(samples):
+    """Seconds after which a running row counts as a straggler, None until there are enough samples"""
+    if len(samples) < STRAGGLER_MIN_SAMPLES:
+        return None
+    samples = sorted(samples)
+    percentile = samples[min(int(len(samples) * STRAGGLER_PERCENTILE / 100), len(samples) - 1)]
+    return max(percentile * STRAGGLER_FACTOR, STRAGGLER_MIN_SECONDS)
+
+@celery_app.task(ignore_result=True)
+def watch_stragglers():
+    """Periodic (celery beat): hedge straggling rows and combine jobs whose chord is stuck.
+    
+    A straggler (slow, or on a worker that no longer answers pings) gets a
+    second execution; whichever finishes first is stored. Once every row
+    has a result the job is combined without waiting for the chord, whose
+    callback then finds the job already combined.
+    """
+    live_hosts = None
+    try:
+        replies = celery_app.control.ping(timeout=1.0)
+        if replies:
+            live_hosts = {hostname for reply in replies for hostname in reply}
+    except Exception as e:
+        print(f"Watchdog: worker ping failed: {e}")
+    
+    now = time.time()
+    for job_id in job_store.inflight_jobs():
+        meta = job_store.get_job_meta(job_id)
+        if not meta or job_store.is_cancelled(job_id):
+            job_store.drop_inflight_job(job_id)
+            continue
+        total_rows = int(meta['total_rows'])
+        
+        if meta.get('approval') == "pending":
+            if job_store.finished_row_count(job_id) >= len(sample_row_indices(meta)):
+                job_store.drop_inflight_job(job_id)
+                sample_ready.delay(None, job_id, total_rows)
+                continue
+        elif job_store.finished_row_count(job_id) >= total_rows:
+            job_store.drop_inflight_job(job_id)
+            if meta.get('source') == "api":
+                continue  # streamed to the caller row by row; there is no result file
+            if meta['mode'] == "sequence":
+                combine_sequence_results.delay(None, job_id, total_rows)
+            else:
+                combine_results.delay(None, job_id, total_rows)
+            continue
+        
+        if meta.get('inline'):
+            continue  # runs in the API process, which combines it itself
+        
+        threshold = straggler_threshold(job_store.latency_samples(job_id))
+        # A packed row is hedged on its own: the same single email, prompt and 'email' claim step as in its pack
+        hedge_tasks = {"sequence": process_email_sequence, "packed": process_single_email}
+        row_task = hedge_tasks.get(meta['mode'], process_single_email)
+        for row_index, info in job_store.inflight_rows(job_id).items():
+            lost = live_hosts is not None and info.get('host') not in live_hosts
+            slow = threshold is not None and now - info['started'] > threshold
+            if (lost or slow) and job_store.mark_hedged(job_id, row_index):
+                reason = f"worker {info.get('host')} is gone" if lost else f"running {now - info['started']:.0f}s (threshold {threshold:.0f}s)"
+                print(f"Watchdog: re-dispatching row {row_index} of job {job_id}: {reason}")
+                row_task.apply_async(args=(info['row_data'], row_index, job_id), kwargs={"hedge": True})
+
+@celery_app.task(bind=True, max_retries=WEBHOOK_MAX_ATTEMPTS - 1, ignore_result=True)
+def deliver_webhook(self, delivery):
+    """POST one job event to its callback URL, retrying with exponential backoff"""
+    try:
+        post_event(delivery)
+    except Exception as e:
+        event = delivery['event']
+        if not is_retryable(e) or self.request.retries >= self.max_retries:
+            print(f"Dropping webhook {event['event']} for job {event['job_id']} after {self.request.retries + 1} attempts: {e}")
+            return
+        countdown = retry_delay(self.request.retries)
+        print(f"Webhook {event['event']} for job {event['job_id']} failed ({e}), retrying in {countdown}s")
+        raise self.retry(exc=e, countdown=countdown)
+
+@celery_app.task(ignore_result=True)
+def send_webhook_progress():
+    """Periodic (celery beat): queue progress events for jobs that passed a milestone"""
+    for delivery in webhook_notifier.progress_events():
+        deliver_webhook.delay(delivery)
+
+@celery_app.task(ignore_result=True)
+def feed_row_queues():
+    """Periodic (celery beat): top up the class queues from the fair-share backlogs"""
+    if FAIR_SHARE:
+        scheduler.feed()
+
+@task_postrun.connect
+def release_row_slot(sender=None, args=None, kwargs=None, state=None, **extra):
+    """A scheduled row task is done (not just retrying): free its slot, send the job's callback
+    if it was the job's last task, and hand the slot to the next job"""
+    row_tasks = (process_single_email.name, process_email_sequence.name, process_packed_emails.name)
+    if not FAIR_SHARE or sender is None or sender.name not in row_tasks or state == "RETRY":
+        return
+    if sender.request.is_eager:
+        return  # run inline (see inline_runner), never scheduled
+    kwargs = kwargs or {}
+    if kwargs.get('hedge'):
+        return  # watchdog re-dispatches run outside the scheduler
+    job_id = kwargs.get('job_id') or (args[1] if sender.name == process_packed_emails.name else args[2])
+    try:
+        callback = scheduler.release(job_id)
+        if callback:
+            signature(callback).apply_async()
+        scheduler.feed()
+    except Exception as e:
+        print(f"Fair-share release failed for job {job_id}: {e}")
@@ -8,6 +8,9 @@ import json
 import threading
 import redis
 from worker_models import WorkerModelAssigner
+from sanitize import sanitize_columns
+from prompt_builder import PromptBuilder
+from prompt_templates import PROMPT_VERSION, render
 
 load_dotenv()
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -38,41 +41,18 @@ def process_email_chunk(self, chunk_data, chunk_index, job_id, total_chunks):
         model = model_assigner.get_worker_model()
         worker_info = self.request.hostname if hasattr(self.request, 'hostname') else f"Worker {os.getpid()}"
         
-        system_prompt = """
-You are an AI assistant writing a cold email. The user will provide you with information about a prospect. Your job is to write a short, casual email FROM a person who works in "AI automation" TO that prospect.
-It is critical that you understand this role. You are the sender. The prospect information is for the recipient. Do not get confused and act as if you work for the prospect's company.
-Follow all formatting rules from the user, especially the negative constraints about what NOT to include. The required output format is: Greeting\\n\\nMain Content\\n\\nCTA\\n\\nFallback with smiley.
-"""
-        
+        builder = PromptBuilder()
         for row_index, row_data in chunk_data:
             try:
-                prospect_info = '\n'.join([f"{col}: {val}" for col, val in row_data.items()])
-                first_name = row_data.get('first_name') or row_data.get('name', 'there')
-                
-                user_prompt = f"""
-Write a natural, conversational cold email using this contact information:
----
-{prospect_info}
----
-Write like you're a real person reaching out - natural, authentic, non-promotional tone.
-Key guidelines:
-- Start casually: "Hey {first_name}", "Hi {first_name}", "{first_name}, hope you're well"
-- Mention you work with AI automation in a casual way.
-- Reference their specific situation when possible.
-- Keep it conversational and authentic.
-- End with if-then call CTA + "if not, all good/no worries/totally fine" with a smiley.
-- Use proper spacing with blank lines between paragraphs for readability.
-- NO signatures, names, or formal closings.
-- 50-70 words max.
-Make each email sound completely different - vary greetings, structure, tone, and phrasing naturally.
-"""
+                messages = render(
+                    "cold_email",
+                    prospect_info=builder.prospect_info(row_data),
+                    first_name=builder.value(row_data, 'first_name', 'name', default='there'),
+                )
                 
                 completion = client.chat.completions.create(
                     model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
+                    messages=messages,
                     temperature=0.8,
                     max_tokens=200,
                 )
@@ -85,7 +65,8 @@ Make each email sound completely different - vary greetings, structure, tone, an
                     "row_data": row_data,
                     "email": email_text,
                     "status": "success",
-                    "model_used": model
+                    "model_used": model,
+                    "prompt_version": PROMPT_VERSION
                 })
                 
             except Exception as e:
@@ -162,17 +143,9 @@ def combine_chunk_results(chunk_results, job_id, total_rows):
         
         for result in sorted_results:
             row = result['row_data'].copy()
-            
-            # Clean email text to avoid Excel character issues
-            email_text = result['email']
-            if isinstance(email_text, str):
-                # Remove problematic characters that Excel can't handle
-                email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
-                # Remove other control characters but keep newlines, tabs, carriage returns
-                email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
-            
-            row['generated_email'] = email_text
+            row['generated_email'] = result['email']
             row['model_used'] = result.get('model_used', 'unknown')
+            row['prompt_version'] = result.get('prompt_version', PROMPT_VERSION)
             final_data.append(row)
             
             if result['status'] == 'success' and not result['email'].startswith('ERROR'):
@@ -180,6 +153,8 @@ def combine_chunk_results(chunk_results, job_id, total_rows):
         
         # Save to both CSV and Excel
         df = pd.DataFrame(final_data)
+        # Clean email text to avoid Excel character issues
+        sanitize_columns(df, ['generated_email'])
         
         # Save CSV first (more reliable)
         csv_file = f"uploads/result_{job_id}.csv"
@@ -5,6 +5,8 @@ from celery import Celery, group
 from openai import OpenAI
 from dotenv import load_dotenv
 import json
+from prompt_builder import PromptBuilder
+from prompt_templates import PROMPT_VERSION, render
 
 load_dotenv()
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -20,42 +22,17 @@ def update_status(job_id, status, progress, total):
 def process_single_email(self, row_data, row_index, job_id):
     """Process a single email - this can run in parallel"""
     try:
-        prospect_info = '\n'.join([f"{col}: {val}" for col, val in row_data.items()])
-        
-        # Get first_name for the prompt
-        first_name = row_data.get('first_name') or row_data.get('name', 'there')
-        
-        user_prompt = f"""
-Write a natural, conversational cold email using this contact information:
----
-{prospect_info}
----
-Write like you're a real person reaching out - natural, authentic, non-promotional tone.
-Key guidelines:
-- Start casually: "Hey {first_name}", "Hi {first_name}", "{first_name}, hope you're well"
-- Mention you work with AI automation in a casual way.
-- Reference their specific situation when possible.
-- Keep it conversational and authentic.
-- End with if-then call CTA + "if not, all good/no worries/totally fine" with a smiley.
-- Use proper spacing with blank lines between paragraphs for readability.
-- NO signatures, names, or formal closings.
-- 50-70 words max.
-Make each email sound completely different - vary greetings, structure, tone, and phrasing naturally.
-"""
-        
-        system_prompt = """
-You are an AI assistant writing a cold email. The user will provide you with information about a prospect. Your job is to write a short, casual email FROM a person who works in "AI automation" TO that prospect.
-It is critical that you understand this role. You are the sender. The prospect information is for the recipient. Do not get confused and act as if you work for the prospect's company.
-Follow all formatting rules from the user, especially the negative constraints about what NOT to include. The required output format is: Greeting\\n\\nMain Content\\n\\nCTA\\n\\nFallback with smiley.
-"""
+        builder = PromptBuilder()
+        messages = render(
+            "cold_email",
+            prospect_info=builder.prospect_info(row_data),
+            first_name=builder.value(row_data, 'first_name', 'name', default='there'),
+        )
         
         try:
             completion = client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=0.8,
                 max_tokens=200,
             )
@@ -71,7 +48,8 @@ Follow all formatting rules from the user, especially the negative constraints a
             "index": row_index,
             "row_data": row_data,
             "email": email_text,
-            "status": "success"
+            "status": "success",
+            "prompt_version": PROMPT_VERSION
         }
         
     except Exception as e:
@@ -99,6 +77,7 @@ def combine_results(results, job_id, total_rows):
         for result in sorted_results:
             row = result['row_data'].copy()
             row['generated_email'] = result['email']
+            row['prompt_version'] = result.get('prompt_version', PROMPT_VERSION)
             final_data.append(row)
         
         # Save to Excel
@@ -0,0 +1,236 @@
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import ssl
+import time
+import uuid
+import urllib.error
+from datetime import datetime
+from urllib.parse import urlparse
+
+from job_store import JOB_STATE_TTL
+
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # HMAC key events are signed with; callback URLs are refused without it
+WEBHOOK_MILESTONES = sorted(int(percent) for percent in os.getenv("WEBHOOK_MILESTONES", "25,50,75").split(',') if percent.strip())
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 10))  # seconds per delivery attempt
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))  # an event is dropped after this many failures
+WEBHOOK_BACKOFF = 10  # seconds before the first retry, doubled after every failure...
+WEBHOOK_MAX_BACKOFF = 600  # ...up to this (below the broker's visibility timeout)
+WEBHOOK_JOBS_KEY = "webhook_jobs"
+# Hosts callback URLs may point at; empty = any host whose addresses are all public
+WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(',') if host.strip()}
+
+FAILURE_STATUSES = {"FAILURE", "COMBINE_FAILURE", "CHORD_CREATION_FAILED", "RESUME_FAILED"}
+
+
+def event_for_status(status):
+    """The webhook event a job status means, None for statuses that are not reported"""
+    if status in ("PROCESSING", "SAMPLING"):
+        return "started"
+    if status == "SUCCESS" or status.startswith("PARTIAL_"):
+        return "completed"
+    if status in FAILURE_STATUSES or status.startswith(("FAILED_ALL_", "SHARDS_FAILED_")):
+        return "failed"
+    if status == "CANCELLED":
+        return "cancelled"
+    return None
+
+
+class CallbackRefused(Exception):
+    """A callback URL that may not be called: not http(s), or a host that is not allowed"""
+
+
+def valid_callback_url(url):
+    """Whether url may be called: see callback_address"""
+    try:
+        callback_address(url)
+    except CallbackRefused:
+        return False
+    return True
+
+
+def callback_address(url):
+    """The address to POST url's events to, resolved once.
+
+    url must be http(s) on a WEBHOOK_ALLOWED_HOSTS host or, without an
+    allowlist, on a host that resolves only to public addresses: workers must
+    not be pointed at Redis, metadata services and the like. The connection
+    then goes to this address, so the host cannot resolve differently (DNS
+    rebinding) between the check and the request. Raises CallbackRefused.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise CallbackRefused(f"callback URL {url} is not http(s)")
+    if WEBHOOK_ALLOWED_HOSTS and parsed.hostname.lower() not in WEBHOOK_ALLOWED_HOSTS:
+        raise CallbackRefused(f"callback host {parsed.hostname} is not in WEBHOOK_ALLOWED_HOSTS")
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = [info[4][0] for info in socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)]
+    except (socket.gaierror, UnicodeError, ValueError) as e:
+        raise CallbackRefused(f"callback host {parsed.hostname} does not resolve: {e}")
+    if not addresses:
+        raise CallbackRefused(f"callback host {parsed.hostname} does not resolve")
+    if not WEBHOOK_ALLOWED_HOSTS and not all(is_public_address(address) for address in addresses):
+        raise CallbackRefused(f"callback host {parsed.hostname} resolves to a non-public address")
+    return addresses[0]
+
+
+def is_public_address(address):
+    """Not loopback, private, link-local, reserved or multicast"""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])  # drop an IPv6 zone index
+    return ip.is_global and not ip.is_multicast
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """HTTP to a given address; Host is still the URL's host"""
+
+    def __init__(self, host, port=None, address=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS to a given address; SNI, the certificate check and Host are still the URL's host"""
+
+    def __init__(self, host, port=None, address=None, **kwargs):
+        self.ssl_context = ssl.create_default_context()
+        super().__init__(host, port, context=self.ssl_context, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+
+def sign(body, timestamp, secret=None):
+    """Hex HMAC-SHA256 of b'<timestamp>.<body>'"""
+    secret = WEBHOOK_SECRET if secret is None else secret
+    return hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('utf-8') + body, hashlib.sha256).hexdigest()
+
+
+def retry_delay(failures):
+    """Seconds to wait before retrying an event that failed this many times before"""
+    return min(WEBHOOK_BACKOFF * 2 ** failures, WEBHOOK_MAX_BACKOFF)
+
+
+def is_retryable(error):
+    """Network errors, timeouts, 5xx, 408 and 429 are worth retrying; other 4xx answers won't change"""
+    if isinstance(error, CallbackRefused):
+        return False
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code in (408, 429)
+    return True
+
+
+def post_event(delivery):
+    """POST one event, signed; raises on a network error or a non-2xx answer.
+
+    Redirects are not followed: they would send the event to a host that was never checked.
+    """
+    url = delivery["url"]
+    # Checked again on every delivery: the host's addresses may have changed since the upload
+    address = callback_address(url)
+    parsed = urlparse(url)
+    connection_class = PinnedHTTPSConnection if parsed.scheme == "https" else PinnedHTTPConnection
+    body = json.dumps(delivery["event"], default=str).encode('utf-8')
+    timestamp = str(int(time.time()))
+    connection = connection_class(parsed.hostname, parsed.port, address=address, timeout=WEBHOOK_TIMEOUT)
+    try:
+        connection.request("POST", (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else ""), body=body, headers={
+            "Content-Type": "application/json",
+            "User-Agent": "email-generator-webhooks",
+            "X-Webhook-Id": delivery["event"]["id"],
+            "X-Webhook-Event": delivery["event"]["event"],
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Signature": f"sha256={sign(body, timestamp)}",
+        })
+        response = connection.getresponse()
+        if not 200 <= response.status < 300:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        return response.status
+    finally:
+        connection.close()
+
+
+class WebhookNotifier:
+    """Job events for jobs uploaded with a callback URL.
+
+    This only decides which events are due and builds them; the caller
+    queues each delivery (a Celery task that posts it and retries with
+    backoff), so a status change never waits on the receiving end. Events:
+    started, progress (once per milestone percent, see progress_events),
+    then one of completed, failed or cancelled, after which the job is
+    forgotten. Every event has an id that stays the same across retries.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def register(self, job_id, url):
+        self.redis.hset(WEBHOOK_JOBS_KEY, job_id, json.dumps({"url": url, "total": 0}))
+
+    def forget(self, job_id):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hdel(WEBHOOK_JOBS_KEY, job_id)
+        pipe.delete(f"webhook_sent_{job_id}")
+        pipe.execute()
+
+    def status_changed(self, job_id, status, progress, total):
+        """Deliveries for a job's new status (none if it has no callback URL or the status is not reported)"""
+        event = event_for_status(status)
+        if event is None:
+            return []
+        job = self.redis.hget(WEBHOOK_JOBS_KEY, job_id)
+        if job is None:
+            return []
+        job = json.loads(job)
+        if event == "started":
+            job["total"] = int(total)
+            self.redis.hset(WEBHOOK_JOBS_KEY, job_id, json.dumps(job))
+            if not self._first(job_id, "started"):
+                return []  # resumed jobs start only once
+        elif event in ("completed", "failed", "cancelled"):
+            self.forget(job_id)
+        fields = {"status": status, "progress": int(progress), "total": int(total)}
+        if event == "completed":
+            fields["download_url"] = f"/download/{job_id}"
+        return [self.delivery(job_id, job["url"], event, **fields)]
+
+    def progress_events(self):
+        """Deliveries for milestones that running jobs have reached since the last call"""
+        deliveries = []
+        for job_id, job in self.redis.hgetall(WEBHOOK_JOBS_KEY).items():
+            job_id, job = job_id.decode('utf-8'), json.loads(job)
+            if not job["total"]:
+                continue  # not started yet
+            progress = int(self.redis.get(f"progress_{job_id}") or 0)
+            percent = min(progress * 100 // job["total"], 100)
+            for milestone in WEBHOOK_MILESTONES:
+                if milestone <= percent and self._first(job_id, f"progress_{milestone}"):
+                    deliveries.append(self.delivery(job_id, job["url"], "progress", percent=milestone,
+                                                    progress=progress, total=job["total"]))
+        return deliveries
+
+    def delivery(self, job_id, url, event, **fields):
+        return {"url": url, "event": {
+            "id": str(uuid.uuid4()),
+            "event": event,
+            "job_id": job_id,
+            "timestamp": datetime.now().isoformat(),
+            **fields,
+        }}
+
+    def _first(self, job_id, event):
+        """True the first time a one-off event comes up for a job"""
+        sent_key = f"webhook_sent_{job_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(sent_key, event)
+        pipe.expire(sent_key, JOB_STATE_TTL)
+        return pipe.execute()[0] == 1
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the combine step.
+
+Usage: python benchmark_combine.py sanitize [rows]
+       python benchmark_combine.py writer [rows ...]   (default 10000 100000 1000000)
+"""
+import multiprocessing
+import os
+import random
+import resource
+import string
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from sanitize import sanitize_columns, sanitize_text
+from result_writer import ResultWriter
+
+EMAIL_COLUMNS = ['initial_email', 'followup_1', 'followup_2']
+
+
+def legacy_clean_email_text(email_text):
+    """The per-character loop combine used before the shared sanitizer"""
+    if isinstance(email_text, str):
+        email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
+        email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
+    return email_text
+
+
+def make_emails(rows):
+    """Sequence-mode sized emails with the odd control character mixed in"""
+    alphabet = string.ascii_letters + ' ' * 10 + '\n'
+    emails = []
+    for _ in range(rows):
+        text = ''.join(random.choices(alphabet, k=450))
+        if random.random() < 0.05:
+            text += '\x00\x0b\x1f'
+        emails.append(text)
+    return emails
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f}s")
+    return elapsed
+
+
+def bench_sanitize(rows):
+    print(f"Sanitizing {rows} sequence rows ({len(EMAIL_COLUMNS)} emails each)")
+    emails = {column: make_emails(rows) for column in EMAIL_COLUMNS}
+
+    legacy = timed("legacy per-char loop", lambda: [
+        [legacy_clean_email_text(text) for text in emails[column]] for column in EMAIL_COLUMNS
+    ])
+    timed("sanitize_text per cell", lambda: [
+        [sanitize_text(text) for text in emails[column]] for column in EMAIL_COLUMNS
+    ])
+    df = pd.DataFrame(emails)
+    columns = timed("sanitize_columns (whole column)", lambda: sanitize_columns(df, EMAIL_COLUMNS))
+    print(f"Speedup: {legacy / columns:.1f}x")
+
+
+def make_sequence_rows(rows):
+    """Output rows shaped like a sequence-mode result file"""
+    emails = make_emails(min(rows, 1000))
+    for index in range(rows):
+        yield {
+            "first_name": f"Prospect{index}",
+            "organization_name": f"Company{index}",
+            "industry": "Software",
+            "initial_email": emails[index % len(emails)],
+            "followup_1": emails[(index + 1) % len(emails)],
+            "followup_2": emails[(index + 2) % len(emails)],
+            "sequence_status": "success",
+            "model_used": "gpt-3.5-turbo",
+            "row_index": index,
+        }
+
+
+def _write_pandas(rows, path):
+    # Sanitized first, as combine did before the streaming writer: openpyxl refuses control characters
+    df = sanitize_columns(pd.DataFrame(list(make_sequence_rows(rows))), EMAIL_COLUMNS)
+    df.to_excel(path, index=False)
+
+
+def _write_streaming(rows, path):
+    columns = list(next(make_sequence_rows(1)))
+    with ResultWriter(path, columns) as writer:
+        for row in make_sequence_rows(rows):
+            writer.write_row(row)
+
+
+def _run_writer(target, rows, path, queue):
+    start = time.perf_counter()
+    target(rows, path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def bench_writer(sizes):
+    """Time and peak RSS of DataFrame.to_excel vs the write-only ResultWriter.
+
+    Each run happens in a fresh process so peak RSS is not shared.
+    """
+    path = "bench_result.xlsx"
+    for rows in sizes:
+        for label, target in (("to_excel (openpyxl)", _write_pandas), ("ResultWriter (write-only)", _write_streaming)):
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_run_writer, args=(target, rows, path, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{rows:>9} rows  {label:<28} failed (exit code {process.exitcode})")
+                continue
+            elapsed, peak_mb = queue.get()
+            print(f"{rows:>9} rows  {label:<28} {elapsed:8.1f}s  {rows / elapsed:10.0f} rows/s  peak RSS {peak_mb:7.0f} MB")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "sanitize"
+    if command == "writer":
+        bench_writer([int(arg) for arg in sys.argv[2:]] or [10000, 100000, 1000000])
+    else:
+        bench_sanitize(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
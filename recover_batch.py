@@ -5,11 +5,14 @@ when the combine step failed but emails were successfully generated
 """
 
 import redis
-import json
 import pandas as pd
-import pickle
 from datetime import datetime
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from job_store import JobStore
+from sanitize import sanitize_columns
 
 # Connect to Redis
 redis_client = redis.Redis(host='localhost', port=6379, db=0)
@@ -19,48 +22,33 @@ def recover_batch_results(job_id):
     
     print(f"Recovering batch: {job_id}")
     
-    # Get all Celery task result keys
-    task_keys = redis_client.keys("celery-task-meta-*")
-    print(f"Found {len(task_keys)} total task result keys in Redis")
-    
+    store = JobStore(redis_client)
     recovered_results = []
     success_count = 0
     error_count = 0
     
-    for key in task_keys:
-        try:
-            # Get the raw result data
-            raw_result = redis_client.get(key)
-            if not raw_result:
-                continue
-                
-            # Celery stores results as pickled data
-            try:
-                result_data = pickle.loads(raw_result)
-            except:
-                # Try JSON if pickle fails
-                try:
-                    result_data = json.loads(raw_result.decode('utf-8'))
-                except:
-                    continue
+    # Every finished row is kept in the job's row store; Celery task results are the fallback
+    # for jobs whose row store has expired (packed tasks only return a summary)
+    results = store.iter_all_row_results(job_id)
+    if not redis_client.exists(f"job_rows_{job_id}"):
+        print("No row store for this job, reading its Celery task results")
+        # Read only this job's task results (indexed task IDs, batched MGET)
+        results = (
+            result_data['result'] for task_id, result_data in store.iter_task_results(job_id)
+            if isinstance(result_data, dict) and 'result' in result_data
+        )
+    
+    for result in results:
+        # Look for email generation results
+        if isinstance(result, dict) and 'row_data' in result and 'email' in result:
+            recovered_results.append(result)
+            if result.get('status') == 'success':
+                success_count += 1
+            else:
+                error_count += 1
             
-            # Check if this result contains email data
-            if isinstance(result_data, dict) and 'result' in result_data:
-                result = result_data['result']
-                
-                # Look for email generation results
-                if isinstance(result, dict) and 'row_data' in result and 'email' in result:
-                    recovered_results.append(result)
-                    if result.get('status') == 'success':
-                        success_count += 1
-                    else:
-                        error_count += 1
-                    
-                    if len(recovered_results) % 1000 == 0:
-                        print(f"Recovered {len(recovered_results)} results so far...")
-                        
-        except Exception as e:
-            continue
+            if len(recovered_results) % 1000 == 0:
+                print(f"Recovered {len(recovered_results)} results so far...")
     
     print(f"Recovery complete: {len(recovered_results)} total results")
     print(f"Success: {success_count}, Errors: {error_count}")
@@ -93,17 +81,7 @@ def save_recovered_results(results, job_id):
     for result in results:
         # Get the original row data
         row = result['row_data'].copy()
-        
-        # Clean the email text to remove problematic characters
-        email_text = result['email']
-        if isinstance(email_text, str):
-            # Remove problematic characters that Excel can't handle
-            email_text = email_text.replace('\x00', '').replace('\x01', '').replace('\x02', '')
-            # Remove other control characters
-            email_text = ''.join(char for char in email_text if ord(char) >= 32 or char in '\n\r\t')
-        
-        # Add the cleaned generated email
-        row['generated_email'] = email_text
+        row['generated_email'] = result['email']
         row['model_used'] = result.get('model_used', 'unknown')
         row['recovery_status'] = result.get('status', 'unknown')
         
@@ -112,8 +90,9 @@ def save_recovered_results(results, job_id):
         if result.get('status') == 'success' and not str(result['email']).startswith('ERROR'):
             actual_success += 1
     
-    # Create DataFrame and save
+    # Create DataFrame and save, stripping characters Excel can't handle
     df = pd.DataFrame(final_data)
+    sanitize_columns(df, ['generated_email'])
     
     # Create filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -0,0 +1,50 @@
+"""
+Unit tests for parse_range in backend/exporters.py:
+    pytest test_exporters.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from exporters import parse_range  # noqa: E402
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-10", (10, 10)),
+    ("bytes=900-", (900, 999)),     # open range: to the end of the file
+    ("bytes=-100", (900, 999)),     # suffix range: the last 100 bytes
+    ("bytes=-5000", (0, 999)),      # a suffix longer than the file is the whole file
+    ("bytes=500-5000", (500, 999)),  # an end past EOF is clamped
+    ("Bytes = 0-0", (0, 0)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=1000-1999",
+    "bytes=50-10",
+    "bytes=-0",
+])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header", ["bytes=0-9,20-29", "items=0-9", "bytes=a-b", "bytes=-"])
+def test_multi_range_and_malformed_headers_are_refused(header):
+    # ranged_file_response answers these with 416
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_any_range_of_an_empty_file_is_unsatisfiable():
+    with pytest.raises(ValueError):
+        parse_range("bytes=-10", 0)
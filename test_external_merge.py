@@ -0,0 +1,32 @@
+"""
+Unit tests for backend/external_merge.py:
+    pytest test_external_merge.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from external_merge import SortedRuns  # noqa: E402
+
+
+def test_runs_merge_in_index_order(tmp_path):
+    with SortedRuns(run_size=3, spill_dir=tmp_path) as runs:
+        for index in (5, 1, 4, 0, 3, 2, 6):
+            runs.add({"index": index, "status": "success"})
+        assert [result["index"] for result in runs] == list(range(7))
+        # Iterating again reads the same runs
+        assert [result["index"] for result in runs] == list(range(7))
+
+
+def test_repeated_indices_are_merged_once_keeping_a_success(tmp_path):
+    # HSCAN may return a row twice, e.g. before and after a hedge stored its success
+    with SortedRuns(run_size=2, spill_dir=tmp_path) as runs:
+        for result in ({"index": 1, "status": "error"}, {"index": 0, "status": "success"},
+                       {"index": 2, "status": "success", "email": "first"}, {"index": 1, "status": "success"},
+                       {"index": 2, "status": "success", "email": "second"}, {"index": 1, "status": "error"}):
+            runs.add(result)
+        merged = list(runs)
+    assert [result["index"] for result in merged] == [0, 1, 2]
+    assert merged[1]["status"] == "success"
+    assert merged[2]["email"] in ("first", "second")
@@ -0,0 +1,67 @@
+"""
+Unit tests for backend/fair_share.py against an in-memory Redis (fakeredis):
+    pytest test_fair_share.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('celery')
+
+import fair_share  # noqa: E402
+from fair_share import FEED_LOCK_KEY, FEED_REQUESTED_KEY, FairShareScheduler  # noqa: E402
+
+
+class SentTask:
+    def __init__(self, sent, task):
+        self.sent, self.task = sent, task
+
+    def apply_async(self, queue=None):
+        self.sent.append((self.task['args'][0], queue))
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(fair_share, 'signature', lambda task: SentTask(sent, task))
+    return sent
+
+
+def row_tasks(job_id, count):
+    return [{"task": "tasks.process_single_email", "args": [job_id, index]} for index in range(count)]
+
+
+def test_lone_job_is_not_held_to_its_class_cap(sent):
+    scheduler = FairShareScheduler(fakeredis.FakeRedis(), lambda: 20)
+    scheduler.submit("bulk-job", row_tasks("bulk-job", 30), None, "bulk")
+    assert scheduler.feed() == 20
+
+
+def test_class_caps_hold_while_another_class_waits(sent):
+    scheduler = FairShareScheduler(fakeredis.FakeRedis(), 20)
+    scheduler.submit("bulk-job", row_tasks("bulk-job", 30), None, "bulk")
+    scheduler.submit("small-job", row_tasks("small-job", 30), None, "interactive", max_concurrency=3)
+    assert scheduler.feed() == 11
+    jobs = scheduler.snapshot()["jobs"]
+    assert (jobs["bulk-job"]["running"], jobs["small-job"]["running"]) == (8, 3)
+
+
+def test_feed_requested_during_another_feed_is_run_by_the_holder(sent):
+    redis_client = fakeredis.FakeRedis()
+    scheduler = FairShareScheduler(redis_client, 2)
+    scheduler.submit("job", row_tasks("job", 5), None, "standard")
+    redis_client.set(FEED_LOCK_KEY, 1)
+    assert scheduler.feed() == 0
+    assert redis_client.exists(FEED_REQUESTED_KEY)
+
+    redis_client.delete(FEED_LOCK_KEY)
+    assert scheduler.feed() == 2
+    # A slot freed while a feed holds the lock is filled by that feed's next round
+    scheduler.release("job")
+    redis_client.set(FEED_REQUESTED_KEY, 1)
+    assert scheduler.feed() == 1
+    assert not redis_client.exists(FEED_REQUESTED_KEY)
@@ -0,0 +1,82 @@
+"""
+End-to-end test of a small upload run by the inline runner: rows applied on the
+runner's threads, then combined, with a fake OpenAI client.
+
+Needs the backend's dependencies and a Redis server at REDIS_URL (skipped otherwise):
+    pytest test_inline_runner.py
+"""
+import asyncio
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+for module in ('celery', 'pandas', 'redis', 'openai', 'openpyxl'):
+    pytest.importorskip(module)
+
+
+class FakeStream:
+    """What chat.completions.create(stream=True) returns: chunks with a text delta"""
+
+    def __init__(self, text):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+                       for word in text.split()]
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        pass
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return FakeStream("Hi there, quick question about your team.")
+
+
+@pytest.fixture
+def tasks(tmp_path, monkeypatch):
+    import redis
+    try:
+        redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")).ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip("no Redis server at REDIS_URL")
+    # Status and result files go to ./uploads
+    (tmp_path / "uploads").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    import tasks
+    monkeypatch.setattr(tasks.llm, "client", FakeOpenAI())
+    return tasks
+
+
+def test_inline_job_succeeds(tasks, tmp_path):
+    import pandas as pd
+    from inline_runner import InlineRunner
+
+    job_id = f"test-inline-{uuid.uuid4()}"
+    file_path = f"uploads/{job_id}.csv"
+    pd.DataFrame([
+        {"first_name": "Ann", "title": "CEO", "organization_name": "Acme", "industry": "Dental"},
+        {"first_name": "Bob", "title": "CTO", "organization_name": "Globex", "industry": "Software"},
+        {"first_name": "Cy", "title": "COO", "organization_name": "Initech", "industry": "Software"},
+    ]).to_csv(file_path, index=False)
+
+    asyncio.run(InlineRunner(max_workers=2).run(file_path, job_id, "single"))
+
+    status, progress, total = (tmp_path / "uploads" / f"{job_id}_status.txt").read_text().split(',')
+    assert status == "SUCCESS"
+    assert (int(progress), int(total)) == (3, 3)
+    assert tasks.llm.client.calls == 3
+    result = pd.read_excel(tmp_path / "uploads" / f"result_{job_id}.xlsx")
+    assert list(result['first_name']) == ["Ann", "Bob", "Cy"]
+    assert result['generated_email'].str.startswith("Hi there").all()
@@ -0,0 +1,44 @@
+"""
+Unit tests for backend/job_store.py against an in-memory Redis (fakeredis):
+    pytest test_job_store.py
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from job_store import ROW_CLAIM_TTL, JobStore  # noqa: E402
+
+
+@pytest.fixture
+def store():
+    return JobStore(fakeredis.FakeRedis())
+
+
+def test_claim_refuses_other_executions_of_the_same_task(store):
+    original, redelivered = "task-1:host-a:101:1", "task-1:host-b:202:1"
+    assert store.claim_step("job", 3, "email", original)
+    # Same task ID, different execution: the original still holds the step
+    assert not store.claim_step("job", 3, "email", redelivered)
+    assert store.claim_step("job", 3, "email", original)
+
+    claim = store.step_claim("job", 3, "email")
+    assert claim["owner"] == original
+    assert time.time() < claim["expires"] <= time.time() + ROW_CLAIM_TTL
+
+    store.release_claims("job", 3, ["email"], redelivered)  # not the owner: no-op
+    assert store.step_claim("job", 3, "email") is not None
+    store.release_claims("job", 3, ["email"], original)
+    assert store.step_claim("job", 3, "email") is None
+    assert store.claim_step("job", 3, "email", redelivered)
+
+
+def test_expired_claim_frees_the_step(store):
+    assert store.claim_step("job", 0, "initial", "task-1:a:1:1")
+    store.redis.delete("job_claim_job_0_initial")  # what the TTL does for a crashed worker
+    assert store.claim_step("job", 0, "initial", "task-1:b:2:1")
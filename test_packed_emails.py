@@ -0,0 +1,44 @@
+"""
+Unit tests for parse_packed_emails in backend/tasks.py (no Redis or API calls):
+    pytest test_packed_emails.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+for module in ('celery', 'pandas', 'redis', 'openai'):
+    pytest.importorskip(module)
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")  # the module-level client needs one; it is never called
+
+from tasks import parse_packed_emails  # noqa: E402
+
+
+def test_fenced_json_with_prose_around_it():
+    text = 'Here are the emails:\n```json\n[{"id": 0, "email": " Hi Ann "}, {"id": "1", "email": "Hi Bob"}]\n```\nDone.'
+    assert parse_packed_emails(text) == {0: "Hi Ann", 1: "Hi Bob"}
+
+
+def test_entries_without_a_usable_id_or_email_are_left_out():
+    text = ('[{"email": "no id"}, {"id": "x", "email": "bad id"}, {"id": 2, "email": "  "},'
+            ' {"id": 3}, "not an object", {"id": 4, "email": "kept"}]')
+    # Rows left out here get their own request in process_packed_emails
+    assert parse_packed_emails(text) == {4: "kept"}
+
+
+def test_duplicate_ids_keep_the_last_entry():
+    text = '[{"id": 1, "email": "first"}, {"id": 1, "email": "second"}]'
+    assert parse_packed_emails(text) == {1: "second"}
+
+
+@pytest.mark.parametrize("text", [
+    '{"id": 0, "email": "an object, not a list"}',
+    '[{"id": 0, "email": "cut off"',
+    'I cannot help with that.',
+    '',
+])
+def test_replies_without_a_json_list_parse_to_nothing(text):
+    assert parse_packed_emails(text) == {}
@@ -0,0 +1,44 @@
+"""
+Unit tests for backend/sanitize.py:
+    pytest test_sanitize.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+pd = pytest.importorskip('pandas')
+
+from sanitize import sanitize_columns, sanitize_text  # noqa: E402
+
+
+def test_sanitize_text_strips_control_characters():
+    assert sanitize_text('a\x00b\x0bc\x1fd\ufffe') == 'abcd'
+    assert sanitize_text('keeps\ttabs\nand\rnewlines') == 'keeps\ttabs\nand\rnewlines'
+    assert sanitize_text(3) == 3
+
+
+@pytest.mark.parametrize('dtype', [object, 'string', 'str'])
+def test_sanitize_columns_cleans_text_columns(dtype):
+    df = pd.DataFrame({'generated_email': pd.Series(['a\x00b', 'c\x0bd', None], dtype=dtype)})
+    sanitize_columns(df, ['generated_email'])
+    assert list(df['generated_email'][:2]) == ['ab', 'cd']
+    assert pd.isna(df['generated_email'][2])
+
+
+def test_sanitize_columns_cleans_default_text_dtype():
+    # pandas 3 builds text columns with its 'str' dtype, not object
+    df = pd.DataFrame({'generated_email': ['a\x00b', 'c\x0bd', float('nan')]})
+    sanitize_columns(df, ['generated_email'])
+    assert list(df['generated_email'][:2]) == ['ab', 'cd']
+    assert pd.isna(df['generated_email'][2])
+
+
+def test_sanitize_columns_leaves_non_strings_alone():
+    df = pd.DataFrame({'mixed': pd.Series(['x\x00', 7, None], dtype=object), 'count': [1, 2, 3]})
+    sanitize_columns(df, ['mixed', 'count', 'missing'])
+    assert list(df['mixed'][:2]) == ['x', 7]
+    assert df['mixed'][2] is None
+    assert list(df['count']) == [1, 2, 3]